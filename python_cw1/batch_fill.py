@@ -0,0 +1,186 @@
+""" Batch bucket fill from the command line
+
+Fills many image files across a pool of worker processes and writes each
+filled image to its own file. Jobs are read and handed out lazily, with only
+a few of them in flight at a time, so memory stays flat however many files
+the batch holds. The latency of every file and the throughput of the whole
+batch are reported as the files complete.
+
+Example:
+    python batch_fill.py data/*.txt --seed 0 0 --output-dir filled
+    python batch_fill.py --manifest jobs.txt --processes 4
+
+Each line of a manifest holds an image file, the row and column of its seed
+point and optionally the file to write the result to, separated by spaces.
+Blank lines and lines starting with # are skipped.
+"""
+
+import argparse
+import collections
+import multiprocessing
+import os
+import sys
+import time
+
+import bucket_fill
+import raster
+
+
+def read_manifest(filename, output_dir=None):
+    """ Read the jobs of a manifest file, one line at a time
+
+    Args:
+        filename (str) : path of the manifest
+        output_dir (str) : directory of the outputs not given in the manifest
+
+    Yields:
+        tuple[str, tuple[int, int], str] : image file, seed point and output file of each job
+
+    Raises:
+        ValueError if a line of the manifest is malformed
+    """
+    with open(filename) as manifest:
+        for line_number, line in enumerate(manifest, 1):
+            fields = line.split()
+            if(not fields or fields[0].startswith("#")):
+                continue
+            if(len(fields) not in (3, 4)):
+                raise ValueError(f"{filename}:{line_number}: expected 'image row col [output]'")
+            try:
+                seed_point = (int(fields[1]), int(fields[2]))
+            except ValueError:
+                raise ValueError(f"{filename}:{line_number}: seed point must be two integers")
+            output = fields[3] if len(fields) == 4 else output_path(fields[0], output_dir)
+            yield fields[0], seed_point, output
+
+
+def output_path(filename, output_dir=None):
+    """ Choose where to write the filled version of an image
+
+    Args:
+        filename (str) : path of the image
+        output_dir (str) : directory to write to. Defaults to next to the image,
+            with "_filled" added to its name.
+
+    Returns:
+        str : path of the output file
+    """
+    if(output_dir is not None):
+        return os.path.join(output_dir, os.path.basename(filename))
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}_filled{extension}"
+
+
+def fill_file(job):
+    """ Load, fill and write one image
+
+    Runs in a worker process. The image is loaded as a compact raster.Raster
+    and written back row by row, so a worker holds one byte per pixel.
+
+    Args:
+        job (tuple) : image file, seed point, output file, connectivity and
+            whether to write the human-friendly rendering instead of the digits
+
+    Returns:
+        dict : the image file, output file, number of pixels, seconds taken
+            and error message (None on success) of the job
+    """
+    filename, seed_point, output, connectivity, render = job
+    result = {"image": filename, "output": output, "pixels": 0, "seconds": 0.0, "error": None}
+    start = time.perf_counter()
+    try:
+        with raster.load_raster(filename) as image:
+            result["pixels"] = image.width * image.height
+            bucket_fill.fill(image, seed_point, connectivity)
+            if(render):
+                with open(output, "w") as outputfile:
+                    bucket_fill.write_image(image, outputfile)
+            else:
+                with open(output, "wb") as outputfile:
+                    for row in image:
+                        outputfile.write(raster._format_row(row))
+    except (OSError, ValueError) as error:
+        result["error"] = str(error)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(jobs, connectivity=4, render=False, processes=None):
+    """ Fill every job of a batch, across a pool of processes
+
+    Jobs are submitted as earlier ones complete, at most two per process
+    ahead, and results are yielded in the order of the jobs.
+
+    Args:
+        jobs (iterable[tuple]) : image file, seed point and output file of each job
+        connectivity (int) : 4 or 8. Defaults to 4.
+        render (bool) : write the human-friendly rendering instead of the digits. Defaults to False.
+        processes (int) : number of worker processes, 1 to fill in this process.
+            Defaults to the number of CPUs.
+
+    Yields:
+        dict : the result of each job, as returned by fill_file
+    """
+    bucket_fill._check_connectivity(connectivity)
+    tasks = ((filename, seed_point, output, connectivity, render) for filename, seed_point, output in jobs)
+    processes = processes or multiprocessing.cpu_count()
+    if(processes == 1):
+        for task in tasks:
+            yield fill_file(task)
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(pool.apply_async(fill_file, (task,)))
+            if(len(pending) >= 2 * processes):
+                yield pending.popleft().get()
+        while(pending):
+            yield pending.popleft().get()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill many image files across a pool of processes.")
+    parser.add_argument("images", nargs="*", help="image files, all filled from --seed")
+    parser.add_argument("--seed", nargs=2, type=int, metavar=("ROW", "COL"),
+                        help="seed point of the images given on the command line")
+    parser.add_argument("--manifest", help="file listing 'image row col [output]' jobs, one per line")
+    parser.add_argument("--output-dir", help="directory to write the filled images to, "
+                                             "instead of next to each image with a _filled suffix")
+    parser.add_argument("--connectivity", type=int, choices=(4, 8), default=4)
+    parser.add_argument("--processes", type=int, help="number of worker processes, defaults to the CPU count")
+    parser.add_argument("--render", action="store_true",
+                        help="write the human-friendly rendering instead of the 0/1/2 digits")
+    args = parser.parse_args(argv)
+    if(args.images and args.seed is None):
+        parser.error("--seed is required for images given on the command line")
+    if(not args.images and not args.manifest):
+        parser.error("give image files or a --manifest")
+    if(args.output_dir):
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    def jobs():
+        for filename in args.images:
+            yield filename, tuple(args.seed), output_path(filename, args.output_dir)
+        if(args.manifest):
+            yield from read_manifest(args.manifest, args.output_dir)
+
+    start = time.perf_counter()
+    files = pixels = failures = 0
+    for result in run_batch(jobs(), args.connectivity, args.render, args.processes):
+        files += 1
+        if(result["error"] is not None):
+            failures += 1
+            print(f"{result['image']}: failed: {result['error']}", file=sys.stderr)
+            continue
+        pixels += result["pixels"]
+        print(f"{result['seconds'] * 1000:10.1f} ms {result['pixels']:>12} px  "
+              f"{result['image']} -> {result['output']}")
+    seconds = time.perf_counter() - start
+    print(f"{files} files ({failures} failed), {pixels} pixels in {seconds:.3f} s: "
+          f"{files / seconds:.1f} files/s, {pixels / seconds:.0f} pixels/s", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,358 @@
+""" Benchmark suite for bucket fill
+
+Generates synthetic images of several shapes and sizes, times load_image,
+fill and stringify_image on each of them and reports the throughput (pixels
+per second) and peak memory of every phase as JSON, so that runs can be
+compared with each other.
+
+Example:
+    python benchmark.py --sizes 1e2 1e4 1e6 --output before.json
+    python benchmark.py --sizes 1e2 1e4 1e6 --compare before.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bucket_fill
+import raster
+
+SHAPES = ("open", "snake", "spiral", "maze")
+PHASES = ("load_image", "fill", "stringify_image")
+
+
+def open_rows(side, rng):
+    """ Rows of an open field with no boundaries at all
+
+    Args:
+        side (int) : width and height of the image
+        rng (random.Random) : random generator (unused, for a uniform signature)
+
+    Yields:
+        bytes : the pixels of each row
+    """
+    row = bytes(side)
+    for _ in range(side):
+        yield row
+
+
+def snake_rows(side, rng):
+    """ Rows of a single corridor winding from top to bottom, like data/snake.txt but regular
+
+    Every other row is a wall with a gap at alternating ends.
+
+    Args:
+        side (int) : width and height of the image
+        rng (random.Random) : random generator (unused, for a uniform signature)
+
+    Yields:
+        bytes : the pixels of each row
+    """
+    corridor = bytes(side)
+    gap_right = b"\x01" * (side - 1) + b"\x00"
+    gap_left = b"\x00" + b"\x01" * (side - 1)
+    for row in range(side):
+        if(row % 2 == 0):
+            yield corridor
+        else:
+            yield gap_right if (row // 2) % 2 == 0 else gap_left
+
+
+def spiral_rows(side, rng):
+    """ Rows of a square spiral corridor winding into the centre of the image
+
+    Args:
+        side (int) : width and height of the image
+        rng (random.Random) : random generator (unused, for a uniform signature)
+
+    Yields:
+        bytes : the pixels of each row
+    """
+    pixels = bytearray(side * side)
+    # Walk the wall like a turtle: right, down, left, up with shrinking sides.
+    directions = ((0, 1), (1, 0), (0, -1), (-1, 0))
+    lengths = [side - 1, side - 1, side - 1]
+    length = side - 3
+    while(length > 0):
+        lengths += [length, length]
+        length -= 2
+    row, col = 0, 0
+    pixels[0] = 1
+    for turn, length in enumerate(lengths):
+        row_step, col_step = directions[turn % 4]
+        start = row * side + col
+        step = row_step * side + col_step
+        end_row, end_col = row + row_step * length, col + col_step * length
+        end = end_row * side + end_col
+        # Horizontal sides are slices, vertical sides are strided slices.
+        if(step > 0):
+            pixels[start:end + 1:step] = b"\x01" * (length + 1)
+        else:
+            pixels[end:start + 1:-step] = b"\x01" * (length + 1)
+        row, col = end_row, end_col
+    for row in range(side):
+        yield bytes(pixels[row * side:(row + 1) * side])
+
+
+def maze_rows(side, rng):
+    """ Rows of a random perfect maze, generated one row at a time
+
+    Uses the binary tree algorithm: cells sit on odd rows and columns, and
+    each cell opens the wall to its north or to its west at random.
+
+    Args:
+        side (int) : width and height of the image
+        rng (random.Random) : random generator choosing the openings
+
+    Yields:
+        bytes : the pixels of each row
+    """
+    cells = max((side - 1) // 2, 0)
+    # Each random byte becomes 1 to open north, 0 to open west.
+    choice_table = bytes(value & 1 for value in range(256))
+    flip_table = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+    wall = b"\x01" * side
+    above = bytearray(wall)
+    for cell_row in range(cells):
+        if(cell_row == 0):
+            # The top row can only open west.
+            choices = bytearray(cells)
+        else:
+            choices = bytearray(rng.randbytes(cells).translate(choice_table))
+        if(cells):
+            # The left column can only open north, except for the top left cell.
+            choices[0] = 0 if cell_row == 0 else 1
+        row = bytearray(wall)
+        row[1:2 * cells:2] = bytes(cells)
+        # The wall west of each cell is open (0) when the cell opens west.
+        row[0:2 * cells:2] = choices
+        if(cells):
+            row[0] = 1
+        above[1:2 * cells:2] = bytes(choices).translate(flip_table)
+        yield bytes(above)
+        yield bytes(row)
+        above = bytearray(wall)
+    for _ in range(side - 2 * cells):
+        yield wall
+
+
+GENERATORS = {
+    "open": open_rows,
+    "snake": snake_rows,
+    "spiral": spiral_rows,
+    "maze": maze_rows,
+}
+
+
+def write_shape(filename, shape, side, seed=0):
+    """ Write a synthetic image in the text format read by load_image
+
+    Args:
+        filename (str) : path of the file to write
+        shape (str) : one of SHAPES
+        side (int) : width and height of the image
+        seed (int) : seed of the random generator. Defaults to 0.
+    """
+    rng = random.Random(seed)
+    with open(filename, "wb") as imagefile:
+        for row in GENERATORS[shape](side, rng):
+            imagefile.write(raster._format_row(row))
+
+
+def first_unfilled(image):
+    """ Find an unfilled pixel to use as the seed point, scanning from the top left
+
+    Args:
+        image (list or raster.Raster) : a 2D representation of an image
+
+    Returns:
+        tuple[int, int] : (row, col) of the first unfilled pixel, or (0, 0) if there is none
+    """
+    for row, pixels in enumerate(image):
+        col = bytes(pixels).find(b"\x00")
+        if(col >= 0):
+            return (row, col)
+    return (0, 0)
+
+
+def copy_image(image):
+    """ Copy an image so that every fill starts from the same pixels
+
+    Args:
+        image (list or raster.Raster) : a 2D representation of an image
+
+    Returns:
+        list or raster.Raster : an independent copy
+    """
+    if(isinstance(image, raster.Raster)):
+        return raster.Raster(bytearray(image.view[image.offset:image.offset + image.width * image.height]),
+                             image.width, image.height)
+    return [row[:] for row in image]
+
+
+def measure(function, repeat, prepare=None):
+    """ Time a function and measure its peak memory
+
+    The timing runs are done without tracemalloc, which would slow them down,
+    and the memory is measured in one extra run.
+
+    Args:
+        function (callable) : the code to measure
+        repeat (int) : number of timing runs, the best one is kept
+        prepare (callable) : called before each run, untimed, to build the
+            tuple of arguments passed to function. Defaults to no arguments.
+
+    Returns:
+        tuple[float, int] : best time in seconds and peak traced memory in bytes
+    """
+    best = math.inf
+    for _ in range(repeat):
+        arguments = prepare() if prepare is not None else ()
+        start = time.perf_counter()
+        function(*arguments)
+        best = min(best, time.perf_counter() - start)
+    arguments = prepare() if prepare is not None else ()
+    tracemalloc.start()
+    try:
+        function(*arguments)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run_benchmark(shapes=SHAPES, sizes=(100, 10000, 1000000), connectivities=(4,),
+                  repeat=3, use_raster=False, directory=None):
+    """ Run every combination of shape, size and connectivity
+
+    Args:
+        shapes (iterable[str]) : shapes of the generated images
+        sizes (iterable[int]) : approximate number of pixels of the generated images
+        connectivities (iterable[int]) : connectivities to fill with
+        repeat (int) : number of timing runs per phase, the best one is kept
+        use_raster (bool) : load images with raster.load_raster instead of load_image
+        directory (str) : where to write the generated images. Defaults to a temporary directory.
+
+    Returns:
+        list[dict] : one result per shape, size, connectivity and phase
+    """
+    results = []
+    with tempfile.TemporaryDirectory(dir=directory) as workdir:
+        for shape in shapes:
+            for size in sizes:
+                side = max(math.isqrt(int(size)), 1)
+                pixels = side * side
+                filename = os.path.join(workdir, f"{shape}_{side}.txt")
+                write_shape(filename, shape, side)
+                loader = raster.load_raster if use_raster else bucket_fill.load_image
+
+                def load():
+                    return loader(filename)
+
+                image = load()
+                seed_point = first_unfilled(image)
+                for connectivity in connectivities:
+                    def fill(image_copy):
+                        bucket_fill.fill(image_copy, seed_point, connectivity)
+
+                    def stringify():
+                        bucket_fill.stringify_image(image)
+
+                    for phase, function in zip(PHASES, (load, fill, stringify)):
+                        # Loading and rendering do not depend on the connectivity.
+                        if(phase != "fill" and connectivity != connectivities[0]):
+                            continue
+                        prepare = (lambda: (copy_image(image),)) if phase == "fill" else None
+                        seconds, peak = measure(function, repeat, prepare)
+                        results.append({
+                            "shape": shape,
+                            "pixels": pixels,
+                            "width": side,
+                            "height": side,
+                            "connectivity": connectivity if phase == "fill" else None,
+                            "phase": phase,
+                            "seconds": seconds,
+                            "pixels_per_second": pixels / seconds if seconds > 0 else None,
+                            "peak_bytes": peak,
+                        })
+                        label = f"fill ({connectivity})" if phase == "fill" else phase
+                        print(f"{shape:>6} {pixels:>10} px  {label:<15} "
+                              f"{seconds:9.4f} s  {peak / 2**20:9.1f} MiB", file=sys.stderr)
+                if(isinstance(image, raster.Raster)):
+                    image.close()
+    return results
+
+
+def compare(results, baseline):
+    """ Compare results with those of an earlier run
+
+    Args:
+        results (list[dict]) : results of this run
+        baseline (list[dict]) : results of the earlier run
+
+    Returns:
+        list[dict] : for every result also found in the baseline, its key and
+            the ratio of the baseline time to this run's time (above 1 is faster)
+    """
+    def key(result):
+        return (result["shape"], result["pixels"], result["connectivity"], result["phase"])
+
+    baseline_by_key = {key(result): result for result in baseline}
+    comparison = []
+    for result in results:
+        previous = baseline_by_key.get(key(result))
+        if(previous is None or not result["seconds"]):
+            continue
+        comparison.append({
+            "shape": result["shape"],
+            "pixels": result["pixels"],
+            "connectivity": result["connectivity"],
+            "phase": result["phase"],
+            "speedup": previous["seconds"] / result["seconds"],
+            "peak_ratio": result["peak_bytes"] / previous["peak_bytes"] if previous["peak_bytes"] else None,
+        })
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark load_image, fill and stringify_image.")
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1e2, 1e4, 1e6],
+                        help="approximate number of pixels of each image (from 1e2 up to 1e8)")
+    parser.add_argument("--connectivity", nargs="+", type=int, choices=(4, 8), default=[4])
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per phase, the best is kept")
+    parser.add_argument("--raster", action="store_true", help="load images with raster.load_raster")
+    parser.add_argument("--output", help="file to write the JSON report to, instead of stdout")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.shapes, [int(size) for size in args.sizes], args.connectivity,
+                            args.repeat, args.raster)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "loader": "load_raster" if args.raster else "load_image",
+        "results": results,
+    }
+    if(args.compare):
+        with open(args.compare) as baselinefile:
+            report["comparison"] = compare(results, json.load(baselinefile)["results"])
+
+    if(args.output):
+        with open(args.output, "w") as outputfile:
+            json.dump(report, outputfile, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,101 @@
 """ Coursework 1: Bucket Fill
 """
 
-def load_image(filename):
+import bisect
+import functools
+import re
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from scipy import ndimage
+except ImportError:
+    ndimage = None
+
+
+class Profile:
+    """ Timings and traversal counters of load_image, fill and stringify_image calls.
+
+    Pass a Profile as the profile keyword argument of those functions to
+    record what they spend: the seconds and number of calls of each phase,
+    and for fills walking the image span by span (nested lists, rasters),
+    the number of spans filled, pixels visited and the largest number of
+    seeds waiting on the stack. Without a profile nothing is recorded.
+    """
+
+    def __init__(self, callback=None):
+        """
+        Args:
+            callback (callable) : if given, called with the phase name, its
+                seconds and the profile at the end of every profiled call
+        """
+        self.callback = callback
+        self.seconds = {}
+        self.calls = {}
+        self.pixels_visited = 0
+        self.span_count = 0
+        self.max_stack = 0
+
+    def add_phase(self, phase, seconds):
+        """ Record one call of a phase
+
+        Args:
+            phase (str) : name of the function called
+            seconds (float) : time taken by the call
+        """
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        if(self.callback is not None):
+            self.callback(phase, seconds, self)
+
+    def count_span(self, length, stack_size):
+        """ Record a filled span
+
+        Args:
+            length (int) : number of pixels of the span
+            stack_size (int) : number of seeds on the stack once the span's neighbours are pushed
+        """
+        self.span_count += 1
+        self.pixels_visited += length
+        if(stack_size > self.max_stack):
+            self.max_stack = stack_size
+
+    def __repr__(self):
+        phases = ", ".join(f"{phase}={seconds:.6f}s" for phase, seconds in self.seconds.items())
+        return (f"Profile({phases}, pixels_visited={self.pixels_visited}, "
+                f"span_count={self.span_count}, max_stack={self.max_stack})")
+
+
+def _profiled(function):
+    """ Time the calls of a function taking a profile keyword argument
+
+    Calls without a profile go straight to the function.
+
+    Args:
+        function (callable) : the function to time, its name names the phase
+
+    Returns:
+        callable : the wrapped function
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        profile = kwargs.get("profile")
+        if(profile is None):
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.add_phase(function.__name__, time.perf_counter() - start)
+    return wrapper
+
+
+@_profiled
+def load_image(filename, *, profile=None):
     """ Load image from file made of 0 (unfilled pixels) and 1 (boundary pixels) and 2 (filled pixel)
 
     Example of content of filename:
@@ -19,6 +113,7 @@ def load_image(filename):
 
     Args:
         filename (str) : path to file containing the image representation
+        profile (Profile) : if given, records the time taken. Defaults to None.
 
     Returns:
         list : a 2D representation of the filled image, where
@@ -36,11 +131,33 @@ def load_image(filename):
     return image
 
 
-def stringify_image(image):
+# Row and column offsets of the neighbours of a pixel, for each connectivity.
+NEIGHBOUR_OFFSETS = {
+    4: ((-1, 0), (1, 0), (0, -1), (0, 1)),
+    8: ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+}
+
+
+# The variable "PIXEL_MAPPING" defines how to display each type of pixel.
+PIXEL_MAPPING = {
+    0: " ",
+    1: "*",
+    2: "0"
+}
+# Byte translation table equivalent to PIXEL_MAPPING, used to render whole rows at once.
+RENDER_TABLE = bytes(ord(PIXEL_MAPPING.get(value, "?")) for value in range(256))
+
+
+@_profiled
+def stringify_image(image, *, profile=None):
     """ Convert image representation into a human-friendly string representation
 
+    Each row is rendered with a single translate call and the lines are
+    joined once, see write_image to render straight to a file instead.
+
     Args:
         image (list) : list of lists of 0 (unfilled pixel), 1 (boundary pixel) and 2 (filled pixel)
+        profile (Profile) : if given, records the time taken. Defaults to None.
 
     Returns:
         str : a human-friendly string representation of the image
@@ -49,26 +166,118 @@ def stringify_image(image):
     if image is None:
         return ""
 
-    # The variable "mapping" defines how to display each type of pixel.
-    mapping = {
-        0: " ",
-        1: "*",
-        2: "0"
-    }
+    return "".join(_iter_image_lines(image))
+
+
+def write_image(image, fp):
+    """ Write the human-friendly representation of an image to a file, row by row
+
+    Produces the same text as stringify_image without ever holding more than
+    one rendered row in memory.
+
+    Args:
+        image (list) : list of lists of 0 (unfilled pixel), 1 (boundary pixel) and 2 (filled pixel)
+        fp (file) : text file (or any object with a write method) to write to
+    """
+    if image is None:
+        return
+    for line in _iter_image_lines(image):
+        fp.write(line)
+
+
+def _iter_image_lines(image):
+    """ Render an image line by line
+
+    Args:
+        image (list) : list of lists of 0 (unfilled pixel), 1 (boundary pixel) and 2 (filled pixel)
 
-    image_str = ""
-    if image:
-        image_str += "+ " + "- " * len(image[0]) + "+\n"
+    Yields:
+        str : each line of the human-friendly representation, including its newline
+    """
+    # Arrays other than uint8 are rendered through their nested list form.
+    if(np is not None and isinstance(image, np.ndarray) and image.dtype != np.uint8):
+        image = array_to_image(image)
+
+    if(len(image) == 0):
+        return
+
+    border = "+ " + "- " * len(image[0]) + "+\n"
+    yield border
     for row in image:
-        image_str += "| "
-        for pixel in row:
-            image_str += mapping.get(pixel, "?") + " "
-        image_str += "|"
-        image_str += "\n"
-    if image:
-        image_str += "+ " + "- " * len(image[0]) + "+\n"
+        yield _render_row(row)
+    yield border
+
+
+def _render_row(row):
+    """ Render one row of an image, with its side borders and newline
+
+    Args:
+        row (list) : the pixels of the row
+
+    Returns:
+        str : the rendered line
+    """
+    try:
+        pixels = bytes(row)
+    except (ValueError, TypeError):
+        # Values that do not fit in a byte are looked up one by one.
+        return "| " + "".join(PIXEL_MAPPING.get(pixel, "?") + " " for pixel in row) + "|\n"
+    # Interleave the displayed characters with spaces.
+    line = bytearray(b" " * (2 * len(pixels)))
+    line[0::2] = pixels.translate(RENDER_TABLE)
+    return "| " + line.decode("ascii") + "|\n"
 
-    return image_str
+
+def preview_image(image, max_width=80, max_height=40):
+    """ Downsample an image so that it can be displayed in a terminal
+
+    Each pixel of the preview stands for a block of pixels of the image. A
+    block holding a boundary pixel is shown as a boundary, otherwise a block
+    holding a filled pixel is shown as filled, so thin boundaries and small
+    filled areas stay visible.
+
+    Args:
+        image (list) : list of lists of 0 (unfilled pixel), 1 (boundary pixel) and 2 (filled pixel)
+        max_width (int) : maximum number of columns of the preview. Defaults to 80.
+        max_height (int) : maximum number of rows of the preview. Defaults to 40.
+
+    Returns:
+        list : the preview, a nested list image that can be passed to show_image
+    """
+    if(image is None or len(image) == 0):
+        return []
+
+    image_height = len(image)
+    image_width = len(image[0])
+    row_step = max(1, -(-image_height // max_height))
+    col_step = max(1, -(-image_width // max_width))
+
+    preview = []
+    for first_row in range(0, image_height, row_step):
+        # Gather the distinct values found in each block of this band of rows.
+        block_values = [set() for _ in range(0, image_width, col_step)]
+        for row in range(first_row, min(first_row + row_step, image_height)):
+            pixels = image[row]
+            for block, first_col in enumerate(range(0, image_width, col_step)):
+                block_values[block].update(pixels[first_col:first_col + col_step])
+        preview.append([_preview_pixel(values) for values in block_values])
+    return preview
+
+
+def _preview_pixel(values):
+    """ Choose the value displayed for a block of pixels
+
+    Args:
+        values (set[int]) : distinct values of the pixels of the block
+
+    Returns:
+        int : 1 if the block holds a boundary, else 2 if it holds a filled pixel,
+            else 0 if it holds an unfilled pixel, else its smallest value
+    """
+    for value in (1, 2, 0):
+        if(value in values):
+            return int(value)
+    return int(min(values))
 
 
 def show_image(image):
@@ -81,7 +290,9 @@ def show_image(image):
 
 
 
-def fill(image, seed_point):
+@_profiled
+def fill(image, seed_point, connectivity=4, target=0, replacement=2, boundary=(1,), stats=None, *,
+         profile=None):
     """ Fill the image from seed point to boundary
 
     the image should remain unchanged if:
@@ -89,12 +300,34 @@ def fill(image, seed_point):
     - the seed_point is on a boundary pixel
     - the seed_point is outside of the image
 
+    The image may also be a NumPy array (see image_to_array), a compact
+    raster.Raster or a run-length encoded rle_image.RLEImage, all of which
+    are filled in place.
+
+    By default only unfilled pixels (0) are filled, and the fill spreads to the
+    4 direct neighbours of each pixel. The remaining arguments change which
+    pixels are filled: every pixel equal to target (or, if target is None,
+    every pixel whose value is not in boundary) that is connected to the seed
+    point is set to replacement.
+
     Args:
         image (list) : a 2D nested list representation of an image, where
                        0 represents an unfilled pixel, and
                        1 represents a boundary pixel
         seed_point (tuple) : a 2-element tuple representing the (row, col)
                        coordinates of the seed point to start filling
+        connectivity (int) : 4 to spread to direct neighbours only, 8 to also
+                       spread to diagonal neighbours. Defaults to 4.
+        target (int) : value of the pixels to fill, or None to fill every pixel
+                       that is not a boundary. Defaults to 0.
+        replacement (int) : value written to the filled pixels. Defaults to 2.
+        boundary (iterable[int]) : values of the boundary pixels, which are
+                       never filled. Defaults to (1,).
+        stats (RegionStats) : if given, filled in with the size and shape of
+                       the filled region, gathered during the fill itself.
+                       Defaults to None.
+        profile (Profile) : if given, records the time taken and the
+                       traversal counters. Defaults to None.
 
     Returns:
         list : a 2D representation of the filled image, where
@@ -102,6 +335,17 @@ def fill(image, seed_point):
                1 represents a boundary pixel, and
                2 represents a filled pixel
     """
+    _check_connectivity(connectivity)
+    matcher = _pixel_matcher(target, replacement, boundary)
+
+    # NumPy arrays are filled in bulk rather than one span at a time.
+    if(np is not None and isinstance(image, np.ndarray)):
+        return _fill_array(image, seed_point, connectivity, matcher, replacement, stats)
+
+    # Run-length encoded images fill whole runs at a time.
+    if(hasattr(image, "fill_runs")):
+        return image.fill_runs(seed_point, connectivity, matcher, replacement, stats)
+
     # Check if the image is empty.
     if(not image):
         return image
@@ -121,25 +365,896 @@ def fill(image, seed_point):
     if(row >= image_height or row < 0 or col >= image_width or col < 0):
         return image
 
-    # Check if the seed point lies on a boundary (i.e equal to 1).
-    if(image[row][col] == 1):
+    # Only fillable pixels are flooded, so a seed point on a boundary (or on
+    # an already filled pixel) leaves the image unchanged.
+    if(matcher is not None and image[row][col] == matcher):
+        _scanline_fill(image, row, col, matcher, replacement, connectivity, stats, profile)
+
+    return image
+
+
+def fill_with_stats(image, seed_point, **options):
+    """ Fill the image from seed point to boundary and describe the filled region
+
+    Takes the same arguments as fill, and saves a second pass over the
+    image to measure the region afterwards.
+
+    Args:
+        image (list) : a 2D representation of an image, filled in place
+        seed_point (tuple) : (row, col) coordinates of the seed point
+        **options : connectivity, target, replacement and boundary, as for fill
+
+    Returns:
+        RegionStats : statistics of the filled region, empty if nothing was filled
+    """
+    stats = RegionStats()
+    fill(image, seed_point, stats=stats, **options)
+    return stats
+
+
+class RegionStats:
+    """ Size and shape of a filled region, gathered while filling it.
+
+    The perimeter is the number of pixel sides separating the region from
+    the rest of the image, counting the sides lying on the image border.
+    """
+
+    def __init__(self):
+        self.pixel_count = 0
+        self.min_row = None
+        self.min_col = None
+        self.max_row = None
+        self.max_col = None
+        self.perimeter = 0
+        self.touches_edge = False
+
+    @property
+    def bounding_box(self):
+        """ tuple[int, int, int, int] : (min_row, min_col, max_row, max_col) of
+            the region, all inclusive, or None if the region is empty. """
+        if(self.pixel_count == 0):
+            return None
+        return (self.min_row, self.min_col, self.max_row, self.max_col)
+
+    def add_span(self, row, left, right, image_height, image_width):
+        """ Account for a filled horizontal span of pixels
+
+        The span adds four sides per pixel to the perimeter, minus the two
+        shared by each pair of neighbouring pixels within it. Sides shared
+        with the rows above and below are removed with remove_shared_sides.
+
+        Args:
+            row (int) : row of the span
+            left (int) : first column of the span
+            right (int) : last column of the span
+            image_height (int) : number of rows of the image
+            image_width (int) : number of columns of the image
+        """
+        length = right - left + 1
+        if(self.pixel_count == 0):
+            self.min_row = self.max_row = row
+            self.min_col, self.max_col = left, right
+        else:
+            self.min_row = min(self.min_row, row)
+            self.max_row = max(self.max_row, row)
+            self.min_col = min(self.min_col, left)
+            self.max_col = max(self.max_col, right)
+        self.pixel_count += length
+        self.perimeter += 2 * length + 2
+        if(row == 0 or row == image_height - 1 or left == 0 or right == image_width - 1):
+            self.touches_edge = True
+
+    def remove_shared_sides(self, count):
+        """ Remove from the perimeter the sides shared with pixels of a neighbouring row
+
+        Args:
+            count (int) : number of vertically neighbouring pixel pairs of the region
+        """
+        self.perimeter -= 2 * count
+
+    def __repr__(self):
+        return (f"RegionStats(pixels={self.pixel_count}, bounding_box={self.bounding_box}, "
+                f"perimeter={self.perimeter}, touches_edge={self.touches_edge})")
+
+
+def fill_mask(image, seed_point, connectivity=4, target=0, replacement=2, boundary=(1,)):
+    """ Find the region fill would fill, without changing the image
+
+    Follows the same rules as fill, but records the region in a FillMask of
+    one bit per pixel instead of writing to the image, so callers that need
+    the original image no longer have to copy it. Use apply_mask to fill
+    the image from the mask afterwards.
+
+    Args:
+        image (list) : a 2D representation of an image, left unchanged
+        seed_point (tuple) : a 2-element tuple representing the (row, col)
+                       coordinates of the seed point to start filling
+        connectivity, target, replacement, boundary : as for fill
+
+    Returns:
+        FillMask : the pixels of the region, empty if nothing would be filled
+    """
+    _check_connectivity(connectivity)
+    matcher = _pixel_matcher(target, replacement, boundary)
+
+    # The region of NumPy arrays is found as a boolean array and packed into bits.
+    if(np is not None and isinstance(image, np.ndarray)):
+        image_height, image_width = image.shape
+        mask = FillMask(image_width, image_height)
+        if(image.size == 0 or matcher is None or not _is_valid_seed(image_height, image_width, seed_point)):
+            return mask
+        fillable = _fillable_mask(image, matcher)
+        if(fillable[seed_point[0], seed_point[1]]):
+            region = _components_mask(fillable, [seed_point], connectivity)
+            mask.bits[:] = np.packbits(region, axis=1).tobytes()
+        return mask
+
+    image_height = len(image)
+    image_width = len(image[0]) if image_height else 0
+    mask = FillMask(image_width, image_height)
+    if(image_height == 0 or matcher is None or not _is_valid_seed(image_height, image_width, seed_point)):
+        return mask
+    row, col = seed_point[0], seed_point[1]
+    if(image[row][col] == matcher):
+        _scanline_mask(image, row, col, matcher, connectivity, mask)
+    return mask
+
+
+def apply_mask(image, mask, replacement=2):
+    """ Write replacement to every pixel of an image set in a mask
+
+    Args:
+        image (list) : a 2D representation of an image of the mask's size, changed in place
+        mask (FillMask) : the pixels to write, as returned by fill_mask
+        replacement (int) : value written to the pixels. Defaults to 2.
+
+    Returns:
+        list : the same image
+    """
+    if(np is not None and isinstance(image, np.ndarray)):
+        image[mask.to_array()] = replacement
         return image
+    if(not image):
+        return image
+    span_value = _span_value(image, replacement)
+    for row, start, end in mask.spans():
+        image[row][start:end] = span_value * (end - start)
+    return image
 
-    # Check that the current point is a zero to avoid infinite loop.
-    if(image[row][col] == 0):
-        image[row][col] = 2 # Fill point.
 
-        image = fill(image, (row-1,col)) # Repeat for point to the left.
+class FillMask:
+    """ The pixels of a region of an image, stored as one bit per pixel.
 
-        image = fill(image, (row+1,col)) # Repeat for point to the right.
+    Each row takes (width + 7) // 8 bytes, most significant bit first, like
+    numpy.packbits. Use `point in mask` to test a pixel and spans() to list
+    the region as horizontal runs.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.row_size = (width + 7) // 8
+        self.bits = bytearray(self.row_size * height)
+
+    def __contains__(self, point):
+        row, col = point
+        if(not(0 <= row < self.height and 0 <= col < self.width)):
+            return False
+        return bool(self.bits[row * self.row_size + (col >> 3)] & (0x80 >> (col & 7)))
+
+    def __len__(self):
+        return bin(int.from_bytes(self.bits, "big")).count("1")
+
+    def add_span(self, row, left, right):
+        """ Set the bits of a horizontal span of pixels
+
+        Args:
+            row (int) : row of the span
+            left (int) : first column of the span
+            right (int) : last column of the span
+        """
+        base = row * self.row_size
+        first_byte, last_byte = left >> 3, right >> 3
+        first_bits = 0xFF >> (left & 7)
+        last_bits = (0xFF00 >> ((right & 7) + 1)) & 0xFF
+        if(first_byte == last_byte):
+            self.bits[base + first_byte] |= first_bits & last_bits
+            return
+        self.bits[base + first_byte] |= first_bits
+        self.bits[base + first_byte + 1:base + last_byte] = b"\xff" * (last_byte - first_byte - 1)
+        self.bits[base + last_byte] |= last_bits
+
+    def spans(self):
+        """ List the region as horizontal runs of pixels
+
+        Yields:
+            tuple[int, int, int] : the row, first column and column just past the end of each run
+        """
+        row_width = 8 * self.row_size
+        for row in range(self.height):
+            value = int.from_bytes(self.bits[row * self.row_size:(row + 1) * self.row_size], "big")
+            if(value == 0):
+                continue
+            for match in re.finditer("1+", format(value, f"0{row_width}b")):
+                yield row, match.start(), match.end()
+
+    def to_array(self):
+        """ Unpack the mask into a NumPy boolean array
+
+        Returns:
+            numpy.ndarray : a 2D boolean array of shape (height, width)
+        """
+        packed = np.frombuffer(bytes(self.bits), dtype=np.uint8).reshape(self.height, self.row_size)
+        return np.unpackbits(packed, axis=1, count=self.width).astype(bool)
+
+
+def _check_connectivity(connectivity):
+    """ Check that a fill connectivity is supported
+
+    Args:
+        connectivity (int) : number of neighbours a pixel is connected to
+
+    Raises:
+        ValueError if connectivity is neither 4 nor 8
+    """
+    if(connectivity not in (4, 8)):
+        raise ValueError(f"Connectivity must be 4 or 8, not {connectivity}")
+
+
+class _OutsideOf:
+    """ Pixel matcher comparing equal to every value outside a set of blocked values
+
+    Used in place of a single target value, so the fill engines can keep
+    comparing pixels with == on their default path.
+    """
+
+    def __init__(self, blocked):
+        self.blocked = frozenset(blocked)
+
+    def __eq__(self, pixel):
+        return pixel not in self.blocked
+
+    def __ne__(self, pixel):
+        return pixel in self.blocked
+
+    __hash__ = None
+
+
+def _pixel_matcher(target, replacement, boundary):
+    """ Build the value that fillable pixels compare equal to
+
+    Args:
+        target (int) : value of the pixels to fill, or None for any non-boundary pixel
+        replacement (int) : value written to the filled pixels
+        boundary (iterable[int]) : values of the boundary pixels
+
+    Returns:
+        int or _OutsideOf : target itself, or a matcher for every pixel that is
+            neither a boundary nor already filled. None if no pixel can be filled.
+    """
+    boundary = frozenset(boundary)
+    if(target is None):
+        return _OutsideOf(boundary | {replacement})
+    if(target in boundary or target == replacement):
+        return None
+    return target
+
+
+def _scanline_fill(image, row, col, target, replacement, connectivity=4, stats=None, profile=None):
+    """ Iteratively replace the span-connected region of target pixels containing (row, col)
+
+    Rather than recursing once per pixel, each seed popped from the stack is
+    extended left and right into a horizontal span which is filled in one go.
+    The rows directly above and below that span are then scanned and a single
+    seed is pushed for every run of target pixels found, so the work done is
+    linear in the number of pixels and the stack only ever holds span seeds.
+    With 8-connectivity the neighbouring rows are scanned one pixel further on
+    each side, which is all it takes to reach the diagonal neighbours.
+
+    Args:
+        image (list or raster.Raster) : a 2D representation of an image, indexable by row then column
+        row (int) : row of a seed pixel, which must be equal to target
+        col (int) : column of a seed pixel, which must be equal to target
+        target (int or _OutsideOf) : value the pixels to be replaced compare equal to
+        replacement (int) : value written to the filled pixels, must not be equal to target
+        connectivity (int) : 4 or 8. Defaults to 4.
+        stats (RegionStats) : statistics updated with every filled span. Defaults to None.
+        profile (Profile) : counters updated with every filled span. Defaults to None.
+    """
+    image_width = len(image[0])
+    image_height = len(image)
+    span_value = _span_value(image, replacement)
+    reach = 1 if connectivity == 8 else 0
+    stack = [(row, col)]
+    while(stack):
+        row, col = stack.pop()
+        pixels = image[row]
+        # The pixel may have been filled by another span since it was pushed.
+        if(pixels[col] != target):
+            continue
+        # Extend the span to the left and right up to the boundaries.
+        left = col
+        while(left > 0 and pixels[left - 1] == target):
+            left -= 1
+        right = col
+        while(right < image_width - 1 and pixels[right + 1] == target):
+            right += 1
+        # Fill the whole span at once.
+        pixels[left:right + 1] = span_value * (right - left + 1)
+        if(stats is not None):
+            stats.add_span(row, left, right, image_height, image_width)
+        # Columns of the neighbouring rows to scan, wider only with 8-connectivity.
+        if(reach):
+            first_col, last_col = max(left - 1, 0), min(right + 1, image_width - 1)
+        else:
+            first_col, last_col = left, right
+        # Push one seed per run of target pixels in the neighbouring rows.
+        for neighbour_row in (row - 1, row + 1):
+            if(neighbour_row < 0 or neighbour_row >= image_height):
+                continue
+            neighbour_pixels = image[neighbour_row]
+            if(stats is not None):
+                # Target pixels touching the span will be filled later, by a span
+                # which then sees this one as already filled, so each pair is counted once.
+                stats.remove_shared_sides(_count_matching(neighbour_pixels[left:right + 1], target))
+            if(profile is not None):
+                profile.pixels_visited += last_col - first_col + 1
+            in_run = False
+            for neighbour_col in range(first_col, last_col + 1):
+                if(neighbour_pixels[neighbour_col] == target):
+                    if(not in_run):
+                        stack.append((neighbour_row, neighbour_col))
+                        in_run = True
+                else:
+                    in_run = False
+        if(profile is not None):
+            profile.count_span(right - left + 1, len(stack))
 
-        image = fill(image, (row,col+1)) # Repeat for the point above.
 
-        image = fill(image, (row,col-1)) # Repeat for the point below.
+def _scanline_mask(image, row, col, target, connectivity, mask):
+    """ Record in a mask the span-connected region of target pixels containing (row, col)
 
+    The same traversal as _scanline_fill, except that visited spans are set
+    in the mask rather than overwritten in the image. Each span is a whole run
+    of target pixels, so checking the first pixel of a run is enough to know
+    whether it was visited.
+
+    Args:
+        image (list or raster.Raster) : a 2D representation of an image, left unchanged
+        row (int) : row of a seed pixel, which must be equal to target
+        col (int) : column of a seed pixel, which must be equal to target
+        target (int or _OutsideOf) : value the pixels of the region compare equal to
+        connectivity (int) : 4 or 8
+        mask (FillMask) : mask of the image's size, updated with every span
+    """
+    image_width = len(image[0])
+    image_height = len(image)
+    reach = 1 if connectivity == 8 else 0
+    bits = mask.bits
+    row_size = mask.row_size
+    stack = [(row, col)]
+    while(stack):
+        row, col = stack.pop()
+        # The run may have been visited from another span since it was pushed.
+        if(bits[row * row_size + (col >> 3)] & (0x80 >> (col & 7))):
+            continue
+        pixels = image[row]
+        # Extend the span to the left and right up to the boundaries.
+        left = col
+        while(left > 0 and pixels[left - 1] == target):
+            left -= 1
+        right = col
+        while(right < image_width - 1 and pixels[right + 1] == target):
+            right += 1
+        mask.add_span(row, left, right)
+        # Columns of the neighbouring rows to scan, wider only with 8-connectivity.
+        if(reach):
+            first_col, last_col = max(left - 1, 0), min(right + 1, image_width - 1)
+        else:
+            first_col, last_col = left, right
+        # Push one seed per unvisited run of target pixels in the neighbouring rows.
+        for neighbour_row in (row - 1, row + 1):
+            if(neighbour_row < 0 or neighbour_row >= image_height):
+                continue
+            neighbour_pixels = image[neighbour_row]
+            neighbour_base = neighbour_row * row_size
+            in_run = False
+            for neighbour_col in range(first_col, last_col + 1):
+                if(neighbour_pixels[neighbour_col] == target):
+                    if(not in_run):
+                        if(not bits[neighbour_base + (neighbour_col >> 3)] & (0x80 >> (neighbour_col & 7))):
+                            stack.append((neighbour_row, neighbour_col))
+                        in_run = True
+                else:
+                    in_run = False
+
+
+def _count_matching(pixels, target):
+    """ Count the pixels of a row segment comparing equal to target
+
+    Args:
+        pixels (list, bytes or memoryview) : the row segment
+        target (int or _OutsideOf) : value the counted pixels compare equal to
+
+    Returns:
+        int : number of matching pixels
+    """
+    if(isinstance(pixels, memoryview)):
+        pixels = pixels.tobytes()
+    if(isinstance(target, _OutsideOf)):
+        # Bytes can only hold (and count) byte-sized values.
+        blocked = [value for value in target.blocked if isinstance(pixels, list) or 0 <= value < 256]
+        return len(pixels) - sum(pixels.count(value) for value in blocked)
+    return pixels.count(target)
+
+
+def _span_value(image, replacement):
+    """ One-pixel sequence which, repeated, can be slice-assigned into the rows of image
+
+    Args:
+        image (list or raster.Raster) : a non-empty 2D representation of an image
+        replacement (int) : value of the pixels to be written
+
+    Returns:
+        list or bytes : the replacement value as a one-element sequence
+    """
+    # Byte-backed rows (such as raster.Raster rows) only accept bytes-like spans.
+    if(isinstance(image[0], (memoryview, bytearray))):
+        return bytes((replacement,))
+    return [replacement]
+
+
+def fill_many(image, seed_points, connectivity=4, target=0, replacement=2, boundary=(1,)):
+    """ Fill the image from several seed points to boundary at once
+
+    The connected regions of unfilled pixels are labelled once, then every
+    region holding at least one seed point is filled in a single pass, so
+    seed points landing in the same region cost nothing extra. Invalid seed
+    points (see fill) are ignored.
+
+    Args:
+        image (list) : a 2D representation of an image, where
+                       0 represents an unfilled pixel, and
+                       1 represents a boundary pixel
+        seed_points (iterable[tuple]) : 2-element tuples representing the (row, col)
+                       coordinates of the seed points to start filling
+        connectivity, target, replacement, boundary : as for fill
+
+    Returns:
+        list : the same image with every seeded region filled
+    """
+    _check_connectivity(connectivity)
+    matcher = _pixel_matcher(target, replacement, boundary)
+    if(matcher is None):
+        return image
+
+    # The regions of NumPy arrays are found as a boolean array and filled in bulk.
+    if(np is not None and isinstance(image, np.ndarray)):
+        mask = _fillable_mask(image, matcher)
+        seeds = [seed for seed in seed_points if _is_valid_seed(image.shape[0], image.shape[1], seed)]
+        seeds = [seed for seed in seeds if mask[seed[0], seed[1]]]
+        if(seeds):
+            image[_components_mask(mask, seeds, connectivity)] = replacement
+        return image
+
+    # Check if the image is empty.
+    if(not image):
+        return image
+
+    image_width = len(image[0])
+    image_height = len(image)
+    rows, starts, ends = _find_runs(image, matcher)
+    labels = _label_runs(rows, starts, ends, connectivity)
+
+    # Collect the labels of the regions holding a seed point.
+    seeded_labels = set()
+    for seed_point in seed_points:
+        if(not _is_valid_seed(image_height, image_width, seed_point)):
+            continue
+        run = _run_at(rows, starts, ends, seed_point[0], seed_point[1])
+        if(run is not None):
+            seeded_labels.add(labels[run])
+
+    # Fill every run of the seeded regions.
+    if(seeded_labels):
+        span_value = _span_value(image, replacement)
+        for run, label in enumerate(labels):
+            if(label in seeded_labels):
+                image[rows[run]][starts[run]:ends[run]] = span_value * (ends[run] - starts[run])
     return image
 
 
+def _is_valid_seed(image_height, image_width, seed_point):
+    """ Check that a seed point has integer coordinates inside the image
+
+    Args:
+        image_height (int) : number of rows of the image
+        image_width (int) : number of columns of the image
+        seed_point (tuple) : (row, col) coordinates of the seed point
+
+    Returns:
+        bool : True if the seed point can be used to fill the image
+    """
+    row, col = seed_point[0], seed_point[1]
+    integer_types = (int, np.integer) if np is not None else int
+    if(not(isinstance(row, integer_types) and isinstance(col, integer_types))):
+        return False
+    return 0 <= row < image_height and 0 <= col < image_width
+
+
+def _find_runs(image, target):
+    """ Find the horizontal runs of target pixels in an image
+
+    Rows holding byte-sized values are searched with a regular expression, so
+    only the runs (not the pixels) are visited from Python.
+
+    Args:
+        image (list or raster.Raster) : a 2D representation of an image
+        target (int or _OutsideOf) : value the pixels making up the runs compare equal to
+
+    Returns:
+        tuple[list[int], list[int], list[int]] : the row, first column and column
+            just past the end of each run, sorted by row then column
+    """
+    rows, starts, ends = [], [], []
+    run_pattern = _run_pattern(target)
+    for row, pixels in enumerate(image):
+        try:
+            pixel_bytes = bytes(pixels) if run_pattern is not None else None
+        except (ValueError, TypeError):
+            pixel_bytes = None
+        if(pixel_bytes is not None):
+            for match in run_pattern.finditer(pixel_bytes):
+                rows.append(row)
+                starts.append(match.start())
+                ends.append(match.end())
+            continue
+        # Fall back to scanning pixel by pixel for values that do not fit in a byte.
+        start = None
+        for col, pixel in enumerate(pixels):
+            if(pixel == target and start is None):
+                start = col
+            elif(pixel != target and start is not None):
+                rows.append(row)
+                starts.append(start)
+                ends.append(col)
+                start = None
+        if(start is not None):
+            rows.append(row)
+            starts.append(start)
+            ends.append(len(pixels))
+    return rows, starts, ends
+
+
+def _run_pattern(target):
+    """ Regular expression matching the runs of target pixels in a row of bytes
+
+    Args:
+        target (int or _OutsideOf) : value the pixels making up the runs compare equal to
+
+    Returns:
+        re.Pattern : the compiled pattern, or None if target does not fit in a byte
+    """
+    if(isinstance(target, _OutsideOf)):
+        blocked = bytes(sorted(value for value in target.blocked
+                               if isinstance(value, int) and 0 <= value < 256))
+        if(not blocked):
+            return re.compile(rb"[\x00-\xff]+")
+        return re.compile(b"[^" + re.escape(blocked) + b"]+")
+    if(0 <= target < 256):
+        return re.compile(re.escape(bytes((target,))) + b"+")
+    return None
+
+
+def _run_at(rows, starts, ends, row, col):
+    """ Find the run covering a pixel
+
+    Args:
+        rows (list[int]) : row of each run, sorted
+        starts (list[int]) : first column of each run, sorted within a row
+        ends (list[int]) : column just past the end of each run
+        row (int) : row of the pixel
+        col (int) : column of the pixel
+
+    Returns:
+        int : index of the run covering the pixel, or None if there is none
+    """
+    # Runs are sorted by (row, start), so bisect on the pair.
+    first = bisect.bisect_left(rows, row)
+    last = bisect.bisect_right(rows, row, first)
+    run = bisect.bisect_right(starts, col, first, last) - 1
+    if(run >= first and col < ends[run]):
+        return run
+    return None
+
+
+def image_to_array(image):
+    """ Convert a nested list image into a NumPy array of 8-bit pixels
+
+    Args:
+        image (list) : list of lists of 0 (unfilled pixel), 1 (boundary pixel) and 2 (filled pixel)
+
+    Returns:
+        numpy.ndarray : a 2D uint8 array holding the same pixels
+    """
+    if(np is None):
+        raise ImportError("NumPy is required for array-backed images")
+    if(not image):
+        return np.zeros((0, 0), dtype=np.uint8)
+    return np.array(image, dtype=np.uint8)
+
+
+def array_to_image(array):
+    """ Convert a NumPy image back into the nested list representation
+
+    Args:
+        array (numpy.ndarray) : a 2D array of 0 (unfilled pixel), 1 (boundary pixel) and 2 (filled pixel)
+
+    Returns:
+        list : list of lists of ints holding the same pixels
+    """
+    return array.tolist()
+
+
+def load_image_array(filename):
+    """ Load image from file straight into a NumPy array
+
+    Args:
+        filename (str) : path to file containing the image representation
+
+    Returns:
+        numpy.ndarray : a 2D uint8 array, see load_image for the pixel values
+    """
+    return image_to_array(load_image(filename))
+
+
+def _fill_array(array, seed_point, connectivity, matcher, replacement, stats=None):
+    """ Fill a NumPy image from seed point to boundary
+
+    The component of fillable pixels holding the seed point is found with
+    _components_mask and filled with a single masked assignment. The same rules as fill apply to invalid seed points.
+
+    Args:
+        array (numpy.ndarray) : a 2D array of 0 (unfilled pixel) and 1 (boundary pixel)
+        seed_point (tuple) : a 2-element tuple representing the (row, col)
+                       coordinates of the seed point to start filling
+        connectivity (int) : 4 or 8
+        matcher (int or _OutsideOf) : value the fillable pixels compare equal to, or None
+        replacement (int) : value written to the filled pixels
+        stats (RegionStats) : if given, filled in with the statistics of the region
+
+    Returns:
+        numpy.ndarray : the same array, filled in place
+    """
+    # Check if the image is empty or nothing can be filled.
+    if(array.size == 0 or matcher is None):
+        return array
+
+    image_height, image_width = array.shape
+    row = seed_point[0]
+    col = seed_point[1]
+
+    # Check that both coordinates of seed_point are integer.
+    if(not(isinstance(row, (int, np.integer)) and isinstance(col, (int, np.integer)))):
+        return array
+
+    # Check if the seed_point lies within the bounds of the image.
+    if(row >= image_height or row < 0 or col >= image_width or col < 0):
+        return array
+
+    # Only fillable pixels are flooded.
+    mask = _fillable_mask(array, matcher)
+    if(not mask[row, col]):
+        return array
+
+    region = _components_mask(mask, [(row, col)], connectivity)
+    array[region] = replacement
+    if(stats is not None):
+        _array_region_stats(region, stats)
+    return array
+
+
+def _array_region_stats(region, stats):
+    """ Measure a region given as a boolean mask
+
+    Args:
+        region (numpy.ndarray) : a 2D boolean array, True inside the region
+        stats (RegionStats) : statistics to fill in
+    """
+    region_rows = np.nonzero(region.any(axis=1))[0]
+    region_cols = np.nonzero(region.any(axis=0))[0]
+    if(len(region_rows) == 0):
+        return
+    stats.pixel_count = int(region.sum())
+    stats.min_row, stats.max_row = int(region_rows[0]), int(region_rows[-1])
+    stats.min_col, stats.max_col = int(region_cols[0]), int(region_cols[-1])
+    # Every pixel has four sides, two of which are lost for each pair of neighbours.
+    shared = int((region[:, 1:] & region[:, :-1]).sum()) + int((region[1:, :] & region[:-1, :]).sum())
+    stats.perimeter = 4 * stats.pixel_count - 2 * shared
+    stats.touches_edge = bool(region[0].any() or region[-1].any() or region[:, 0].any() or region[:, -1].any())
+
+
+def _fillable_mask(array, matcher):
+    """ Boolean mask of the pixels of a NumPy image that compare equal to matcher
+
+    Args:
+        array (numpy.ndarray) : a 2D image
+        matcher (int or _OutsideOf) : value the fillable pixels compare equal to
+
+    Returns:
+        numpy.ndarray : a 2D boolean array of the same shape as array
+    """
+    if(isinstance(matcher, _OutsideOf)):
+        return ~np.isin(array, list(matcher.blocked))
+    return array == matcher
+
+
+def _components_mask(mask, seed_points, connectivity=4):
+    """ Boolean mask of the connected components of mask holding the seed points
+
+    SciPy's labelling is used when it is installed. Otherwise only the
+    components holding the seed points are flooded by _flood_byte_rows, so
+    the work done follows the size of the region rather than the number of
+    runs of the whole image. Labelling the runs of the whole image costs less
+    per run than flooding them, so the flood gives up for regions holding
+    more than an eighth of the image's runs (and 10000 runs at least), which
+    are then found by joining overlapping runs of consecutive rows.
+
+    Args:
+        mask (numpy.ndarray) : a 2D boolean array, True where pixels may be filled
+        seed_points (list[tuple]) : (row, col) of the seed pixels, which must be set in mask
+        connectivity (int) : 4 or 8. Defaults to 4.
+
+    Returns:
+        numpy.ndarray : a 2D boolean array of the same shape as mask
+    """
+    if(ndimage is not None):
+        seed_rows = [seed_point[0] for seed_point in seed_points]
+        seed_cols = [seed_point[1] for seed_point in seed_points]
+        structure = np.ones((3, 3), dtype=bool) if connectivity == 8 else None
+        labels, _ = ndimage.label(mask, structure=structure)
+        return np.isin(labels, labels[seed_rows, seed_cols])
+
+    image_height, image_width = mask.shape
+    run_count = int(np.count_nonzero(mask[:, 1:] & ~mask[:, :-1])) + int(np.count_nonzero(mask[:, 0]))
+    rows = [pixels.tobytes() for pixels in mask.view(np.uint8)]
+    region = FillMask(image_width, image_height)
+    seeds = [(int(seed_point[0]), int(seed_point[1])) for seed_point in seed_points]
+    if(_flood_byte_rows(rows, seeds, connectivity, region, max(run_count // 8, 10000))):
+        return region.to_array()
+
+    # Pad each row with False so that every run has a rising and falling edge.
+    padded = np.zeros((image_height, image_width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    run_rows, run_starts = np.nonzero(edges == 1)
+    run_ends = np.nonzero(edges == -1)[1]
+    rows, starts, ends = run_rows.tolist(), run_starts.tolist(), run_ends.tolist()
+    labels = np.array(_label_runs(rows, starts, ends, connectivity))
+
+    # Select every run sharing the label of a run under a seed point.
+    seed_runs = [_run_at(rows, starts, ends, row, col) for row, col in seeds]
+    selected = np.isin(labels, labels[seed_runs])
+
+    # Rebuild the pixel mask from the selected runs with a running sum.
+    offsets = run_rows[selected] * image_width
+    delta = np.zeros(image_height * image_width + 1, dtype=np.int32)
+    delta[offsets + run_starts[selected]] += 1
+    delta[offsets + run_ends[selected]] -= 1
+    return (np.cumsum(delta[:-1]) > 0).reshape(image_height, image_width)
+
+
+def _flood_byte_rows(rows, seed_points, connectivity, region, max_spans):
+    """ Record in a mask the components of set pixels holding the seed points
+
+    The same traversal as _scanline_mask, over rows of bytes holding 1 for the
+    pixels of the components and 0 elsewhere. Spans and the runs of the
+    neighbouring rows are found with bytes.find and bytes.rfind, so only the
+    runs of the region are visited from Python.
+
+    Args:
+        rows (list[bytes]) : the rows of the image, 1 for set pixels and 0 elsewhere
+        seed_points (list[tuple]) : (row, col) of the seed pixels, which must be set
+        connectivity (int) : 4 or 8
+        region (FillMask) : mask of the image's size, updated with every span
+        max_spans (int) : number of spans after which the flood gives up
+
+    Returns:
+        bool : True if the components were flooded, False if the flood gave up
+    """
+    image_height = len(rows)
+    image_width = len(rows[0])
+    reach = 1 if connectivity == 8 else 0
+    bits = region.bits
+    row_size = region.row_size
+    stack = list(seed_points)
+    while(stack):
+        row, col = stack.pop()
+        # The run may have been visited from another span since it was pushed.
+        if(bits[row * row_size + (col >> 3)] & (0x80 >> (col & 7))):
+            continue
+        max_spans -= 1
+        if(max_spans < 0):
+            return False
+        pixels = rows[row]
+        # Extend the span to the left and right up to the boundaries.
+        left = pixels.rfind(b"\x00", 0, col) + 1
+        right = pixels.find(b"\x00", col)
+        right = (image_width if right < 0 else right) - 1
+        region.add_span(row, left, right)
+        # Columns of the neighbouring rows to scan, wider only with 8-connectivity.
+        if(reach):
+            first_col, last_col = max(left - 1, 0), min(right + 1, image_width - 1)
+        else:
+            first_col, last_col = left, right
+        # Push one seed per unvisited run of set pixels in the neighbouring rows.
+        for neighbour_row in (row - 1, row + 1):
+            if(neighbour_row < 0 or neighbour_row >= image_height):
+                continue
+            neighbour_pixels = rows[neighbour_row]
+            neighbour_base = neighbour_row * row_size
+            start = neighbour_pixels.find(b"\x01", first_col, last_col + 1)
+            while(start >= 0):
+                if(not bits[neighbour_base + (start >> 3)] & (0x80 >> (start & 7))):
+                    stack.append((neighbour_row, start))
+                end = neighbour_pixels.find(b"\x00", start, last_col + 1)
+                if(end < 0):
+                    break
+                start = neighbour_pixels.find(b"\x01", end, last_col + 1)
+    return True
+
+
+def _label_runs(rows, starts, ends, connectivity=4):
+    """ Label horizontal runs of pixels by connected component
+
+    Runs are joined with a union-find whenever they overlap a run of the
+    previous row, scanning both rows' runs together with two pointers. With
+    8-connectivity runs that only touch diagonally are joined too.
+
+    Args:
+        rows (list[int]) : row of each run, runs must be sorted by row then start
+        starts (list[int]) : first column of each run
+        ends (list[int]) : column just past the end of each run
+        connectivity (int) : 4 or 8. Defaults to 4.
+
+    Returns:
+        list[int] : the component label of each run, equal runs are connected
+    """
+    run_count = len(rows)
+    parent = list(range(run_count))
+    reach = 1 if connectivity == 8 else 0
+
+    def find(run):
+        while(parent[run] != run):
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    previous_first = previous_last = 0
+    first = 0
+    while(first < run_count):
+        # Find the runs belonging to the current row.
+        row = rows[first]
+        last = first
+        while(last < run_count and rows[last] == row):
+            last += 1
+        # Join with overlapping runs of the previous row, if it is adjacent.
+        if(previous_last > previous_first and rows[previous_first] == row - 1):
+            above, below = previous_first, first
+            while(above < previous_last and below < last):
+                if(starts[above] < ends[below] + reach and starts[below] < ends[above] + reach):
+                    root_above, root_below = find(above), find(below)
+                    if(root_above != root_below):
+                        parent[root_below] = root_above
+                if(ends[above] < ends[below]):
+                    above += 1
+                else:
+                    below += 1
+        previous_first, previous_last = first, last
+        first = last
+
+    return [find(run) for run in range(run_count)]
+
 
 def example_fill():
     image = load_image("data/bar.txt")
@@ -155,4 +1270,10 @@ def example_fill():
 
 
 if __name__ == '__main__':
+    import sys
+
+    # With arguments, fill a batch of image files (see batch_fill.py).
+    if(len(sys.argv) > 1):
+        import batch_fill
+        sys.exit(batch_fill.main())
     example_fill()
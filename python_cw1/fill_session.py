@@ -0,0 +1,176 @@
+""" Incremental bucket fill for images whose boundaries are edited interactively
+
+A FillSession fills an image once, then keeps it filled from the same seed
+point while boundary pixels are added and removed. Each edit only visits the
+area it affects instead of flooding the whole image again.
+"""
+
+from collections import deque
+
+import bucket_fill
+from bucket_fill import NEIGHBOUR_OFFSETS
+
+UNFILLED = 0
+BOUNDARY = 1
+FILLED = 2
+
+
+class FillSession:
+    """ Keeps an image filled from a seed point while its boundaries are edited.
+
+    The filled region is held in the image itself: a pixel belongs to the
+    seed's component exactly when it is filled. After every edit the image is
+    the same as filling the edited image (with filled pixels reset to
+    unfilled) from the seed point.
+    """
+
+    def __init__(self, image, seed_point, connectivity=4):
+        """ Fill the image from the seed point and start the session.
+
+        Args:
+            image (list or raster.Raster) : a 2D representation of an image of
+                0 (unfilled pixel) and 1 (boundary pixel), filled in place
+            seed_point (tuple) : a 2-element tuple representing the (row, col)
+                coordinates of the seed point to start filling
+            connectivity (int) : 4 or 8. Defaults to 4.
+        """
+        bucket_fill._check_connectivity(connectivity)
+        self.image = image
+        self.seed_point = seed_point
+        self.connectivity = connectivity
+        self.offsets = NEIGHBOUR_OFFSETS[connectivity]
+        self.height = len(image)
+        self.width = len(image[0]) if self.height else 0
+        self.seed_valid = bucket_fill._is_valid_seed(self.height, self.width, seed_point)
+        bucket_fill.fill(image, seed_point, connectivity)
+
+    def add_boundary(self, point):
+        """ Turn a pixel into a boundary, shrinking or splitting the filled region if needed.
+
+        Only the pieces of the region cut off from the seed point are visited
+        (and unfilled), searching from every side of the new boundary at once.
+
+        Args:
+            point (tuple) : (row, col) coordinates of the pixel
+        """
+        row, col = point
+        pixel = self.image[row][col]
+        if(pixel == BOUNDARY):
+            return
+        self.image[row][col] = BOUNDARY
+        if(pixel != FILLED):
+            return
+
+        if(self.seed_valid and (row, col) == tuple(self.seed_point)):
+            # The seed point is now a boundary, so nothing stays filled.
+            for neighbour in self._neighbours(row, col):
+                if(self.image[neighbour[0]][neighbour[1]] == FILLED):
+                    bucket_fill._scanline_fill(self.image, neighbour[0], neighbour[1],
+                                               FILLED, UNFILLED, self.connectivity)
+            return
+
+        self._split_region([neighbour for neighbour in self._neighbours(row, col)
+                            if self.image[neighbour[0]][neighbour[1]] == FILLED])
+
+    def remove_boundary(self, point):
+        """ Turn a boundary pixel into an unfilled one, growing the filled region if needed.
+
+        When the pixel touches the filled region (or is the seed point), the
+        unfilled areas it connects are filled from it; otherwise nothing else
+        is visited.
+
+        Args:
+            point (tuple) : (row, col) coordinates of the pixel
+        """
+        row, col = point
+        if(self.image[row][col] != BOUNDARY):
+            return
+        self.image[row][col] = UNFILLED
+
+        touches_region = any(self.image[neighbour[0]][neighbour[1]] == FILLED
+                             for neighbour in self._neighbours(row, col))
+        if(touches_region or (self.seed_valid and (row, col) == tuple(self.seed_point))):
+            bucket_fill._scanline_fill(self.image, row, col, UNFILLED, FILLED, self.connectivity)
+
+    def _neighbours(self, row, col):
+        """ List the neighbours of a pixel that lie inside the image
+
+        Args:
+            row (int) : row of the pixel
+            col (int) : column of the pixel
+
+        Returns:
+            list[tuple[int, int]] : (row, col) of each neighbour
+        """
+        return [(row + row_offset, col + col_offset) for row_offset, col_offset in self.offsets
+                if 0 <= row + row_offset < self.height and 0 <= col + col_offset < self.width]
+
+    def _split_region(self, starts):
+        """ Unfill the pieces of the filled region that no longer reach the seed point
+
+        One breadth-first search is started from each filled neighbour of the
+        new boundary and the searches advance one pixel at a time in turn,
+        searches that meet being merged into one. Once at most one search is
+        still running, every other piece has been visited completely, so the
+        work done is bounded by the size of the smaller pieces. The pieces
+        without the seed point are then unfilled, the last one (which may be
+        much larger) with a scanline fill.
+
+        Args:
+            starts (list[tuple[int, int]]) : filled neighbours of the new boundary
+        """
+        owner = {}
+        parent = list(range(len(starts)))
+        frontiers = [deque() for _ in starts]
+        exhausted = [False] * len(starts)
+
+        def find(search):
+            while(parent[search] != search):
+                parent[search] = parent[parent[search]]
+                search = parent[search]
+            return search
+
+        def running_searches():
+            return [search for search in range(len(starts))
+                    if find(search) == search and not exhausted[search]]
+
+        for search, start in enumerate(starts):
+            owner[start] = search
+            frontiers[search].append(start)
+
+        running = running_searches()
+        while(len(running) > 1):
+            for search in running:
+                if(find(search) != search):
+                    continue
+                frontier = frontiers[search]
+                if(not frontier):
+                    exhausted[search] = True
+                    continue
+                row, col = frontier.popleft()
+                for neighbour in self._neighbours(row, col):
+                    if(self.image[neighbour[0]][neighbour[1]] != FILLED):
+                        continue
+                    other = owner.get(neighbour)
+                    if(other is None):
+                        owner[neighbour] = search
+                        frontier.append(neighbour)
+                        continue
+                    other = find(other)
+                    if(other != search):
+                        # The two searches are in the same piece, carry on as one.
+                        parent[other] = search
+                        frontier.extend(frontiers[other])
+                        frontiers[other].clear()
+            running = running_searches()
+
+        # The seed point is in the piece that reached it, or else in the one still running.
+        seed_owner = owner.get(tuple(self.seed_point))
+        seed_search = find(seed_owner) if seed_owner is not None else None
+        for pixel, search in owner.items():
+            search = find(search)
+            if(exhausted[search] and search != seed_search):
+                self.image[pixel[0]][pixel[1]] = UNFILLED
+        if(running and seed_search is not None and seed_search != running[0]):
+            row, col = starts[running[0]]
+            bucket_fill._scanline_fill(self.image, row, col, FILLED, UNFILLED, self.connectivity)
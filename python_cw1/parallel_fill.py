@@ -0,0 +1,250 @@
+""" Tiled flood fill over a process pool for very large bucket fill images
+
+The image is copied once into shared memory (one byte per pixel) and split
+into bands of rows. Each worker labels the runs of fillable pixels of its
+band with the same run union-find as bucket_fill.fill_many(), keeps the runs
+and their labels in a shared memory block of its own and returns only the
+runs of the band's first and last rows. The parent joins the labels of runs
+touching across band borders, then each band holding part of the seed
+point's region is filled in place in shared memory by a worker, from the
+runs kept for it, and only the rows of those bands are copied back. The
+result is identical to bucket_fill.fill().
+"""
+
+import bisect
+import multiprocessing
+from array import array
+from multiprocessing import shared_memory
+
+import bucket_fill
+from raster import Raster
+
+
+def parallel_fill(image, seed_point, connectivity=4, target=0, replacement=2, boundary=(1,),
+                  processes=None, tile_rows=None):
+    """ Fill the image from seed point to boundary using a pool of processes
+
+    Takes the same arguments, follows the same rules and gives the same result
+    as bucket_fill.fill(). Images holding values, or replacements, that do not
+    fit in a byte are filled serially.
+
+    Args:
+        image (list or raster.Raster) : a 2D representation of an image
+        seed_point (tuple) : a 2-element tuple representing the (row, col)
+                       coordinates of the seed point to start filling
+        connectivity, target, replacement, boundary : as for bucket_fill.fill
+        processes (int) : number of worker processes. Defaults to the number of CPUs.
+        tile_rows (int) : number of rows per tile. Defaults to giving each process four tiles.
+
+    Returns:
+        list or raster.Raster : the same image, filled in place
+    """
+    bucket_fill._check_connectivity(connectivity)
+    matcher = bucket_fill._pixel_matcher(target, replacement, boundary)
+
+    # Check if the image is empty or nothing can be filled.
+    if(not image or matcher is None):
+        return image
+
+    image_width = len(image[0])
+    image_height = len(image)
+    if(not bucket_fill._is_valid_seed(image_height, image_width, seed_point)):
+        return image
+    row, col = seed_point[0], seed_point[1]
+    if(image[row][col] != matcher):
+        return image
+    # The bands are filled in shared memory, one byte per pixel.
+    if(not(isinstance(replacement, int) and 0 <= replacement < 256)):
+        return bucket_fill.fill(image, seed_point, connectivity, target, replacement, boundary)
+
+    processes = processes or multiprocessing.cpu_count()
+    if(tile_rows is None):
+        tile_rows = -(-image_height // (4 * processes))
+    tiles = [(first, min(first + tile_rows, image_height))
+             for first in range(0, image_height, tile_rows)]
+    seed_tile = row // tile_rows
+
+    shared = shared_memory.SharedMemory(create=True, size=max(image_width * image_height, 1))
+    run_blocks = []
+    try:
+        # Copy the pixels into shared memory, falling back to a serial fill for wide values.
+        try:
+            for image_row, pixels in enumerate(image):
+                start = image_row * image_width
+                shared.buf[start:start + image_width] = bytes(pixels)
+        except (ValueError, TypeError):
+            return bucket_fill.fill(image, seed_point, connectivity, target, replacement, boundary)
+
+        with multiprocessing.Pool(min(processes, len(tiles))) as pool:
+            tasks = [(shared.name, image_width, first, last, matcher, connectivity,
+                      (row - first, col) if tile == seed_tile else None)
+                     for tile, (first, last) in enumerate(tiles)]
+            tile_borders = pool.map(_label_tile, tasks)
+            run_blocks = [run_block for run_block, _, _, _ in tile_borders]
+            tile_labels = _merge_tiles(tiles, tile_borders, seed_tile, connectivity)
+            tasks = [(shared.name, image_width, first, replacement, run_blocks[tile], tile_labels[tile])
+                     for tile, (first, _) in enumerate(tiles) if tile_labels[tile]]
+            pool.map(_fill_tile, tasks)
+
+        # Copy back the rows of the bands holding part of the region.
+        for first, last in (tiles[tile] for tile in range(len(tiles)) if tile_labels[tile]):
+            for image_row in range(first, last):
+                start = image_row * image_width
+                image[image_row][:] = shared.buf[start:start + image_width]
+    finally:
+        shared.close()
+        shared.unlink()
+        for run_block in run_blocks:
+            run_block = shared_memory.SharedMemory(name=run_block)
+            run_block.close()
+            run_block.unlink()
+    return image
+
+
+def _label_tile(task):
+    """ Label the runs of fillable pixels of one band of rows held in shared memory
+
+    The number of runs, then the row, start, end and label of every run are
+    stored, as four arrays of 32-bit ints one after the other, in a new shared
+    memory block which the caller must unlink.
+
+    Args:
+        task (tuple) : shared memory name, image width, first row and row past
+            the end of the band, pixel matcher, connectivity and the seed point
+            (relative to the band) if it lies in the band, else None
+
+    Returns:
+        tuple[str, list[tuple], list[tuple], int] : the name of the block holding
+            the runs, the start, end and component label of each run of the band's
+            first and of its last row, and the label of the run under the seed
+            point, None if it is not in the band
+    """
+    name, image_width, first, last, matcher, connectivity, seed_point = task
+    shared = shared_memory.SharedMemory(name=name)
+    tile = Raster(shared.buf, image_width, last - first, offset=first * image_width)
+    try:
+        rows, starts, ends = bucket_fill._find_runs(tile, matcher)
+    finally:
+        tile.close()
+        shared.close()
+    labels = bucket_fill._label_runs(rows, starts, ends, connectivity)
+    runs = array("i", [len(rows)])
+    for values in (rows, starts, ends, labels):
+        runs.extend(values)
+    run_block = shared_memory.SharedMemory(create=True, size=max(len(runs) * runs.itemsize, 1))
+    run_block.buf[:len(runs) * runs.itemsize] = runs.tobytes()
+    run_block.close()
+    top = [(starts[run], ends[run], labels[run]) for run in range(bisect.bisect_right(rows, 0))]
+    bottom = [(starts[run], ends[run], labels[run])
+              for run in range(bisect.bisect_left(rows, last - first - 1), len(rows))]
+    seed_label = None
+    if(seed_point is not None):
+        seed_label = labels[bucket_fill._run_at(rows, starts, ends, seed_point[0], seed_point[1])]
+    return run_block.name, top, bottom, seed_label
+
+
+def _merge_tiles(tiles, tile_borders, seed_tile, connectivity):
+    """ Join the components crossing tile borders and find those making up the seed point's region
+
+    Components are identified by their tile and their label within the tile.
+
+    Args:
+        tiles (list[tuple[int, int]]) : first row and row past the end of each tile
+        tile_borders (list[tuple]) : border runs and seed label of each tile, as returned by _label_tile
+        seed_tile (int) : index of the tile holding the seed point
+        connectivity (int) : 4 or 8
+
+    Returns:
+        list[set[int]] : for each tile, the labels of its components belonging to the seed point's region
+    """
+    seed_label = tile_borders[seed_tile][3]
+    parent = {(seed_tile, seed_label): (seed_tile, seed_label)}
+    for tile, (_, top, bottom, _) in enumerate(tile_borders):
+        for _, _, label in top + bottom:
+            parent[(tile, label)] = (tile, label)
+
+    # Join the runs of each tile's first row with those of the previous tile's last row.
+    reach = 1 if connectivity == 8 else 0
+    for tile in range(1, len(tiles)):
+        above_runs, below_runs = tile_borders[tile - 1][2], tile_borders[tile][1]
+        above = below = 0
+        while(above < len(above_runs) and below < len(below_runs)):
+            above_start, above_end, above_label = above_runs[above]
+            below_start, below_end, below_label = below_runs[below]
+            if(above_start < below_end + reach and below_start < above_end + reach):
+                root_above = _find(parent, (tile - 1, above_label))
+                root_below = _find(parent, (tile, below_label))
+                if(root_above != root_below):
+                    parent[root_below] = root_above
+            if(above_end < below_end):
+                above += 1
+            else:
+                below += 1
+
+    # A component is part of the region if it holds the seed point or joins it across a border.
+    seed_root = _find(parent, (seed_tile, seed_label))
+    tile_labels = [set() for _ in tiles]
+    for tile, label in parent:
+        if(_find(parent, (tile, label)) == seed_root):
+            tile_labels[tile].add(label)
+    return tile_labels
+
+
+def _fill_tile(task):
+    """ Fill the components of one band of rows held in shared memory
+
+    Args:
+        task (tuple) : shared memory name, image width, first row of the band,
+            replacement, name of the block holding the band's runs (see
+            _label_tile) and the labels of the components to fill
+    """
+    name, image_width, first, replacement, run_block, labels = task
+    shared = shared_memory.SharedMemory(name=name)
+    run_block = shared_memory.SharedMemory(name=run_block)
+    runs = array("i")
+    try:
+        runs.frombytes(run_block.buf[:runs.itemsize])
+        run_count = runs.pop()
+        runs.frombytes(run_block.buf[runs.itemsize:(4 * run_count + 1) * runs.itemsize])
+        pixels = shared.buf
+        span_value = bytes((replacement,))
+        for row, start, end, label in zip(runs[:run_count], runs[run_count:2 * run_count],
+                                          runs[2 * run_count:3 * run_count], runs[3 * run_count:]):
+            if(label in labels):
+                start += (first + row) * image_width
+                end += (first + row) * image_width
+                pixels[start:end] = span_value * (end - start)
+    finally:
+        shared.close()
+        run_block.close()
+
+
+def _find(parent, run):
+    """ Find the root run of a component, halving the path on the way
+
+    Args:
+        parent (list[int]) : union-find parent of each run
+        run (int) : index of a run
+
+    Returns:
+        int : index of the root run of the component
+    """
+    while(parent[run] != run):
+        parent[run] = parent[parent[run]]
+        run = parent[run]
+    return run
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    image = bucket_fill.load_image(sys.argv[1] if len(sys.argv) > 1 else "data/snake.txt")
+    serial_image = [row[:] for row in image]
+    start_time = time.perf_counter()
+    bucket_fill.fill(serial_image, (0, 0))
+    serial_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    parallel_fill(image, (0, 0))
+    parallel_time = time.perf_counter() - start_time
+    print(f"serial: {serial_time:.3f}s, parallel: {parallel_time:.3f}s, identical: {image == serial_image}")
@@ -0,0 +1,497 @@
+""" Compact byte-per-pixel images for large bucket fill rasters
+
+A Raster stores its pixels as one byte each in a single flat buffer (a
+bytearray, or a memory-mapped scratch file for images larger than RAM) and
+hands out rows as zero-copy memoryviews, so it can be passed straight to
+bucket_fill.fill() and bucket_fill.stringify_image().
+
+Rasters can also be saved in a binary format made of a 16 byte header
+(magic, bits per pixel, width, height) followed by the rows, either one byte
+per pixel or packed four pixels per byte.
+"""
+
+import contextlib
+import mmap
+import os
+import struct
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Maps the ASCII digits of the text format to pixel values.
+PIXEL_TABLE = bytes.maketrans(b"012", b"\x00\x01\x02")
+# Whitespace separating the pixels of the text format.
+WHITESPACE = b" \t\r\n\x0b\x0c"
+# Number of bytes read from the text file at a time.
+CHUNK_SIZE = 1 << 20
+# Maps pixel values back to the ASCII digits of the text format.
+DIGIT_TABLE = bytes.maketrans(b"\x00\x01\x02", b"012")
+
+# Header of the binary format: magic, bits per pixel, padding, width, height.
+BINARY_HEADER = struct.Struct("<4sB3xII")
+BINARY_MAGIC = b"BFIL"
+# Extracts each of the four 2-bit pixels of a packed byte, first pixel in the high bits.
+UNPACK_TABLES = [bytes((value >> shift) & 3 for value in range(256)) for shift in (6, 4, 2, 0)]
+
+
+class Raster:
+    """ A 2D image of 0 (unfilled), 1 (boundary) and 2 (filled) pixels stored one byte per pixel.
+
+    Rows are created lazily as memoryviews over the underlying buffer, so
+    filling a row writes straight through to the buffer. Each row's view is
+    kept, so close() can release every view before closing a memory map.
+    """
+
+    def __init__(self, buffer, width, height, offset=0, owner=None):
+        """
+        Args:
+            buffer (bytearray or mmap.mmap) : writable buffer holding the pixels row by row
+            width (int) : number of pixels per row
+            height (int) : number of rows
+            offset (int) : position of the first pixel in buffer. Defaults to 0.
+            owner (object) : object kept alive (and closed by close()) alongside
+                the buffer, such as the file backing a memory map. Defaults to None.
+        """
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.offset = offset
+        self.owner = owner
+        self.view = memoryview(buffer)
+        self.rows = [None] * height
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, row):
+        if(row < 0):
+            row += self.height
+        if(row < 0 or row >= self.height):
+            raise IndexError("raster row out of range")
+        row_view = self.rows[row]
+        if(row_view is None):
+            start = self.offset + row * self.width
+            row_view = self.rows[row] = self.view[start:start + self.width]
+        return row_view
+
+    def __iter__(self):
+        for row in range(self.height):
+            yield self[row]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def to_nested(self):
+        """ Convert the raster into the nested list representation
+
+        Returns:
+            list : list of lists of ints holding the same pixels
+        """
+        return [row.tolist() for row in self]
+
+    def to_array(self):
+        """ View the raster as a NumPy array sharing the same buffer
+
+        Returns:
+            numpy.ndarray : a (height, width) uint8 array, writes go to the raster
+        """
+        if(np is None):
+            raise ImportError("NumPy is required for array-backed images")
+        return np.frombuffer(self.buffer, dtype=np.uint8, count=self.width * self.height,
+                             offset=self.offset).reshape(self.height, self.width)
+
+    def flush(self):
+        """ Write the pixels of a memory-mapped raster back to its file.
+        """
+        if(isinstance(self.buffer, mmap.mmap)):
+            self.buffer.flush()
+
+    def close(self):
+        """ Release the buffer, and the file behind it if the raster is memory-mapped.
+
+        Row views handed out earlier are released too, so they can no longer
+        be used. The owner is closed even if the memory map cannot be, for
+        instance because a NumPy array from to_array() still uses it.
+        """
+        try:
+            for row_view in self.rows:
+                if(row_view is not None):
+                    row_view.release()
+            self.rows = [None] * self.height
+            self.view.release()
+            if(isinstance(self.buffer, mmap.mmap)):
+                self.buffer.close()
+        finally:
+            if(self.owner is not None):
+                self.owner.close()
+
+
+def iter_pixel_rows(filename, chunk_size=CHUNK_SIZE):
+    """ Stream the rows of an image file as bytes of pixel values
+
+    The file is read in fixed size chunks and each line is converted with a
+    single translate call, so no per-pixel Python objects are created.
+    Blank lines are skipped, as in bucket_fill.load_image().
+
+    Args:
+        filename (str) : path to file containing the image representation
+        chunk_size (int) : number of bytes read at a time
+
+    Yields:
+        bytes : the pixels of one row, one byte per pixel
+    """
+    with open(filename, "rb") as imagefile:
+        leftover = b""
+        while(True):
+            chunk = imagefile.read(chunk_size)
+            if(not chunk):
+                break
+            lines = (leftover + chunk).split(b"\n")
+            # The last line may continue in the next chunk.
+            leftover = lines.pop()
+            for line in lines:
+                row = _parse_row(line)
+                if(row):
+                    yield row
+        row = _parse_row(leftover)
+        if(row):
+            yield row
+
+
+def _parse_row(line):
+    """ Convert one line of the text format into bytes of pixel values
+
+    Args:
+        line (bytes) : whitespace-separated digits 0, 1 and 2
+
+    Returns:
+        bytes : the pixel values, empty for a blank line
+    """
+    digits = line.translate(None, WHITESPACE)
+    if(digits.translate(None, b"012")):
+        raise ValueError(f"Invalid pixel in image row '{line.decode(errors='replace').strip()}'")
+    return digits.translate(PIXEL_TABLE)
+
+
+def load_raster(filename, use_mmap=False, chunk_size=CHUNK_SIZE):
+    """ Load image from file into a compact Raster
+
+    Uses about one byte per pixel instead of the Python ints of
+    bucket_fill.load_image(). With use_mmap the pixels are written to an
+    anonymous temporary file which is then memory-mapped, so images larger
+    than RAM can be loaded and filled.
+
+    Args:
+        filename (str) : path to file containing the image representation
+        use_mmap (bool) : store the pixels in a memory-mapped scratch file. Defaults to False.
+        chunk_size (int) : number of bytes of the text file read at a time
+
+    Returns:
+        Raster : the loaded image
+
+    Raises:
+        ValueError if the file holds an invalid pixel or rows of different lengths
+    """
+    return _raster_from_rows(iter_pixel_rows(filename, chunk_size), filename, use_mmap, chunk_size)
+
+
+def _raster_from_rows(rows, filename, use_mmap, chunk_size):
+    """ Gather rows of pixel bytes into a Raster
+
+    Args:
+        rows (iterable[bytes]) : the pixels of each row, one byte per pixel
+        filename (str) : name of the source, used in error messages
+        use_mmap (bool) : store the pixels in a memory-mapped scratch file
+        chunk_size (int) : number of bytes buffered before writing to the scratch file
+
+    Returns:
+        Raster : the gathered image
+
+    Raises:
+        ValueError if the rows have different lengths
+    """
+    scratch = tempfile.TemporaryFile() if use_mmap else None
+    pixels = bytearray()
+    width = None
+    height = 0
+    try:
+        for row in rows:
+            if(width is None):
+                width = len(row)
+            elif(len(row) != width):
+                raise ValueError(f"Row {height} of '{filename}' has {len(row)} pixels, expected {width}")
+            pixels += row
+            height += 1
+            # Flush the pixels to the scratch file once a chunk has built up.
+            if(scratch is not None and len(pixels) >= chunk_size):
+                scratch.write(pixels)
+                pixels.clear()
+    except Exception:
+        if(scratch is not None):
+            scratch.close()
+        raise
+
+    if(scratch is None):
+        return Raster(pixels, width or 0, height)
+
+    scratch.write(pixels)
+    scratch.flush()
+    # An empty file cannot be memory-mapped.
+    if(height == 0):
+        scratch.close()
+        return Raster(bytearray(), 0, 0)
+    buffer = mmap.mmap(scratch.fileno(), width * height)
+    return Raster(buffer, width, height, owner=scratch)
+
+
+def raster_from_image(image):
+    """ Convert a nested list image into a Raster
+
+    Args:
+        image (list) : list of lists of 0 (unfilled pixel), 1 (boundary pixel) and 2 (filled pixel)
+
+    Returns:
+        Raster : the same pixels stored one byte per pixel
+    """
+    if(not image):
+        return Raster(bytearray(), 0, 0)
+    pixels = bytearray()
+    for row in image:
+        pixels += bytes(row)
+    return Raster(pixels, len(image[0]), len(image))
+
+
+def _pack_row(row):
+    """ Pack a row of pixels four to a byte, first pixel in the high bits
+
+    Args:
+        row (bytes) : the pixels of the row, one byte per pixel
+
+    Returns:
+        bytes : the packed row, padded with unfilled pixels to a whole byte
+    """
+    packed_width = (len(row) + 3) // 4
+    row = bytes(row).ljust(packed_width * 4, b"\x00")
+    # Pixel values fit in two bits, so the four shifted fields of each byte never overlap.
+    packed = 0
+    for shift, field in zip((6, 4, 2, 0), (row[0::4], row[1::4], row[2::4], row[3::4])):
+        packed |= int.from_bytes(field, "big") << shift
+    return packed.to_bytes(packed_width, "big")
+
+
+def _unpack_row(packed, width):
+    """ Unpack a row of pixels packed four to a byte
+
+    Args:
+        packed (bytes) : the packed row
+        width (int) : number of pixels in the row
+
+    Returns:
+        bytes : the pixels of the row, one byte per pixel
+    """
+    row = bytearray(len(packed) * 4)
+    for position, table in enumerate(UNPACK_TABLES):
+        row[position::4] = packed.translate(table)
+    return bytes(row[:width])
+
+
+def save_binary(image, filename, bits=8):
+    """ Save an image in the binary raster format
+
+    Args:
+        image (list or Raster) : a 2D representation of an image of 0, 1 and 2 pixels
+        filename (str) : path of the file to write
+        bits (int) : bits per pixel, 8 for one byte per pixel (which load_binary
+            can memory-map in place) or 2 for four pixels per byte. Defaults to 8.
+
+    Raises:
+        ValueError if bits is neither 2 nor 8
+    """
+    if(bits not in (2, 8)):
+        raise ValueError(f"Unsupported number of bits per pixel: {bits}")
+    width = len(image[0]) if len(image) else 0
+    with open(filename, "wb") as binaryfile:
+        binaryfile.write(BINARY_HEADER.pack(BINARY_MAGIC, bits, width, len(image)))
+        for row in image:
+            binaryfile.write(bytes(row) if bits == 8 else _pack_row(row))
+
+
+def read_binary_header(binaryfile):
+    """ Read and check the header of a binary raster file
+
+    Args:
+        binaryfile (file) : file opened in binary mode, positioned at the start
+
+    Returns:
+        tuple[int, int, int] : bits per pixel, width and height of the image
+
+    Raises:
+        ValueError if the file is not a binary raster
+    """
+    header = binaryfile.read(BINARY_HEADER.size)
+    if(len(header) < BINARY_HEADER.size):
+        raise ValueError("File is too short to be a binary raster")
+    magic, bits, width, height = BINARY_HEADER.unpack(header)
+    if(magic != BINARY_MAGIC or bits not in (2, 8)):
+        raise ValueError("File is not a binary raster")
+    return bits, width, height
+
+
+def load_binary(filename, use_mmap=True, chunk_size=CHUNK_SIZE):
+    """ Load an image saved by save_binary
+
+    A one byte per pixel file is memory-mapped directly when use_mmap is set,
+    so filling the returned Raster modifies the file in place (call flush() or
+    close() to make sure the changes reach the disk). Packed files are unpacked
+    into memory, or into a memory-mapped scratch file when use_mmap is set.
+
+    Args:
+        filename (str) : path of the binary raster file
+        use_mmap (bool) : memory-map the pixels instead of reading them into RAM. Defaults to True.
+        chunk_size (int) : number of bytes read at a time from packed files
+
+    Returns:
+        Raster : the loaded image
+
+    Raises:
+        ValueError if the file is not a binary raster
+    """
+    binaryfile = open(filename, "r+b" if use_mmap else "rb")
+    try:
+        bits, width, height = read_binary_header(binaryfile)
+        if(bits == 8 and use_mmap and width * height > 0):
+            buffer = mmap.mmap(binaryfile.fileno(), BINARY_HEADER.size + width * height)
+            return Raster(buffer, width, height, offset=BINARY_HEADER.size, owner=binaryfile)
+        if(bits == 8):
+            pixels = bytearray(binaryfile.read(width * height))
+            binaryfile.close()
+            return Raster(pixels, width, height)
+        raster = _raster_from_rows(_iter_packed_rows(binaryfile, width, height), filename,
+                                   use_mmap, chunk_size)
+        binaryfile.close()
+        return raster
+    except Exception:
+        binaryfile.close()
+        raise
+
+
+def _iter_packed_rows(binaryfile, width, height):
+    """ Stream and unpack the rows of a packed binary raster
+
+    Args:
+        binaryfile (file) : file positioned at the first row
+        width (int) : number of pixels per row
+        height (int) : number of rows
+
+    Yields:
+        bytes : the pixels of one row, one byte per pixel
+    """
+    packed_width = (width + 3) // 4
+    for _ in range(height):
+        packed = binaryfile.read(packed_width)
+        if(len(packed) < packed_width):
+            raise ValueError("Binary raster is truncated")
+        yield _unpack_row(packed, width)
+
+
+def text_to_binary(text_filename, binary_filename, bits=8, chunk_size=CHUNK_SIZE):
+    """ Convert an image from the text format to the binary format, one row at a time
+
+    Args:
+        text_filename (str) : path of the text image to read
+        binary_filename (str) : path of the binary raster to write
+        bits (int) : bits per pixel of the binary raster, 2 or 8. Defaults to 8.
+        chunk_size (int) : number of bytes of the text file read at a time
+
+    Raises:
+        ValueError if bits is neither 2 nor 8 or the text image is invalid
+    """
+    if(bits not in (2, 8)):
+        raise ValueError(f"Unsupported number of bits per pixel: {bits}")
+    width = None
+    height = 0
+    with _write_replacing(binary_filename) as binaryfile:
+        # The size is only known at the end, so the header is written last.
+        binaryfile.write(bytes(BINARY_HEADER.size))
+        for row in iter_pixel_rows(text_filename, chunk_size):
+            if(width is None):
+                width = len(row)
+            elif(len(row) != width):
+                raise ValueError(f"Row {height} of '{text_filename}' has {len(row)} pixels, expected {width}")
+            binaryfile.write(row if bits == 8 else _pack_row(row))
+            height += 1
+        binaryfile.seek(0)
+        binaryfile.write(BINARY_HEADER.pack(BINARY_MAGIC, bits, width or 0, height))
+
+
+def binary_to_text(binary_filename, text_filename):
+    """ Convert an image from the binary format to the text format, one row at a time
+
+    Args:
+        binary_filename (str) : path of the binary raster to read
+        text_filename (str) : path of the text image to write
+
+    Raises:
+        ValueError if the file is not a binary raster or its size does not match its header
+    """
+    with open(binary_filename, "rb") as binaryfile, _write_replacing(text_filename) as textfile:
+        bits, width, height = read_binary_header(binaryfile)
+        if(bits == 8):
+            rows = (binaryfile.read(width) for _ in range(height))
+        else:
+            rows = _iter_packed_rows(binaryfile, width, height)
+        for row in rows:
+            if(len(row) < width):
+                raise ValueError("Binary raster is truncated")
+            textfile.write(_format_row(row))
+        if(binaryfile.read(1)):
+            raise ValueError("Binary raster is longer than its header says")
+
+
+@contextlib.contextmanager
+def _write_replacing(filename):
+    """ Open a temporary file which replaces filename once it is written without error
+
+    The file is written under a temporary name and renamed, so a failed
+    conversion leaves neither a partial file nor a changed filename behind.
+
+    Args:
+        filename (str) : path of the file to write
+
+    Yields:
+        file : the temporary file, opened for writing in binary mode
+    """
+    temporary_file = f"{filename}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_file, "wb") as output_file:
+            yield output_file
+        os.replace(temporary_file, filename)
+    except BaseException:
+        # Do not leave half-written files behind.
+        try:
+            os.remove(temporary_file)
+        except OSError:
+            pass
+        raise
+
+
+def _format_row(row):
+    """ Convert bytes of pixel values into a line of the text format
+
+    Args:
+        row (bytes) : the pixels of the row, one byte per pixel
+
+    Returns:
+        bytes : the space separated digits of the row, ending with a newline
+    """
+    line = bytearray(b" " * (2 * len(row)))
+    line[0::2] = bytes(row).translate(DIGIT_TABLE)
+    line[-1:] = b"\n"
+    return bytes(line)
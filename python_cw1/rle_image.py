@@ -0,0 +1,317 @@
+""" Run-length encoded images for large, sparse bucket fill rasters
+
+Each row of an RLEImage is stored as the value and end column of each run of
+equal pixels, so large uniform areas cost a few bytes per row instead of a
+Python int per pixel. Filling works on whole runs, so its cost depends on
+the number of runs rather than the number of pixels.
+"""
+
+import bisect
+import re
+import struct
+import sys
+from array import array
+
+import bucket_fill
+import raster
+
+# Header of the RLE file format: magic, width, height.
+RLE_HEADER = struct.Struct("<4sII")
+RLE_MAGIC = b"BFRL"
+# Matches each run of equal bytes in a row.
+RUN_PATTERN = re.compile(rb"(.)\1*", re.DOTALL)
+
+
+class RLEImage:
+    """ A 2D image stored as runs of equal pixels, row by row.
+
+    Row i is described by values[i], a bytearray holding the value of each
+    run, and ends[i], an array of the column just past the end of each run.
+    Indexing or iterating gives the rows expanded to bytes, so an RLEImage
+    can be passed to bucket_fill.stringify_image() and bucket_fill.fill().
+    """
+
+    def __init__(self, width, values, ends):
+        """
+        Args:
+            width (int) : number of pixels per row
+            values (list[bytearray]) : value of each run, for each row
+            ends (list[array]) : column just past the end of each run, for each row
+        """
+        self.width = width
+        self.height = len(values)
+        self.values = values
+        self.ends = ends
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ Encode rows of pixels
+
+        Args:
+            rows (iterable) : the pixels of each row, as bytes or lists of ints below 256
+
+        Returns:
+            RLEImage : the encoded image
+        """
+        width = 0
+        values = []
+        ends = []
+        for row in rows:
+            row = bytes(row)
+            width = len(row)
+            row_values = bytearray()
+            row_ends = array("I")
+            for match in RUN_PATTERN.finditer(row):
+                row_values.append(row[match.start()])
+                row_ends.append(match.end())
+            values.append(row_values)
+            ends.append(row_ends)
+        return cls(width, values, ends)
+
+    @classmethod
+    def from_image(cls, image):
+        """ Encode a nested list image
+
+        Args:
+            image (list) : list of lists of 0 (unfilled pixel), 1 (boundary pixel) and 2 (filled pixel)
+
+        Returns:
+            RLEImage : the encoded image
+        """
+        return cls.from_rows(image)
+
+    def to_image(self):
+        """ Decode the image into the nested list representation
+
+        Returns:
+            list : list of lists of ints holding the same pixels
+        """
+        return [list(row) for row in self]
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, row):
+        return self.row_bytes(row)
+
+    def __iter__(self):
+        for row in range(self.height):
+            yield self.row_bytes(row)
+
+    def row_bytes(self, row):
+        """ Expand one row
+
+        Args:
+            row (int) : index of the row
+
+        Returns:
+            bytes : the pixels of the row, one byte per pixel
+        """
+        parts = []
+        start = 0
+        for value, end in zip(self.values[row], self.ends[row]):
+            parts.append(bytes((value,)) * (end - start))
+            start = end
+        return b"".join(parts)
+
+    def run_count(self):
+        """ Count the runs of the whole image
+
+        Returns:
+            int : total number of runs
+        """
+        return sum(len(row_values) for row_values in self.values)
+
+    def fill_runs(self, seed_point, connectivity, matcher, replacement, stats=None):
+        """ Fill the image from seed point to boundary, one run at a time
+
+        Called by bucket_fill.fill(), which builds the matcher. Runs of
+        fillable pixels are visited depth first, each one finding the runs it
+        touches in the rows above and below by bisection, then the region's
+        runs are given the replacement value and merged with their neighbours.
+
+        Args:
+            seed_point (tuple) : (row, col) coordinates of the seed point
+            connectivity (int) : 4 or 8
+            matcher (int or bucket_fill._OutsideOf) : value fillable pixels compare equal to, or None
+            replacement (int) : value written to the filled pixels, below 256
+            stats (bucket_fill.RegionStats) : if given, filled in with the statistics of the region
+
+        Returns:
+            RLEImage : this image, filled in place
+        """
+        if(self.height == 0 or matcher is None):
+            return self
+        if(not bucket_fill._is_valid_seed(self.height, self.width, seed_point)):
+            return self
+        row, col = seed_point[0], seed_point[1]
+        run = bisect.bisect_right(self.ends[row], col)
+        if(self.values[row][run] != matcher):
+            return self
+
+        reach = 1 if connectivity == 8 else 0
+        region = {(row, run)}
+        stack = [(row, run)]
+        while(stack):
+            row, run = stack.pop()
+            start = self.ends[row][run - 1] if run else 0
+            end = self.ends[row][run]
+            # With a target of None, runs of different fillable values touch in the same row.
+            for neighbour in (run - 1, run + 1):
+                if(0 <= neighbour < len(self.values[row]) and self.values[row][neighbour] == matcher
+                   and (row, neighbour) not in region):
+                    region.add((row, neighbour))
+                    stack.append((row, neighbour))
+            for neighbour_row in (row - 1, row + 1):
+                if(neighbour_row < 0 or neighbour_row >= self.height):
+                    continue
+                neighbour_values = self.values[neighbour_row]
+                neighbour_ends = self.ends[neighbour_row]
+                # First run ending after the start of the (widened) run.
+                neighbour = bisect.bisect_right(neighbour_ends, start - reach)
+                while(neighbour < len(neighbour_ends)):
+                    neighbour_start = neighbour_ends[neighbour - 1] if neighbour else 0
+                    if(neighbour_start >= end + reach):
+                        break
+                    if(neighbour_values[neighbour] == matcher and (neighbour_row, neighbour) not in region):
+                        region.add((neighbour_row, neighbour))
+                        stack.append((neighbour_row, neighbour))
+                    neighbour += 1
+
+        runs_by_row = {}
+        for row, run in region:
+            runs_by_row.setdefault(row, []).append(run)
+        if(stats is not None):
+            self._region_stats(runs_by_row, stats)
+        for row, runs in runs_by_row.items():
+            for run in runs:
+                self.values[row][run] = replacement
+            self._merge_runs(row)
+        return self
+
+    def _merge_runs(self, row):
+        """ Merge the neighbouring runs of a row that have the same value
+
+        Args:
+            row (int) : index of the row
+        """
+        row_values = self.values[row]
+        row_ends = self.ends[row]
+        merged_values = bytearray()
+        merged_ends = array("I")
+        for value, end in zip(row_values, row_ends):
+            if(merged_values and merged_values[-1] == value):
+                merged_ends[-1] = end
+            else:
+                merged_values.append(value)
+                merged_ends.append(end)
+        self.values[row] = merged_values
+        self.ends[row] = merged_ends
+
+    def _region_stats(self, runs_by_row, stats):
+        """ Measure a region given as the runs it is made of
+
+        Args:
+            runs_by_row (dict) : indices of the region's runs, for each row
+            stats (bucket_fill.RegionStats) : statistics to fill in
+        """
+        spans_by_row = {}
+        for row, runs in runs_by_row.items():
+            # Neighbouring runs of the region (with different values) form a single span.
+            spans = []
+            for run in sorted(runs):
+                start = self.ends[row][run - 1] if run else 0
+                end = self.ends[row][run]
+                if(spans and spans[-1][1] == start):
+                    spans[-1][1] = end
+                else:
+                    spans.append([start, end])
+            spans_by_row[row] = spans
+            for start, end in spans:
+                stats.add_span(row, start, end - 1, self.height, self.width)
+        for row, spans in spans_by_row.items():
+            below = spans_by_row.get(row + 1)
+            if(below is None):
+                continue
+            # Count the pixels shared with the row below, with two pointers.
+            above_index = below_index = shared = 0
+            while(above_index < len(spans) and below_index < len(below)):
+                above_start, above_end = spans[above_index]
+                below_start, below_end = below[below_index]
+                shared += max(0, min(above_end, below_end) - max(above_start, below_start))
+                if(above_end < below_end):
+                    above_index += 1
+                else:
+                    below_index += 1
+            stats.remove_shared_sides(shared)
+
+
+def load_rle_text(filename, chunk_size=raster.CHUNK_SIZE):
+    """ Load an image in the text format straight into run-length encoding
+
+    The file is streamed row by row, so only the runs are ever held in memory.
+
+    Args:
+        filename (str) : path to file containing the image representation
+        chunk_size (int) : number of bytes of the text file read at a time
+
+    Returns:
+        RLEImage : the loaded image
+    """
+    image = RLEImage.from_rows(raster.iter_pixel_rows(filename, chunk_size))
+    for row_values, row_ends in zip(image.values, image.ends):
+        if(row_ends[-1] != image.width):
+            raise ValueError(f"Rows of '{filename}' have different lengths")
+    return image
+
+
+def save_rle(image, filename):
+    """ Save a run-length encoded image
+
+    The file holds a 12 byte header (magic, width, height) followed, for each
+    row, by its number of runs, the run values and the run ends as 32-bit
+    little-endian integers.
+
+    Args:
+        image (RLEImage) : the image to save
+        filename (str) : path of the file to write
+    """
+    with open(filename, "wb") as rlefile:
+        rlefile.write(RLE_HEADER.pack(RLE_MAGIC, image.width, image.height))
+        for row_values, row_ends in zip(image.values, image.ends):
+            rlefile.write(struct.pack("<I", len(row_values)))
+            rlefile.write(row_values)
+            if(sys.byteorder == "big"):
+                row_ends = array("I", row_ends)
+                row_ends.byteswap()
+            rlefile.write(row_ends.tobytes())
+
+
+def load_rle(filename):
+    """ Load an image saved by save_rle
+
+    Args:
+        filename (str) : path of the file to read
+
+    Returns:
+        RLEImage : the loaded image
+
+    Raises:
+        ValueError if the file is not a run-length encoded image
+    """
+    with open(filename, "rb") as rlefile:
+        header = rlefile.read(RLE_HEADER.size)
+        if(len(header) < RLE_HEADER.size or header[:4] != RLE_MAGIC):
+            raise ValueError(f"'{filename}' is not a run-length encoded image")
+        _, width, height = RLE_HEADER.unpack(header)
+        values = []
+        ends = []
+        for _ in range(height):
+            run_count, = struct.unpack("<I", rlefile.read(4))
+            values.append(bytearray(rlefile.read(run_count)))
+            row_ends = array("I")
+            row_ends.frombytes(rlefile.read(4 * run_count))
+            if(sys.byteorder == "big"):
+                row_ends.byteswap()
+            ends.append(row_ends)
+    return RLEImage(width, values, ends)
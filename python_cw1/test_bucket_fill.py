@@ -1,6 +1,31 @@
+import tempfile
+
 from bucket_fill import fill
+from bucket_fill import fill_many
+from bucket_fill import fill_with_stats
+from bucket_fill import fill_mask
+from bucket_fill import apply_mask
+from bucket_fill import Profile
 from bucket_fill import load_image
 from bucket_fill import show_image
+from bucket_fill import image_to_array
+from bucket_fill import array_to_image
+from bucket_fill import np
+from bucket_fill import stringify_image
+from bucket_fill import write_image
+from bucket_fill import preview_image
+from raster import load_raster
+from raster import load_binary
+from raster import text_to_binary
+from raster import binary_to_text
+from parallel_fill import parallel_fill
+from fill_session import FillSession
+from benchmark import run_benchmark
+from rle_image import RLEImage
+from rle_image import load_rle_text
+from rle_image import save_rle
+from rle_image import load_rle
+from batch_fill import run_batch
 
 def test_pattern():
     test_image_1 = load_image("test_image_1.txt")
@@ -67,7 +92,319 @@ def test_pattern():
     print("Test 7: Passed.")
 
 
+def test_large_region():
+    # A region far larger than the recursion limit must fill without error.
+    print("Test 8: Fill a 500x500 open image.")
+    image = [[0] * 500 for _ in range(500)]
+    image[250] = [1] * 499 + [0]
+    filled = fill(image, (0, 0))
+    assert all(pixel == 2 for row in filled for pixel in row if pixel != 1), "Test failed, Image filled incorrectly."
+    print("Test 8: Passed.")
+
+
+def test_array_fill():
+    if np is None:
+        print("Test 9: Skipped, NumPy is not installed.")
+        return
+    # Filling an array must give the same result as filling the nested list.
+    print("Test 9: Fill a NumPy array image.")
+    test_image_3 = image_to_array(load_image("test_image_3.txt"))
+    test_image_3_result = load_image("test_image_3_result.txt")
+    test_9_filled = fill(test_image_3, (2, 12))
+    assert array_to_image(test_9_filled) == test_image_3_result, "Test failed, Image filled incorrectly."
+    print("Test 9: Passed.")
+
+
+def test_raster_fill():
+    # Rasters, in memory or memory-mapped, must fill like the nested list.
+    test_image_1_result = load_image("test_image_1_result.txt")
+    for use_mmap in (False, True):
+        print(f"Test 10: Fill a raster image (use_mmap={use_mmap}).")
+        with load_raster("test_image_1.txt", use_mmap=use_mmap, chunk_size=64) as test_image_1:
+            fill(test_image_1, (10, 1))
+            assert test_image_1.to_nested() == test_image_1_result, "Test failed, Image filled incorrectly."
+        print("Test 10: Passed.")
+
+
+def test_binary_fill():
+    # A memory-mapped binary raster is filled in place in its file.
+    test_image_1_result = load_image("test_image_1_result.txt")
+    with tempfile.TemporaryDirectory() as tmp_path:
+        for bits in (2, 8):
+            print(f"Test 11: Fill a {bits}-bit binary raster.")
+            binary_filename = f"{tmp_path}/test_image_1_{bits}.bin"
+            text_to_binary("test_image_1.txt", binary_filename, bits=bits)
+            with load_binary(binary_filename) as test_image_1:
+                fill(test_image_1, (10, 1))
+                assert test_image_1.to_nested() == test_image_1_result, "Test failed, Image filled incorrectly."
+            if bits == 8:
+                with load_binary(binary_filename) as test_image_1:
+                    assert test_image_1.to_nested() == test_image_1_result, "Test failed, fill not written to file."
+            print("Test 11: Passed.")
+
+
+def test_fill_many():
+    # Filling several seeds at once must match filling them one after the other.
+    print("Test 12: Fill several seed points at once.")
+    seed_points = [(10, 1), (10, 1), (0, 0), (2, 3), (0, 20), (-1, 0), (0.5, 1)]
+    expected = load_image("test_image_1.txt")
+    for seed_point in seed_points:
+        expected = fill(expected, seed_point)
+    test_12_filled = fill_many(load_image("test_image_1.txt"), seed_points)
+    assert test_12_filled == expected, "Test failed, Image filled incorrectly."
+    print("Test 12: Passed.")
+
+
+def test_fill_options():
+    # Diagonal gaps only let an 8-connected fill through.
+    print("Test 13: Fill with 4 and 8 connectivity.")
+    image = [[0, 1, 0],
+             [1, 0, 1],
+             [0, 1, 0]]
+    test_13_filled = fill([row[:] for row in image], (1, 1))
+    assert test_13_filled == [[0, 1, 0], [1, 2, 1], [0, 1, 0]], "Test failed, Image filled incorrectly."
+    test_13_filled = fill([row[:] for row in image], (1, 1), connectivity=8)
+    assert test_13_filled == [[2, 1, 2], [1, 2, 1], [2, 1, 2]], "Test failed, Image filled incorrectly."
+    print("Test 13: Passed.")
+
+    # Several boundary values and a custom replacement.
+    print("Test 14: Fill every non-boundary pixel with a custom value.")
+    image = [[0, 4, 3, 0],
+             [2, 0, 3, 0],
+             [1, 1, 1, 0]]
+    test_14_filled = fill(image, (0, 0), target=None, replacement=5, boundary=(1, 3))
+    assert test_14_filled == [[5, 5, 3, 0], [5, 5, 3, 0], [1, 1, 1, 0]], "Test failed, Image filled incorrectly."
+    print("Test 14: Passed.")
+
+
+def test_parallel_fill():
+    # The tiled fill must give exactly the same result as the serial one.
+    print("Test 15: Fill the spiral image in parallel tiles.")
+    test_image_3_result = load_image("test_image_3_result.txt")
+    test_15_filled = parallel_fill(load_image("test_image_3.txt"), (2, 12), processes=2, tile_rows=3)
+    assert test_15_filled == test_image_3_result, "Test failed, Image filled incorrectly."
+    maze = [[int((row * 7 + col * 13) % 5 == 0) for col in range(40)] for row in range(40)]
+    for connectivity in (4, 8):
+        expected = fill([row[:] for row in maze], (0, 1), connectivity)
+        test_15_filled = parallel_fill([row[:] for row in maze], (0, 1), connectivity, processes=2, tile_rows=4)
+        assert test_15_filled == expected, "Test failed, Image filled incorrectly."
+    print("Test 15: Passed.")
+
+
+def test_render():
+    import io
+    # Streaming the image to a file must give the same text as stringify_image.
+    print("Test 16: Write an image row by row.")
+    test_image_3 = load_image("test_image_3.txt")
+    output = io.StringIO()
+    write_image(test_image_3, output)
+    assert output.getvalue() == stringify_image(test_image_3), "Test failed, Image written incorrectly."
+    assert stringify_image([[0, 1, 2, 7]]) == "+ - - - - +\n|   * 0 ? |\n+ - - - - +\n", "Test failed, Image rendered incorrectly."
+    print("Test 16: Passed.")
+
+    # Boundaries must survive downsampling.
+    print("Test 17: Downsample a large image.")
+    image = [[0] * 1000 for _ in range(1000)]
+    image[500][500] = 1
+    preview = preview_image(image, max_width=10, max_height=10)
+    assert len(preview) == 10 and len(preview[0]) == 10, "Test failed, preview has the wrong size."
+    assert preview[5][5] == 1 and sum(map(sum, preview)) == 1, "Test failed, preview lost the boundary."
+    print("Test 17: Passed.")
+
+
+def test_fill_session():
+    # Closing and reopening a gap must split and merge the filled region.
+    print("Test 18: Edit the boundaries of a filled image.")
+    image = [[0, 0, 1, 0, 0],
+             [0, 0, 1, 0, 0],
+             [0, 0, 0, 0, 0]]
+    session = FillSession(image, (0, 0))
+    assert image == [[2, 2, 1, 2, 2], [2, 2, 1, 2, 2], [2, 2, 2, 2, 2]], "Test failed, Image filled incorrectly."
+    session.add_boundary((2, 2))
+    assert image == [[2, 2, 1, 0, 0], [2, 2, 1, 0, 0], [2, 2, 1, 0, 0]], "Test failed, region not split."
+    session.remove_boundary((0, 2))
+    assert image == [[2, 2, 2, 2, 2], [2, 2, 1, 2, 2], [2, 2, 1, 2, 2]], "Test failed, regions not merged."
+    session.add_boundary((0, 0))
+    assert image == [[1, 0, 0, 0, 0], [0, 0, 1, 0, 0], [0, 0, 1, 0, 0]], "Test failed, seed point not cleared."
+    print("Test 18: Passed.")
+
+
+def test_benchmark():
+    # Every shape must produce a fillable image and a complete report.
+    print("Test 19: Run the benchmark on tiny images.")
+    results = run_benchmark(sizes=(100,), connectivities=(4, 8), repeat=1)
+    assert len(results) == 4 * 4, "Test failed, missing benchmark results."
+    assert all(result["peak_bytes"] >= 0 and result["seconds"] >= 0 for result in results), "Test failed, invalid result."
+    print("Test 19: Passed.")
+
+
+def test_region_stats():
+    # Statistics gathered during the fill must describe the filled region.
+    print("Test 20: Gather region statistics while filling.")
+    image = [[1, 1, 1, 1, 1],
+             [1, 0, 0, 1, 0],
+             [1, 0, 1, 1, 0],
+             [1, 1, 1, 0, 0]]
+    stats = fill_with_stats(image, (1, 1))
+    assert stats.pixel_count == 3 and stats.bounding_box == (1, 1, 2, 2), "Test failed, wrong region size."
+    assert stats.perimeter == 8 and not stats.touches_edge, "Test failed, wrong region shape."
+    stats = fill_with_stats(image, (3, 4))
+    assert stats.pixel_count == 4 and stats.perimeter == 10 and stats.touches_edge, "Test failed, wrong region shape."
+    assert fill_with_stats(image, (0, 0)).bounding_box is None, "Test failed, boundary seed filled."
+    print("Test 20: Passed.")
+
+
+def test_rle_fill():
+    # Run-length encoded images must fill like the nested list.
+    print("Test 21: Fill a run-length encoded image.")
+    image = load_image("data/snake.txt")
+    rle_image = load_rle_text("data/snake.txt")
+    assert rle_image.to_image() == image, "Test failed, wrong decoded image."
+    fill(image, (0, 0))
+    fill(rle_image, (0, 0))
+    assert rle_image.to_image() == image, "Test failed, wrong filled image."
+    assert stringify_image(rle_image) == stringify_image(image), "Test failed, wrong rendering."
+    with tempfile.TemporaryDirectory() as tmp_path:
+        rle_filename = f"{tmp_path}/test_image_1.rle"
+        save_rle(rle_image, rle_filename)
+        assert load_rle(rle_filename).to_image() == image, "Test failed, wrong saved image."
+    open_image = RLEImage.from_image([[0] * 1000 for _ in range(1000)])
+    fill(open_image, (500, 500), connectivity=8)
+    assert open_image.run_count() == 1000, "Test failed, runs not merged."
+    print("Test 21: Passed.")
+
+
+def test_batch_fill():
+    # Every file of a batch must be filled and written to its output.
+    print("Test 22: Fill a batch of image files.")
+    test_image_1_result = load_image("test_image_1_result.txt")
+    with tempfile.TemporaryDirectory() as tmp_path:
+        jobs = [("test_image_1.txt", (10, 1), f"{tmp_path}/filled_{index}.txt") for index in range(3)]
+        jobs.append((f"{tmp_path}/missing.txt", (0, 0), f"{tmp_path}/missing_filled.txt"))
+        results = list(run_batch(jobs, processes=1))
+        assert [result["error"] is None for result in results] == [True, True, True, False], "Test failed, wrong errors."
+        for index in range(3):
+            assert load_image(f"{tmp_path}/filled_{index}.txt") == test_image_1_result, "Test failed, Image filled incorrectly."
+    print("Test 22: Passed.")
+
+
+def test_fill_mask():
+    # A fill mask must leave the image unchanged and fill it when applied.
+    print("Test 23: Find the filled region as a mask.")
+    test_image_1 = load_image("test_image_1.txt")
+    test_image_1_result = load_image("test_image_1_result.txt")
+    mask = fill_mask(test_image_1, (10, 1))
+    assert test_image_1 == load_image("test_image_1.txt"), "Test failed, Image changed."
+    assert len(mask.bits) == len(test_image_1) * ((len(test_image_1[0]) + 7) // 8), "Test failed, mask too large."
+    assert (10, 1) in mask and (0, 3) not in mask, "Test failed, wrong mask."
+    assert apply_mask(test_image_1, mask) == test_image_1_result, "Test failed, Image filled incorrectly."
+    assert len(fill_mask(test_image_1, (0, 3))) == 0, "Test failed, boundary seed in mask."
+    print("Test 23: Passed.")
+
+
+def test_profile():
+    # A profile must record every phase and count the spans of the fill.
+    print("Test 24: Profile loading, filling and rendering.")
+    phases = []
+    profile = Profile(callback=lambda phase, seconds, profile: phases.append(phase))
+    test_image_1 = load_image("test_image_1.txt", profile=profile)
+    fill(test_image_1, (10, 1), profile=profile)
+    stringify_image(test_image_1, profile=profile)
+    assert phases == ["load_image", "fill", "stringify_image"], "Test failed, wrong phases."
+    filled = sum(row.count(2) for row in test_image_1)
+    assert profile.span_count > 0 and profile.pixels_visited >= filled, "Test failed, wrong counters."
+    assert fill(load_image("test_image_1.txt"), (10, 1)) == test_image_1, "Test failed, Image filled incorrectly."
+    print("Test 24: Passed.")
+
+
+def test_binary_close():
+    # Closing a memory-mapped raster must work while row views are still referenced.
+    print("Test 25: Close a memory-mapped raster after iterating its rows.")
+    with tempfile.TemporaryDirectory() as tmp_path:
+        binary_filename = f"{tmp_path}/test_image_1.bin"
+        text_to_binary("test_image_1.txt", binary_filename)
+        with load_binary(binary_filename) as test_image_1:
+            for row in test_image_1:
+                pass
+            first_row = test_image_1[0]
+        assert test_image_1.buffer.closed and test_image_1.owner.closed, "Test failed, file not closed."
+        try:
+            first_row.tolist()
+            released = False
+        except ValueError:
+            released = True
+        assert released, "Test failed, row view not released."
+    print("Test 25: Passed.")
+
+
+def test_array_regions():
+    if np is None:
+        print("Test 26: Skipped, NumPy is not installed.")
+        return
+    # Small and large regions of an array must be filled like the nested list.
+    print("Test 26: Fill small and large regions of a NumPy array image.")
+    checkerboard = [[(row + col) % 2 for col in range(200)] for row in range(200)]
+    for connectivity in (4, 8):
+        expected = fill([row[:] for row in checkerboard], (0, 0), connectivity)
+        test_26_filled = fill(image_to_array(checkerboard), (0, 0), connectivity)
+        assert array_to_image(test_26_filled) == expected, "Test failed, Image filled incorrectly."
+    print("Test 26: Passed.")
+
+
+def test_binary_conversion():
+    import os
+    # A failed conversion must leave the output file as it was.
+    print("Test 27: Convert invalid text and binary images.")
+    with tempfile.TemporaryDirectory() as tmp_path:
+        text_filename = f"{tmp_path}/uneven.txt"
+        binary_filename = f"{tmp_path}/uneven.bin"
+        with open(text_filename, "w") as textfile:
+            textfile.write("0 1 0\n0 1\n")
+        try:
+            text_to_binary(text_filename, binary_filename)
+            rejected = False
+        except ValueError:
+            rejected = True
+        assert rejected, "Test failed, uneven rows accepted."
+        assert os.listdir(tmp_path) == ["uneven.txt"], "Test failed, partial file left behind."
+
+        # A binary raster shorter or longer than its header says must be rejected.
+        binary_filename = f"{tmp_path}/test_image_1.bin"
+        text_to_binary("test_image_1.txt", binary_filename)
+        with open(binary_filename, "rb") as binaryfile:
+            binary = binaryfile.read()
+        for payload in (binary[:-1], binary + b"\x00"):
+            with open(binary_filename, "wb") as binaryfile:
+                binaryfile.write(payload)
+            try:
+                binary_to_text(binary_filename, f"{tmp_path}/test_image_1.txt")
+                rejected = False
+            except ValueError:
+                rejected = True
+            assert rejected, "Test failed, wrong payload length accepted."
+        assert sorted(os.listdir(tmp_path)) == ["test_image_1.bin", "uneven.txt"], "Test failed, partial file left behind."
+    print("Test 27: Passed.")
+
+
 
 
 if __name__ == '__main__':
     test_pattern()
+    test_large_region()
+    test_array_fill()
+    test_raster_fill()
+    test_binary_fill()
+    test_fill_many()
+    test_fill_options()
+    test_parallel_fill()
+    test_render()
+    test_fill_session()
+    test_benchmark()
+    test_region_stats()
+    test_rle_fill()
+    test_batch_fill()
+    test_fill_mask()
+    test_profile()
+    test_binary_close()
+    test_array_regions()
+    test_binary_conversion()
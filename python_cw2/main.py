@@ -1,21 +1,21 @@
 from network.path import PathFinder
-from tube.map import TubeMap
+from tube.snapshot import load_tubemap
 
 def get_tubemap():
-    """ Return an initialised TubeMap object
+    """ Return an initialised TubeMap object and its neighbour graph
+
+    Both are loaded from the snapshot, rebuilt if the JSON changed.
 
     Returns:
-        tube.map.TubeMap: Initialised TubeMap object
+        tuple[tube.map.TubeMap, dict]: Initialised TubeMap object and its neighbour graph
     """
-    tubemap = TubeMap()
-    tubemap.import_from_json("data/london.json")
-    return tubemap
+    return load_tubemap("data/london.json")
 
 
 def main():
-    tubemap = get_tubemap()
+    tubemap, graph = get_tubemap()
     
-    path_finder = PathFinder(tubemap)
+    path_finder = PathFinder(tubemap, graph)
 
     # Examples usage of path_finder
     stations = path_finder.get_shortest_path('Stockwell', 'Ealing Broadway')
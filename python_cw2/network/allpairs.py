@@ -0,0 +1,264 @@
+import functools
+import json
+import multiprocessing
+import struct
+import sys
+from array import array
+
+# Header of the saved tables: magic, format version, number of stations, length of the station ids.
+TABLE_HEADER = struct.Struct("<4sIII")
+TABLE_MAGIC = b"APSP"
+TABLE_VERSION = 1
+# Duration stored for stations that cannot be reached.
+UNREACHABLE = -1
+
+
+def _source_rows(csr, source):
+    """
+    Runs Dijkstra from one station and packs its results as table rows.
+
+    Args:
+        csr (CSRGraph) : the network.
+        source (int) : index of the starting station.
+
+    Returns:
+        tuple[array[int], array[int]] : duration to each station (UNREACHABLE if
+            it cannot be reached) and the previous station on its path (-1 for none).
+    """
+    duration, previous = csr.dijkstra(source)
+    durations = array("i", (UNREACHABLE if time == float('inf') else time for time in duration))
+    return durations, previous
+
+
+def _path_from_rows(previous, source, target, row=0):
+    """
+    Follows the previous stations of one source's row back from a target.
+
+    Args:
+        previous (array[int]) : previous station of each station, for the source.
+        source (int) : index of the starting station.
+        target (int) : index of the end station.
+        row (int) : position of the source's row in previous, when it holds
+            the rows of every source. Defaults to 0.
+
+    Returns:
+        list[int] : indices of the stations from source to target, or None if target cannot be reached.
+    """
+    path = [target]
+    while(path[-1] != source):
+        station = previous[row + path[-1]]
+        if(station < 0):
+            return None
+        path.append(station)
+    path.reverse()
+    return path
+
+
+# Network of the worker processes, set once per process by _initialise_worker.
+_worker_csr = None
+
+
+def _initialise_worker(csr):
+    global _worker_csr
+    _worker_csr = csr
+
+
+def _worker_rows(source):
+    durations, previous = _source_rows(_worker_csr, source)
+    return durations.tobytes(), previous.tobytes()
+
+
+class AllPairsTable:
+    """
+    Precomputed shortest durations and paths between every pair of stations.
+
+    For n stations, durations[source * n + target] is the shortest duration from
+    source to target and next_hop[source * n + target] is the station before
+    target on that path, that is the next hop from target back towards source.
+    A path is read by following next hops from the target, so each query costs
+    O(path length), and the paths are the same as CSRGraph.dijkstra's.
+    """
+
+    def __init__(self, station_ids, durations, next_hop):
+        """
+        Args:
+            station_ids (list[str]) : id of the station at each index, as in the CSRGraph.
+            durations (array[int]) : n * n shortest durations, UNREACHABLE if there is no path.
+            next_hop (array[int]) : n * n next hops back towards the source, -1 if none.
+        """
+        self.station_ids = station_ids
+        self.station_count = len(station_ids)
+        self.durations = durations
+        self.next_hop = next_hop
+
+    @classmethod
+    def compute(cls, csr, processes=None):
+        """
+        Computes the table by running Dijkstra from every station, across a pool of processes.
+
+        Args:
+            csr (CSRGraph) : the network.
+            processes (int) : number of worker processes, 1 to compute in this
+                process. Defaults to the number of CPUs.
+
+        Returns:
+            table (AllPairsTable) : the computed table.
+        """
+        station_count = csr.station_count
+        durations = array("i")
+        next_hop = array("i")
+        processes = processes or multiprocessing.cpu_count()
+        if(processes == 1):
+            for source in range(station_count):
+                source_durations, previous = _source_rows(csr, source)
+                durations.extend(source_durations)
+                next_hop.extend(previous)
+        else:
+            with multiprocessing.Pool(processes, initializer=_initialise_worker, initargs=(csr,)) as pool:
+                # Rows come back in order of source, a few at a time.
+                chunk_size = max(station_count // (8 * processes), 1)
+                for duration_bytes, previous_bytes in pool.imap(_worker_rows, range(station_count), chunk_size):
+                    durations.frombytes(duration_bytes)
+                    next_hop.frombytes(previous_bytes)
+        return cls(list(csr.station_ids), durations, next_hop)
+
+    def duration(self, source, target):
+        """
+        Args:
+            source (int) : index of the starting station.
+            target (int) : index of the end station.
+
+        Returns:
+            duration (int) : shortest duration from source to target, or None if target cannot be reached.
+        """
+        duration = self.durations[source * self.station_count + target]
+        return None if duration == UNREACHABLE else duration
+
+    def path(self, source, target):
+        """
+        Args:
+            source (int) : index of the starting station.
+            target (int) : index of the end station.
+
+        Returns:
+            list[int] : indices of the stations of the shortest path, or None if target cannot be reached.
+        """
+        return _path_from_rows(self.next_hop, source, target, source * self.station_count)
+
+    def save(self, filename):
+        """
+        Saves the table, with its durations and next hops as 32-bit little-endian integers.
+
+        Args:
+            filename (str) : path of the file to write.
+        """
+        station_ids = json.dumps(self.station_ids).encode("utf-8")
+        with open(filename, "wb") as tablefile:
+            tablefile.write(TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, self.station_count, len(station_ids)))
+            tablefile.write(station_ids)
+            for values in (self.durations, self.next_hop):
+                if(sys.byteorder == "big"):
+                    values = array("i", values)
+                    values.byteswap()
+                tablefile.write(values.tobytes())
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Loads a table saved by save().
+
+        Args:
+            filename (str) : path of the file to read.
+
+        Returns:
+            table (AllPairsTable) : the loaded table.
+
+        Raises:
+            ValueError if the file is not a saved table.
+        """
+        with open(filename, "rb") as tablefile:
+            header = tablefile.read(TABLE_HEADER.size)
+            if(len(header) < TABLE_HEADER.size):
+                raise ValueError(f"'{filename}' is not an all-pairs table")
+            magic, version, station_count, ids_length = TABLE_HEADER.unpack(header)
+            if(magic != TABLE_MAGIC or version != TABLE_VERSION):
+                raise ValueError(f"'{filename}' is not an all-pairs table of version {TABLE_VERSION}")
+            station_ids = json.loads(tablefile.read(ids_length).decode("utf-8"))
+            tables = []
+            for _ in range(2):
+                values = array("i")
+                values.frombytes(tablefile.read(4 * station_count * station_count))
+                if(sys.byteorder == "big"):
+                    values.byteswap()
+                tables.append(values)
+        if(len(station_ids) != station_count or any(len(values) != station_count ** 2 for values in tables)):
+            raise ValueError(f"'{filename}' is truncated")
+        return cls(station_ids, *tables)
+
+
+class LazyPathTable:
+    """
+    The queries of AllPairsTable, computed on demand one source station at a time.
+
+    The rows of the most recently used sources are kept in an LRU cache, so
+    memory is bounded by maxsize rows instead of the whole n * n table.
+    """
+
+    def __init__(self, csr, maxsize=256):
+        """
+        Args:
+            csr (CSRGraph) : the network.
+            maxsize (int) : number of source stations whose rows are kept. Defaults to 256.
+        """
+        self.csr = csr
+        self.station_ids = csr.station_ids
+        self.station_count = csr.station_count
+        self.rows = functools.lru_cache(maxsize=maxsize)(functools.partial(_source_rows, csr))
+
+    def duration(self, source, target):
+        """ As AllPairsTable.duration. """
+        duration = self.rows(source)[0][target]
+        return None if duration == UNREACHABLE else duration
+
+    def path(self, source, target):
+        """ As AllPairsTable.path. """
+        return _path_from_rows(self.rows(source)[1], source, target)
+
+
+def test_all_pairs():
+    import os
+    import tempfile
+    import time
+
+    from tube.map import TubeMap
+    from network.csr import CSRGraph
+
+    tubemap = TubeMap()
+    tubemap.import_from_json("data/london.json")
+    csr = CSRGraph.from_tubemap(tubemap)
+
+    start = time.perf_counter()
+    table = AllPairsTable.compute(csr, processes=2)
+    print(f"computed {csr.station_count}x{csr.station_count} table in {time.perf_counter() - start:.2f} s")
+    lazy_table = LazyPathTable(csr, maxsize=16)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "london.apsp")
+        table.save(filename)
+        loaded_table = AllPairsTable.load(filename)
+
+    for source in range(0, csr.station_count, 7):
+        duration, previous = csr.dijkstra(source)
+        for target in range(csr.station_count):
+            expected_path = csr.path_to(previous, source, target)
+            assert loaded_table.path(source, target) == expected_path
+            assert lazy_table.path(source, target) == expected_path
+            assert loaded_table.duration(source, target) == duration[target]
+
+    source, target = csr.index['245'], csr.index['236']
+    print([tubemap.stations[csr.station_ids[station]].name for station in table.path(source, target)])
+    print(f"{table.duration(source, target)} minutes")
+
+
+if __name__ == "__main__":
+    test_all_pairs()
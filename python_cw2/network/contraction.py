@@ -0,0 +1,346 @@
+import heapq
+import json
+import struct
+import sys
+from array import array
+
+# Header of the saved hierarchies: magic, format version, number of stations,
+# number of upward edges and length of the station ids.
+HIERARCHY_HEADER = struct.Struct("<4sIIII")
+HIERARCHY_MAGIC = b"CHRT"
+HIERARCHY_VERSION = 1
+# Most stations a witness search may check before giving up and adding the shortcut.
+WITNESS_SEARCH_LIMIT = 200
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy of a tube network, for fast point-to-point queries.
+
+    Stations are contracted one at a time, least important first: each is
+    removed from the graph and, for every pair of its neighbours whose only
+    shortest path ran through it, a shortcut connection is added. A query then
+    runs a Dijkstra search from both ends that only ever goes up to more
+    important stations, which checks a small part of the network, and
+    unpacks the shortcuts of the path found into the original stations.
+
+    The upward connections are held in CSR form: the connections of station i
+    to more important stations are up_targets[up_offsets[i]:up_offsets[i + 1]],
+    with their durations in up_weights and, for shortcuts, the station they
+    skip in up_middles (-1 for original connections).
+    """
+
+    def __init__(self, station_ids, ranks, up_offsets, up_targets, up_weights, up_middles):
+        """
+        Args:
+            station_ids (list[str]) : id of the station at each index, as in the CSRGraph.
+            ranks (array[int]) : order in which each station was contracted.
+            up_offsets (array[int]) : start of each station's upward connections, plus the total at the end.
+            up_targets (array[int]) : station reached by each upward connection.
+            up_weights (array[int]) : duration of each upward connection.
+            up_middles (array[int]) : station skipped by each shortcut, -1 for original connections.
+        """
+        self.station_ids = station_ids
+        self.station_count = len(station_ids)
+        self.ranks = ranks
+        self.up_offsets = up_offsets
+        self.up_targets = up_targets
+        self.up_weights = up_weights
+        self.up_middles = up_middles
+        # Station skipped by the connection between each pair of stations, to unpack paths.
+        self.middles = {}
+        for station in range(self.station_count):
+            for edge in range(up_offsets[station], up_offsets[station + 1]):
+                self.middles[(station, up_targets[edge])] = up_middles[edge]
+
+    @classmethod
+    def build(cls, csr):
+        """
+        Contracts every station of a network.
+
+        Stations are picked by their edge difference (shortcuts added minus
+        connections removed) plus the number of their neighbours already
+        contracted, which spreads the contraction evenly over the network.
+        Priorities are updated lazily, when a station reaches the top of the heap.
+
+        Args:
+            csr (CSRGraph) : the network.
+
+        Returns:
+            hierarchy (ContractionHierarchy) : the contracted network.
+        """
+        station_count = csr.station_count
+        # Remaining graph: duration and skipped station of each connection, by neighbour.
+        remaining = [dict() for _ in range(station_count)]
+        for station in range(station_count):
+            for neighbour, time in csr.neighbours_of(station):
+                if(neighbour != station and time < remaining[station].get(neighbour, (float('inf'),))[0]):
+                    remaining[station][neighbour] = (time, -1)
+                    remaining[neighbour][station] = (time, -1)
+        contracted_neighbours = [0] * station_count
+        ranks = array("i", [-1]) * station_count
+        upward = [None] * station_count
+
+        def priority(station):
+            shortcuts = _shortcuts(remaining, station)
+            return len(shortcuts) - len(remaining[station]) + contracted_neighbours[station]
+
+        heap = [(priority(station), station) for station in range(station_count)]
+        heapq.heapify(heap)
+        rank = 0
+        while(heap):
+            _, station = heapq.heappop(heap)
+            if(ranks[station] >= 0):
+                continue
+            # Priorities go stale as neighbours are contracted, recompute before contracting.
+            current_priority = priority(station)
+            if(heap and current_priority > heap[0][0]):
+                heapq.heappush(heap, (current_priority, station))
+                continue
+            ranks[station] = rank
+            rank += 1
+            upward[station] = sorted(remaining[station].items())
+            for neighbour_1, neighbour_2, time in _shortcuts(remaining, station):
+                if(time < remaining[neighbour_1].get(neighbour_2, (float('inf'),))[0]):
+                    remaining[neighbour_1][neighbour_2] = (time, station)
+                    remaining[neighbour_2][neighbour_1] = (time, station)
+            for neighbour in remaining[station]:
+                del remaining[neighbour][station]
+                contracted_neighbours[neighbour] += 1
+            remaining[station] = {}
+
+        up_offsets = array("i", [0])
+        up_targets = array("i")
+        up_weights = array("i")
+        up_middles = array("i")
+        for station in range(station_count):
+            for neighbour, (time, middle) in upward[station]:
+                up_targets.append(neighbour)
+                up_weights.append(time)
+                up_middles.append(middle)
+            up_offsets.append(len(up_targets))
+        return cls(list(csr.station_ids), ranks, up_offsets, up_targets, up_weights, up_middles)
+
+    def query(self, source, target):
+        """
+        Finds a shortest path between two stations.
+
+        Args:
+            source (int) : index of the starting station.
+            target (int) : index of the end station.
+
+        Returns:
+            tuple[int, list[int]] : shortest duration and indices of the stations
+                of the path, both None if target cannot be reached.
+        """
+        if(source == target):
+            return 0, [source]
+        up_offsets, up_targets, up_weights = self.up_offsets, self.up_targets, self.up_weights
+        durations = ({source: 0}, {target: 0})
+        previous = ({source: -1}, {target: -1})
+        heaps = ([(0, source)], [(0, target)])
+        best_duration = float('inf')
+        meeting_station = -1
+        while(heaps[0] or heaps[1]):
+            for side in (0, 1):
+                heap = heaps[side]
+                # A side stops once nothing it can reach is shorter than the best path.
+                if(not heap or heap[0][0] >= best_duration):
+                    heap.clear()
+                    continue
+                current_duration, current = heapq.heappop(heap)
+                side_durations = durations[side]
+                if(current_duration > side_durations[current]):
+                    continue
+                other_duration = durations[1 - side].get(current)
+                if(other_duration is not None and current_duration + other_duration < best_duration):
+                    best_duration = current_duration + other_duration
+                    meeting_station = current
+                for edge in range(up_offsets[current], up_offsets[current + 1]):
+                    neighbour = up_targets[edge]
+                    neighbour_duration = current_duration + up_weights[edge]
+                    if(neighbour_duration < side_durations.get(neighbour, float('inf'))):
+                        side_durations[neighbour] = neighbour_duration
+                        previous[side][neighbour] = current
+                        heapq.heappush(heap, (neighbour_duration, neighbour))
+        if(meeting_station < 0):
+            return None, None
+
+        # Join the upward paths from both ends at the meeting station, then unpack the shortcuts.
+        forward = [meeting_station]
+        while(forward[-1] != source):
+            forward.append(previous[0][forward[-1]])
+        forward.reverse()
+        backward = [meeting_station]
+        while(backward[-1] != target):
+            backward.append(previous[1][backward[-1]])
+        stations = forward + backward[1:]
+        path = [source]
+        for station_1, station_2 in zip(stations, stations[1:]):
+            path.extend(self._unpack(station_1, station_2))
+        return best_duration, path
+
+    def _unpack(self, station_1, station_2):
+        """
+        Replaces a connection, possibly a shortcut, by the original stations it goes through.
+
+        Args:
+            station_1 (int) : index of the first station of the connection.
+            station_2 (int) : index of the second station of the connection.
+
+        Returns:
+            list[int] : the stations after station_1, up to and including station_2.
+        """
+        stations = []
+        stack = [(station_1, station_2)]
+        while(stack):
+            first, second = stack.pop()
+            # Connections are stored from the less important station.
+            key = (first, second) if self.ranks[first] < self.ranks[second] else (second, first)
+            middle = self.middles[key]
+            if(middle < 0):
+                stations.append(second)
+            else:
+                # Unpack the second half after the first one.
+                stack.append((middle, second))
+                stack.append((first, middle))
+        return stations
+
+    def save(self, filename):
+        """
+        Saves the hierarchy, with its arrays as 32-bit little-endian integers.
+
+        Args:
+            filename (str) : path of the file to write.
+        """
+        station_ids = json.dumps(self.station_ids).encode("utf-8")
+        with open(filename, "wb") as hierarchyfile:
+            hierarchyfile.write(HIERARCHY_HEADER.pack(HIERARCHY_MAGIC, HIERARCHY_VERSION, self.station_count,
+                                                      len(self.up_targets), len(station_ids)))
+            hierarchyfile.write(station_ids)
+            for values in (self.ranks, self.up_offsets, self.up_targets, self.up_weights, self.up_middles):
+                if(sys.byteorder == "big"):
+                    values = array("i", values)
+                    values.byteswap()
+                hierarchyfile.write(values.tobytes())
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Loads a hierarchy saved by save().
+
+        Args:
+            filename (str) : path of the file to read.
+
+        Returns:
+            hierarchy (ContractionHierarchy) : the loaded hierarchy.
+
+        Raises:
+            ValueError if the file is not a saved hierarchy.
+        """
+        with open(filename, "rb") as hierarchyfile:
+            header = hierarchyfile.read(HIERARCHY_HEADER.size)
+            if(len(header) < HIERARCHY_HEADER.size):
+                raise ValueError(f"'{filename}' is not a contraction hierarchy")
+            magic, version, station_count, edge_count, ids_length = HIERARCHY_HEADER.unpack(header)
+            if(magic != HIERARCHY_MAGIC or version != HIERARCHY_VERSION):
+                raise ValueError(f"'{filename}' is not a contraction hierarchy of version {HIERARCHY_VERSION}")
+            station_ids = json.loads(hierarchyfile.read(ids_length).decode("utf-8"))
+            arrays = []
+            for length in (station_count, station_count + 1, edge_count, edge_count, edge_count):
+                values = array("i")
+                values.frombytes(hierarchyfile.read(4 * length))
+                if(sys.byteorder == "big"):
+                    values.byteswap()
+                if(len(values) != length):
+                    raise ValueError(f"'{filename}' is truncated")
+                arrays.append(values)
+        return cls(station_ids, *arrays)
+
+
+def _shortcuts(remaining, station):
+    """
+    Finds the shortcuts needed to contract a station.
+
+    For each pair of neighbours, a witness search looks for a path between
+    them that avoids the station and is no longer than the path through it.
+    Searches give up after WITNESS_SEARCH_LIMIT stations, adding a shortcut
+    that may not be needed, which keeps queries correct.
+
+    Args:
+        remaining (list[dict]) : remaining graph, duration and skipped station of each connection by neighbour.
+        station (int) : index of the station to contract.
+
+    Returns:
+        list[tuple[int, int, int]] : the two neighbours and duration of each shortcut.
+    """
+    neighbours = sorted(remaining[station].items())
+    shortcuts = []
+    for position, (neighbour_1, (time_1, _)) in enumerate(neighbours):
+        targets = {neighbour_2: time_1 + time_2 for neighbour_2, (time_2, _) in neighbours[position + 1:]}
+        if(not targets):
+            continue
+        max_duration = max(targets.values())
+        # Dijkstra from the first neighbour, avoiding the contracted station.
+        durations = {neighbour_1: 0}
+        heap = [(0, neighbour_1)]
+        checked = 0
+        while(heap and checked < WITNESS_SEARCH_LIMIT):
+            current_duration, current = heapq.heappop(heap)
+            if(current_duration > durations[current]):
+                continue
+            if(current_duration > max_duration):
+                break
+            checked += 1
+            for neighbour, (time, _) in remaining[current].items():
+                if(neighbour == station):
+                    continue
+                neighbour_duration = current_duration + time
+                if(neighbour_duration < durations.get(neighbour, float('inf'))):
+                    durations[neighbour] = neighbour_duration
+                    heapq.heappush(heap, (neighbour_duration, neighbour))
+        for neighbour_2, via_duration in targets.items():
+            if(durations.get(neighbour_2, float('inf')) > via_duration):
+                shortcuts.append((neighbour_1, neighbour_2, via_duration))
+    return shortcuts
+
+
+def test_contraction():
+    import os
+    import tempfile
+    import time
+
+    from tube.map import TubeMap
+    from network.csr import CSRGraph
+
+    tubemap = TubeMap()
+    tubemap.import_from_json("data/london.json")
+    csr = CSRGraph.from_tubemap(tubemap)
+
+    start = time.perf_counter()
+    hierarchy = ContractionHierarchy.build(csr)
+    print(f"contracted {csr.station_count} stations in {time.perf_counter() - start:.2f} s, "
+          f"{len(hierarchy.up_targets)} upward connections")
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "london.ch")
+        hierarchy.save(filename)
+        hierarchy = ContractionHierarchy.load(filename)
+
+    # Every query must find a path as short as Dijkstra's, made of real connections.
+    query_time = 0.0
+    for source in range(csr.station_count):
+        durations, _ = csr.dijkstra(source)
+        for target in range(csr.station_count):
+            start = time.perf_counter()
+            duration, path = hierarchy.query(source, target)
+            query_time += time.perf_counter() - start
+            assert duration == durations[target]
+            assert path[0] == source and path[-1] == target
+            assert sum(dict(csr.neighbours_of(station_1))[station_2]
+                       for station_1, station_2 in zip(path, path[1:])) == duration
+    print(f"{query_time / csr.station_count ** 2 * 1e6:.0f} us per query")
+
+
+if __name__ == "__main__":
+    test_contraction()
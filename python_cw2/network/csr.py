@@ -0,0 +1,282 @@
+import heapq
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from network.graph import NeighbourGraphBuilder
+
+
+class CSRGraph:
+    """
+    Compressed sparse row (CSR) adjacency of a tube map.
+
+    Stations are numbered 0 to station_count - 1 in the order of the tube map's
+    station dictionary. The neighbours of station i are neighbours[offsets[i]:offsets[i + 1]],
+    and weights holds the time of the shortest connection to each of them, so
+    algorithms walk flat integer arrays instead of nested dictionaries of Connections.
+    """
+
+    def __init__(self, station_ids, offsets, neighbours, weights):
+        """
+        Args:
+            station_ids (list[str]) : id of the station at each index.
+            offsets (array[int]) : start of each station's neighbours, plus the total at the end.
+            neighbours (array[int]) : index of each neighbour, station by station.
+            weights (array[int]) : shortest connection time to each neighbour.
+        """
+        self.station_ids = station_ids
+        self.index = {station_id: index for index, station_id in enumerate(station_ids)}
+        self.offsets = offsets
+        self.neighbours = neighbours
+        self.weights = weights
+
+    @classmethod
+    def from_graph(cls, graph):
+        """ Converts a neighbour graph built by NeighbourGraphBuilder.
+
+        Args:
+            graph (dict) : neighbour graph, as returned by NeighbourGraphBuilder.build.
+
+        Returns:
+            csr (CSRGraph) : the same graph in CSR form.
+        """
+        station_ids = list(graph.keys())
+        index = {station_id: position for position, station_id in enumerate(station_ids)}
+        offsets = array("i", [0])
+        neighbours = array("i")
+        weights = array("i")
+        for station_id in station_ids:
+            for neighbour_station_id, connections in graph[station_id].items():
+                neighbours.append(index[neighbour_station_id])
+                weights.append(min(connection.time for connection in connections))
+            offsets.append(len(neighbours))
+        return cls(station_ids, offsets, neighbours, weights)
+
+    @classmethod
+    def from_tubemap(cls, tubemap):
+        """ Builds the CSR graph of a tube map.
+
+        Args:
+            tubemap (TubeMap) : tube map serving as a reference for building the graph.
+
+        Returns:
+            csr (CSRGraph) : the graph of the tube map in CSR form.
+        """
+        return cls.from_graph(NeighbourGraphBuilder().build(tubemap))
+
+    @property
+    def station_count(self):
+        return len(self.station_ids)
+
+    def neighbours_of(self, station):
+        """ Lists the neighbours of a station.
+
+        Args:
+            station (int) : index of the station.
+
+        Returns:
+            list[tuple[int, int]] : index of each neighbour and shortest time to it.
+        """
+        start, end = self.offsets[station], self.offsets[station + 1]
+        return list(zip(self.neighbours[start:end], self.weights[start:end]))
+
+    def as_numpy(self):
+        """ Views the CSR arrays as NumPy arrays, without copying them.
+
+        Returns:
+            tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray] : offsets, neighbours and weights.
+        """
+        if(np is None):
+            raise ImportError("NumPy is required for CSRGraph.as_numpy()")
+        return (np.frombuffer(self.offsets, dtype=np.intc), np.frombuffer(self.neighbours, dtype=np.intc),
+                np.frombuffer(self.weights, dtype=np.intc))
+
+    def dijkstra(self, source, target=None):
+        """ Finds the shortest durations from a station with Dijkstra's algorithm.
+
+        Stations at equal duration are checked in index order, so the paths
+        found are the same as PathFinder's on the neighbour graph.
+
+        Args:
+            source (int) : index of the starting station.
+            target (int) : index of a station at which to stop, once its path is
+                known. Defaults to None, finding the paths to every station.
+
+        Returns:
+            tuple[list[float], array[int]] : duration from the source to each station
+                (infinity if unreachable or not reached before the target), and the
+                previous station on its path (-1 for the source and unreached stations).
+        """
+        offsets, neighbours, weights = self.offsets, self.neighbours, self.weights
+        duration = [float('inf')] * self.station_count
+        previous = array("i", [-1]) * self.station_count
+        checked = bytearray(self.station_count)
+        duration[source] = 0
+        heap = [(0, source)]
+        while(heap):
+            current_duration, current = heapq.heappop(heap)
+            if(checked[current]):
+                continue
+            checked[current] = 1
+            if(current == target):
+                break
+            for edge in range(offsets[current], offsets[current + 1]):
+                neighbour = neighbours[edge]
+                if(checked[neighbour]):
+                    continue
+                neighbour_duration = current_duration + weights[edge]
+                if(neighbour_duration < duration[neighbour]):
+                    duration[neighbour] = neighbour_duration
+                    previous[neighbour] = current
+                    heapq.heappush(heap, (neighbour_duration, neighbour))
+        return duration, previous
+
+    def astar(self, source, target, estimates):
+        """ Finds a shortest path between two stations with the A* algorithm.
+
+        Stations are checked in order of their duration from the source plus
+        their estimated duration to the target, so that stations leading away
+        from the target are rarely checked. The path is a shortest one as long
+        as estimates never overestimate and are consistent along connections.
+
+        Args:
+            source (int) : index of the starting station.
+            target (int) : index of the end station.
+            estimates (list[float]) : lower bound on the duration from each station index to the target.
+
+        Returns:
+            tuple[int, list[int], int] : shortest duration, indices of the stations
+                of the path (both None if target cannot be reached) and number of
+                stations checked.
+        """
+        offsets, neighbours, weights = self.offsets, self.neighbours, self.weights
+        duration = [float('inf')] * self.station_count
+        previous = array("i", [-1]) * self.station_count
+        checked = bytearray(self.station_count)
+        checked_count = 0
+        duration[source] = 0
+        heap = [(estimates[source], source)]
+        while(heap):
+            current = heapq.heappop(heap)[1]
+            if(checked[current]):
+                continue
+            checked[current] = 1
+            checked_count += 1
+            # The first entry popped for a station holds its current, and final, duration.
+            current_duration = duration[current]
+            if(current == target):
+                return current_duration, self.path_to(previous, source, target), checked_count
+            for edge in range(offsets[current], offsets[current + 1]):
+                neighbour = neighbours[edge]
+                if(checked[neighbour]):
+                    continue
+                neighbour_duration = current_duration + weights[edge]
+                if(neighbour_duration < duration[neighbour]):
+                    duration[neighbour] = neighbour_duration
+                    previous[neighbour] = current
+                    heapq.heappush(heap, (neighbour_duration + estimates[neighbour], neighbour))
+        return None, None, checked_count
+
+    def bidirectional_dijkstra(self, source, target):
+        """ Finds a shortest path between two stations by searching from both ends at once.
+
+        A forward search from the source and a backward search from the target
+        (connections work both ways) take turns, the one with fewer stations
+        waiting going next. The search stops once the durations at the top of
+        both heaps add up to at least the best path found through a station
+        reached by both, which then is a shortest path.
+
+        Args:
+            source (int) : index of the starting station.
+            target (int) : index of the end station.
+
+        Returns:
+            tuple[int, list[int], int] : shortest duration, indices of the stations
+                of the path (both None if target cannot be reached) and number of
+                stations checked.
+        """
+        if(source == target):
+            return 0, [source], 1
+        offsets, neighbours, weights = self.offsets, self.neighbours, self.weights
+        durations = ([float('inf')] * self.station_count, [float('inf')] * self.station_count)
+        previous = (array("i", [-1]) * self.station_count, array("i", [-1]) * self.station_count)
+        checked = (bytearray(self.station_count), bytearray(self.station_count))
+        durations[0][source] = 0
+        durations[1][target] = 0
+        heaps = ([(0, source)], [(0, target)])
+        best_duration = float('inf')
+        meeting_station = -1
+        checked_count = 0
+        while(heaps[0] and heaps[1]):
+            if(heaps[0][0][0] + heaps[1][0][0] >= best_duration):
+                break
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            side_durations, other_durations = durations[side], durations[1 - side]
+            current_duration, current = heapq.heappop(heaps[side])
+            if(checked[side][current]):
+                continue
+            checked[side][current] = 1
+            checked_count += 1
+            for edge in range(offsets[current], offsets[current + 1]):
+                neighbour = neighbours[edge]
+                neighbour_duration = current_duration + weights[edge]
+                if(neighbour_duration < side_durations[neighbour]):
+                    side_durations[neighbour] = neighbour_duration
+                    previous[side][neighbour] = current
+                    heapq.heappush(heaps[side], (neighbour_duration, neighbour))
+                # Keep the best path through a station reached from both ends.
+                if(side_durations[neighbour] + other_durations[neighbour] < best_duration):
+                    best_duration = side_durations[neighbour] + other_durations[neighbour]
+                    meeting_station = neighbour
+        if(meeting_station < 0):
+            return None, None, checked_count
+        path = self.path_to(previous[0], source, meeting_station)
+        backward_path = self.path_to(previous[1], target, meeting_station)
+        path.extend(reversed(backward_path[:-1]))
+        return best_duration, path, checked_count
+
+    def path_to(self, previous, source, target):
+        """ Follows the previous stations back from a target to the source.
+
+        Args:
+            previous (array[int]) : previous station of each station, as returned by dijkstra.
+            source (int) : index of the starting station.
+            target (int) : index of the end station.
+
+        Returns:
+            list[int] : indices of the stations from source to target, or None if target was not reached.
+        """
+        path = [target]
+        while(path[-1] != source):
+            if(previous[path[-1]] < 0):
+                return None
+            path.append(previous[path[-1]])
+        path.reverse()
+        return path
+
+
+def test_csr():
+    from tube.map import TubeMap
+    tubemap = TubeMap()
+    tubemap.import_from_json("data/london.json")
+
+    csr = CSRGraph.from_tubemap(tubemap)
+    print(f"{csr.station_count} stations, {len(csr.neighbours)} neighbour entries")
+
+    # Hammersmith's neighbours, with the shortest time to each.
+    hammersmith = csr.index['110']
+    neighbours = {csr.station_ids[neighbour]: time for neighbour, time in csr.neighbours_of(hammersmith)}
+    print(neighbours)
+    assert neighbours == {'17': 1, '209': 2, '101': 2, '265': 2}
+
+    _, previous = csr.dijkstra(csr.index['245'])
+    path = csr.path_to(previous, csr.index['245'], csr.index['236'])
+    assert [tubemap.stations[csr.station_ids[station]].name for station in path] == [
+        "Stockwell", "Vauxhall", "Pimlico", "Victoria", "Sloane Square", "South Kensington"]
+
+
+if __name__ == "__main__":
+    test_csr()
@@ -12,6 +12,9 @@ class NeighbourGraphBuilder:
     def build(self, tubemap):
         """ Builds a graph encoding neighbouring connections between stations.
 
+        The graph is built in a single pass over the connections, so the time
+        taken grows linearly with the size of the network.
+
         ----------------------------------------------
 
         The returned graph should be a dictionary having the following form:
@@ -75,27 +78,24 @@ class NeighbourGraphBuilder:
         # Check for valid argument.
         if(not isinstance(tubemap, TubeMap)):
             return graph
-        # Iterate through stations to find their neighbours.
+        # Every station gets an entry, even those without connections.
         for station_id in tubemap.stations.keys():
-            station_neighbours_dict = dict()
-            # Iterate through tubemap connections to find ones including current station.
-            for connection in tubemap.connections:
-                # Create list of the station ids for current connection.
-                connection_ids = []
-                for station in connection.stations:
-                    connection_ids.append(station.id)
-                # Check if the current station is in the connection.
-                if(station_id in connection_ids):
-                    # Remove the current station leaving just the neighbouring station.
-                    connection_ids.remove(station_id)
-                    neighbour_station_id = connection_ids[0]
-                    # Add the connection to the graph. Check if the neighbour station has already been added due to another connection.
-                    if(neighbour_station_id in station_neighbours_dict.keys()):
-                        station_neighbours_dict[neighbour_station_id].append(connection)
-                    else:
-                        station_neighbours_dict[neighbour_station_id] = [connection]
-            # Add the station neighbour connections to the graph.
-            graph[station_id] = station_neighbours_dict
+            graph[station_id] = dict()
+        # Add each connection to both of its stations in a single pass.
+        for connection in tubemap.connections:
+            connection_ids = [station.id for station in connection.stations]
+            if(len(connection_ids) != 2):
+                continue
+            for station_id, neighbour_station_id in (connection_ids, connection_ids[::-1]):
+                # Connections to stations outside the tube map are ignored.
+                if(station_id not in graph or neighbour_station_id not in graph):
+                    break
+                # Check if the neighbour station has already been added due to another connection.
+                station_neighbours_dict = graph[station_id]
+                if(neighbour_station_id in station_neighbours_dict):
+                    station_neighbours_dict[neighbour_station_id].append(connection)
+                else:
+                    station_neighbours_dict[neighbour_station_id] = [connection]
         return graph
 
 
@@ -110,5 +110,77 @@ def test_graph():
     print(graph['110'])
 
 
+def synthetic_tubemap(station_count, line_count=10, seed=0):
+    """ Generates a random tube map of the requested size, for benchmarks.
+
+    Each line runs through a random sequence of stations, so the network has
+    about as many connections as stations, like the London map.
+
+    Args:
+        station_count (int) : number of stations.
+        line_count (int) : number of lines. Defaults to 10.
+        seed (int) : seed of the random generator. Defaults to 0.
+
+    Returns:
+        tubemap (TubeMap) : the generated tube map.
+    """
+    import random
+    from tube.components import Station, Line, Connection
+
+    rng = random.Random(seed)
+    tubemap = TubeMap()
+    for index in range(station_count):
+        station = Station(str(index), f"Station {index}", {index % 9 + 1})
+        tubemap.stations[station.id] = station
+    stations = list(tubemap.stations.values())
+    for index in range(line_count):
+        line = Line(str(index), f"Line {index}")
+        tubemap.lines[line.id] = line
+    # Share the stations out between the lines, plus a few interchanges.
+    rng.shuffle(stations)
+    per_line = -(-station_count // line_count)
+    for index, line in enumerate(tubemap.lines.values()):
+        line_stations = stations[index * per_line:(index + 1) * per_line]
+        line_stations += rng.sample(stations, min(len(stations), max(per_line // 10, 1)))
+        for station_1, station_2 in zip(line_stations, line_stations[1:]):
+            if(station_1 is not station_2):
+                tubemap.connections.append(Connection({station_1, station_2}, line, rng.randint(1, 5)))
+    return tubemap
+
+
+def benchmark_build(sizes=(1000, 10000, 100000, 200000)):
+    """ Times NeighbourGraphBuilder.build on synthetic tube maps of growing size.
+
+    The time per connection stays flat as the network grows, as expected
+    from a single pass over the connections.
+
+    Args:
+        sizes (iterable[int]) : numbers of stations of the generated tube maps.
+
+    Returns:
+        results (list[tuple[int, int, float]]) : number of stations, number of
+            connections and seconds taken by build for each size.
+    """
+    import time
+
+    results = []
+    graph_builder = NeighbourGraphBuilder()
+    for station_count in sizes:
+        tubemap = synthetic_tubemap(station_count)
+        start = time.perf_counter()
+        graph_builder.build(tubemap)
+        seconds = time.perf_counter() - start
+        connection_count = len(tubemap.connections)
+        results.append((station_count, connection_count, seconds))
+        print(f"{station_count:>8} stations {connection_count:>8} connections: "
+              f"{seconds * 1000:8.1f} ms ({seconds / connection_count * 1e6:.2f} us per connection)")
+    return results
+
+
 if __name__ == "__main__":
-    test_graph()
+    import sys
+
+    if("--benchmark" in sys.argv):
+        benchmark_build()
+    else:
+        test_graph()
@@ -0,0 +1,249 @@
+import heapq
+from array import array
+
+
+class LineGraph:
+    """
+    Connections of a tube map by line, for routes that account for line changes.
+
+    Stations are numbered as in CSRGraph.from_graph on the same neighbour graph.
+    The connections of station i are neighbours[offsets[i]:offsets[i + 1]],
+    with one entry per neighbour and line: weights holds the shortest time on
+    that line and lines the index of the line in line_ids.
+
+    Routes are searched over (station, line) states: arriving at a station on
+    a line, then leaving it on another line costs an interchange penalty.
+    Only the lines serving a station get a state there. The states of
+    station i are numbered state_offsets[i] to state_offsets[i + 1] - 1: the
+    first one stands for starting the route at the station, left on any line
+    without penalty, and the others for arriving on each line serving it,
+    whose index is in state_lines. The transitions out of a station's states
+    are made the first time a search reaches it.
+    """
+
+    def __init__(self, station_ids, line_ids, offsets, neighbours, weights, lines):
+        """
+        Args:
+            station_ids (list[str]) : id of the station at each index.
+            line_ids (list[str]) : id of the line at each index.
+            offsets (array[int]) : start of each station's connections, plus the total at the end.
+            neighbours (array[int]) : index of the neighbour of each connection, station by station.
+            weights (array[int]) : shortest time of each connection.
+            lines (array[int]) : index of the line of each connection.
+        """
+        self.station_ids = station_ids
+        self.line_ids = line_ids
+        self.offsets = offsets
+        self.neighbours = neighbours
+        self.weights = weights
+        self.lines = lines
+        self.line_count = len(line_ids)
+        # Station and line of each state, -1 as the line of start states.
+        self.state_offsets = array("i", [0])
+        self.state_stations = array("i")
+        self.state_lines = array("i")
+        for station in range(len(station_ids)):
+            station_lines = sorted(set(lines[offsets[station]:offsets[station + 1]]))
+            self.state_stations.extend([station] * (len(station_lines) + 1))
+            self.state_lines.append(-1)
+            self.state_lines.extend(station_lines)
+            self.state_offsets.append(len(self.state_lines))
+        self.state_count = len(self.state_lines)
+        # State reached, time and line of each connection of a station, once a search has reached it.
+        self.transitions = [None] * len(station_ids)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """ Builds the line graph of a neighbour graph built by NeighbourGraphBuilder.
+
+        Args:
+            graph (dict) : neighbour graph, as returned by NeighbourGraphBuilder.build.
+
+        Returns:
+            line_graph (LineGraph) : the connections of the graph by line.
+        """
+        station_ids = list(graph.keys())
+        index = {station_id: position for position, station_id in enumerate(station_ids)}
+        line_index = {}
+        offsets = array("i", [0])
+        neighbours = array("i")
+        weights = array("i")
+        lines = array("i")
+        for station_id in station_ids:
+            for neighbour_station_id, connections in graph[station_id].items():
+                # Shortest time to the neighbour on each line.
+                times = {}
+                for connection in connections:
+                    line = line_index.setdefault(connection.line.id, len(line_index))
+                    times[line] = min(times.get(line, connection.time), connection.time)
+                for line, time in sorted(times.items()):
+                    neighbours.append(index[neighbour_station_id])
+                    weights.append(time)
+                    lines.append(line)
+            offsets.append(len(neighbours))
+        return cls(station_ids, list(line_index), offsets, neighbours, weights, lines)
+
+    def route(self, source, target, interchange_penalty, station_penalties=None):
+        """ Finds a fastest route between two stations, counting line changes.
+
+        Dijkstra's algorithm on the (station, line) states. It stops when the
+        first state of the target station is checked, whatever its line. States
+        reached no sooner than an earlier arrival at the same station plus the
+        penalty are not expanded, since changing line from there is as fast.
+
+        Args:
+            source (int) : index of the starting station.
+            target (int) : index of the end station.
+            interchange_penalty (float) : minutes added for each change of line.
+            station_penalties (dict) : penalty of changing line at some stations,
+                by station index, instead of interchange_penalty. Defaults to None.
+
+        Returns:
+            tuple[float, list[int], list[int]] : duration including the penalties,
+                indices of the stations of the route and index of the line of
+                each of its connections, all None if target cannot be reached.
+
+        Raises:
+            ValueError if a penalty is not a number of minutes, at least 0.
+        """
+        station_penalties = station_penalties or {}
+        for penalty in (interchange_penalty, *station_penalties.values()):
+            if(isinstance(penalty, bool) or not isinstance(penalty, (int, float)) or not penalty >= 0):
+                raise ValueError(f"Interchange penalties must be numbers of minutes, at least 0, not {penalty!r}")
+        transitions, state_stations, state_lines = self.transitions, self.state_stations, self.state_lines
+        durations = [float('inf')] * self.state_count
+        previous = array("i", [-1]) * self.state_count
+        # Shortest duration of the states checked at each station.
+        station_durations = {}
+        start_state = self.state_offsets[source]
+        durations[start_state] = 0
+        heap = [(0, start_state)]
+        while(heap):
+            current_duration, state = heapq.heappop(heap)
+            # Skip states already reached faster.
+            if(current_duration > durations[state]):
+                continue
+            current = state_stations[state]
+            if(current == target):
+                return current_duration, *self._unpack(previous, state)
+            current_line = state_lines[state]
+            if(current_line < 0):
+                # The start station is left on any line without penalty.
+                penalty = 0
+            else:
+                penalty = station_penalties.get(current, interchange_penalty)
+                # Changing line from an earlier arrival at the station is at least as fast.
+                if(current_duration >= station_durations.get(current, float('inf')) + penalty):
+                    continue
+            if(current_duration < station_durations.get(current, float('inf'))):
+                station_durations[current] = current_duration
+            station_transitions = transitions[current]
+            if(station_transitions is None):
+                station_transitions = self._transitions(current)
+            for neighbour_state, time, line in station_transitions:
+                neighbour_duration = current_duration + time
+                if(line != current_line):
+                    neighbour_duration += penalty
+                if(neighbour_duration < durations[neighbour_state]):
+                    durations[neighbour_state] = neighbour_duration
+                    previous[neighbour_state] = state
+                    heapq.heappush(heap, (neighbour_duration, neighbour_state))
+        return None, None, None
+
+    def _transitions(self, station):
+        """ Lists the connections of a station as transitions between states, and keeps them.
+
+        Args:
+            station (int) : index of the station.
+
+        Returns:
+            tuple[tuple[int, int, int]] : state reached, time and line index of each connection.
+        """
+        station_transitions = []
+        for edge in range(self.offsets[station], self.offsets[station + 1]):
+            neighbour, line = self.neighbours[edge], self.lines[edge]
+            # The neighbour's state for the line, among the few of its states.
+            first_state = self.state_offsets[neighbour]
+            neighbour_lines = self.state_lines[first_state:self.state_offsets[neighbour + 1]]
+            neighbour_state = first_state + neighbour_lines.index(line)
+            station_transitions.append((neighbour_state, self.weights[edge], line))
+        self.transitions[station] = tuple(station_transitions)
+        return self.transitions[station]
+
+    def _unpack(self, previous, state):
+        """ Follows the previous states back from the last state of a route.
+
+        Args:
+            previous (array[int]) : previous state of each state, -1 for none.
+            state (int) : last state of the route.
+
+        Returns:
+            tuple[list[int], list[int]] : indices of the stations of the route and of the line of each connection.
+        """
+        stations = []
+        lines = []
+        while(state >= 0):
+            stations.append(self.state_stations[state])
+            lines.append(self.state_lines[state])
+            state = previous[state]
+        stations.reverse()
+        # The start state has no line, the others are on the line of the connection reaching them.
+        lines.pop()
+        lines.reverse()
+        return stations, lines
+
+
+def test_line_graph():
+    from tube.map import TubeMap
+    from network.graph import NeighbourGraphBuilder
+    from network.csr import CSRGraph
+
+    tubemap = TubeMap()
+    tubemap.import_from_json("data/london.json")
+    graph = NeighbourGraphBuilder().build(tubemap)
+    csr = CSRGraph.from_graph(graph)
+    line_graph = LineGraph.from_graph(graph)
+    assert line_graph.station_ids == csr.station_ids
+    print(f"{csr.station_count} stations, {line_graph.line_count} lines, "
+          f"{len(line_graph.neighbours)} connections by line")
+
+    # Without penalties, routes are as fast as the shortest paths.
+    for source in range(0, csr.station_count, 11):
+        durations, _ = csr.dijkstra(source)
+        for target in range(csr.station_count):
+            duration, stations, lines = line_graph.route(source, target, 0)
+            assert duration == durations[target]
+            assert len(lines) == len(stations) - 1
+
+    # Every connection of a route runs on its line, and changes of line are paid for.
+    source, target = csr.index['245'], csr.index['236']
+    duration, stations, lines = line_graph.route(source, target, 5)
+    time = 0
+    for station_1, station_2, line in zip(stations, stations[1:], lines):
+        times = [connection.time for connection in graph[csr.station_ids[station_1]][csr.station_ids[station_2]]
+                 if connection.line.id == line_graph.line_ids[line]]
+        assert times
+        time += min(times)
+    changes = sum(1 for line_1, line_2 in zip(lines, lines[1:]) if line_1 != line_2)
+    assert duration == time + 5 * changes
+    print([(tubemap.stations[csr.station_ids[station]].name, tubemap.lines[line_graph.line_ids[line]].name)
+           for station, line in zip(stations[1:], lines)])
+
+    # Only the lines serving a station have a state there, and penalties may be fractions of minutes.
+    assert line_graph.state_count < 3 * csr.station_count
+    duration, stations, lines = line_graph.route(source, target, 1.5)
+    time = sum(line_graph.weights[edge] for station_1, station_2, line in zip(stations, stations[1:], lines)
+               for edge in range(line_graph.offsets[station_1], line_graph.offsets[station_1 + 1])
+               if line_graph.neighbours[edge] == station_2 and line_graph.lines[edge] == line)
+    changes = sum(1 for line_1, line_2 in zip(lines, lines[1:]) if line_1 != line_2)
+    assert duration == time + 1.5 * changes
+    for penalty in (True, -1, "2"):
+        try:
+            line_graph.route(source, target, penalty)
+            assert False, f"penalty {penalty!r} accepted"
+        except ValueError:
+            pass
+
+
+if __name__ == "__main__":
+    test_line_graph()
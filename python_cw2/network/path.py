@@ -1,4 +1,23 @@
+import functools
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 from network.graph import NeighbourGraphBuilder
+from network.csr import CSRGraph
+from network.contraction import ContractionHierarchy
+from network.lines import LineGraph
+
+# Mean radius of the Earth, in kilometres.
+EARTH_RADIUS = 6371.0
+# Algorithms that get_shortest_path can use.
+SEARCH_METHODS = ("dijkstra", "astar", "bidirectional", "hierarchy")
+# Default minutes added by get_route() for each change of line.
+INTERCHANGE_PENALTY = 3
+
 
 class PathFinder:
     """
@@ -7,15 +26,48 @@ class PathFinder:
     - completing the "get_shortest_path()" method (don't hesitate to divide your code into several sub-methods)
     """
 
-    def __init__(self, tubemap):
+    def __init__(self, tubemap, graph=None, path_table=None, tree_cache_size=32, hierarchy=None):
         """
         Args:
             tubemap (TubeMap) : The TubeMap to use.
+            graph (dict) : The neighbour graph of tubemap, if already built
+                (for instance by tube.snapshot.load_tubemap). Built from tubemap if None.
+            path_table (AllPairsTable or LazyPathTable) : precomputed paths of
+                network.allpairs to answer queries from, instead of running
+                Dijkstra for each one. Defaults to None.
+            tree_cache_size (int) : number of shortest path trees kept by
+                shortest_path_tree(), most recently used first. Defaults to 32.
+            hierarchy (ContractionHierarchy) : contraction hierarchy of the
+                network (for instance loaded with ContractionHierarchy.load) for
+                the "hierarchy" method. Built on its first use if None.
+
+        Raises:
+            ValueError if path_table or hierarchy was computed for different stations.
         """
         self.tubemap = tubemap
 
-        graph_builder = NeighbourGraphBuilder()
-        self.graph = graph_builder.build(self.tubemap)
+        if(graph is None):
+            graph_builder = NeighbourGraphBuilder()
+            graph = graph_builder.build(self.tubemap)
+        self.graph = graph
+        # Compact integer form of the graph, which the path searches run on.
+        self.csr = CSRGraph.from_graph(self.graph)
+        if(path_table is not None and list(path_table.station_ids) != self.csr.station_ids):
+            raise ValueError("The path table was not computed for the stations of this tube map")
+        self.path_table = path_table
+        if(hierarchy is not None and list(hierarchy.station_ids) != self.csr.station_ids):
+            raise ValueError("The contraction hierarchy was not built for the stations of this tube map")
+        self.hierarchy = hierarchy
+        # Connections by line for get_route(), built on its first use.
+        self.line_graph = None
+        # Position of each station of the CSR graph (a NumPy array if available)
+        # and fastest speed, for the A* estimates. Computed on the first A* query.
+        self.positions = None
+        self.max_speed = None
+        # A* estimates towards the most recently used end stations, by station index.
+        self.estimate_cache = functools.lru_cache(maxsize=tree_cache_size)(self._estimates)
+        # Shortest path trees of the most recently used start stations, by station index.
+        self.tree_cache = functools.lru_cache(maxsize=tree_cache_size)(self._build_tree)
         
         # Feel free to add anything else needed here.
 
@@ -29,99 +81,133 @@ class PathFinder:
         Returns:
             id (str) : ID of the station.
         """
-        # Loop through all station ids.
-        for id in self.tubemap.stations.keys():
-            # Check if the station name matches.
-            if(self.tubemap.stations[id].name == station_name):
-                return id
-        return None
+        # Use the name index of the tube map, which also accepts normalised names.
+        return self.tubemap.station_id_from_name(station_name)
 
+    def _position(self, station_id):
+        """
+        Args:
+            station_id (str) : ID of the station.
 
-    def initialise_dist_dict(self, start_station_name):
+        Returns:
+            tuple[float, float, float] : position of the station on a sphere of
+                radius 1 centred on the Earth's centre, or None if its coordinates are unknown.
         """
-        Initialises a dictionary with all the station ids as keys. Each key value
-        is a nested dictionary containing the distance from the starting station (Infinity for
-        non starting stations).
+        coordinates = getattr(self.tubemap, "station_coordinates", {}).get(station_id)
+        if(coordinates is None):
+            return None
+        latitude, longitude = math.radians(coordinates[0]), math.radians(coordinates[1])
+        return (math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude),
+                math.sin(latitude))
+
+    def _distance(self, station_1, station_2):
+        """
+        Straight-line distance between two stations through the Earth, in kilometres.
+
+        It is never longer than the great circle distance, and it is cheaper
+        to compute as it needs a single square root.
 
         Args:
-            start_station_name (str) : name of starting station of path.
-        
+            station_1 (int) : index of the first station.
+            station_2 (int) : index of the second station.
+
         Returns:
-            dist_dict (dict) : initialised dictionary in required form.
+            distance (float) : distance between the stations.
         """
-        dist_dict = dict()
-        # Get the starting station id.
-        start_station_id = self.station_id_from_name(start_station_name)
-        # Iterate through all the station ids.
-        for station_id in self.tubemap.stations.keys():
-            if(station_id == start_station_id):
-                # Case 1: Starting station, duration set to 0 from starting station.
-                station_info = {'duration' : 0, 'from' : station_id}
-                dist_dict[station_id] = station_info
-            else:
-                # Case 2: Other station, duration set to infinity from None.
-                station_info = {'duration' : float('inf'), 'from' : None}
-                dist_dict[station_id] = station_info
-        return dist_dict
+        x_1, y_1, z_1 = self.positions[station_1]
+        x_2, y_2, z_2 = self.positions[station_2]
+        return EARTH_RADIUS * math.sqrt((x_2 - x_1) ** 2 + (y_2 - y_1) ** 2 + (z_2 - z_1) ** 2)
+
+    def _prepare_astar(self):
+        """
+        Computes the station positions and the fastest speed used by the A* estimates.
+
+        Called on the first A* query, so tube maps never searched with A* do
+        not pay for it.
+        """
+        self.positions = [self._position(station_id) for station_id in self.csr.station_ids]
+        self.max_speed = self._max_speed()
+        if(np is not None and self.max_speed is not None):
+            self.positions = np.array(self.positions)
+        self.estimate_cache.cache_clear()
+
+    def _estimates(self, end_index):
+        """
+        Estimates the duration from every station to an end station, for A*.
 
-    def next_station(self, dist_dict, checked_stations):
-        '''
-        Function to find the next station in the list to check.
+        The estimate is the straight-line distance divided by the fastest
+        speed of any connection. With NumPy, all the distances are computed at once.
 
         Args:
-            dist_dict (dict) : dictionary with information for stations and duration from starting station.
-            checked_stations list[str] : stations ids that have already been checked.
-        
+            end_index (int) : index of the end station in the CSR graph.
+
+        Returns:
+            list[float] : lower bound on the duration from each station to the end station.
+        """
+        scale = EARTH_RADIUS / self.max_speed
+        if(np is not None):
+            differences = self.positions - self.positions[end_index]
+            return (np.sqrt((differences * differences).sum(axis=1)) * scale).tolist()
+        return [self._distance(station, end_index) / self.max_speed for station in range(self.csr.station_count)]
+
+    def _max_speed(self):
+        """
+        Fastest straight-line speed of any connection, in kilometres per minute.
+
+        No connection covers more distance per minute, so the straight-line
+        distance to the end station divided by this speed never overestimates
+        the remaining duration, as A* requires. As straight-line distances
+        obey the triangle inequality, the estimates are also consistent.
+
         Returns:
-            next_station (str) : id of the next station to be checked, has the shortest duration at current stage
-                                of checking.
-        '''
-        # Initialise shortest distance as infinity.
-        shortest_duration = float('inf')
-        # Initialise next station as None.
-        next_station = None
-        # Iterate through all station ids.
-        for station_id in dist_dict.keys():
-            # Check that the station hasn't been checked and its duration is less than shortest duration found so far.
-            if(not station_id in checked_stations and dist_dict[station_id]['duration'] < shortest_duration):
-                # Update shortest duration found and the next station to check.
-                shortest_duration = dist_dict[station_id]['duration']
-                next_station = station_id
-        return next_station
-
-
-    def reverse_iterate_route(self, dist_dict, start_station_id, end_station_id):
-        '''
-        Reverse iterates through the route creating a list of the stations along the shortest path.
+            speed (float) : the speed, or None if some station has no coordinates
+                or some connection takes no time, making estimates impossible.
+        """
+        if(any(position is None for position in self.positions)):
+            return None
+        max_speed = 0.0
+        for station in range(self.csr.station_count):
+            for neighbour, time in self.csr.neighbours_of(station):
+                if(time <= 0):
+                    return None
+                max_speed = max(max_speed, self._distance(station, neighbour) / time)
+        # Leave room for rounding, estimates must stay below the true durations.
+        return max_speed * (1 + 1e-9) if max_speed > 0 else None
+
+    def shortest_path_tree(self, start_station_name):
+        """
+        Finds the shortest durations and paths from a station to every other station.
+
+        The tree is computed once with Dijkstra and kept in an LRU cache, so
+        asking for paths from the same start station again (for instance to
+        every station within some minutes) costs only the path extraction.
 
         Args:
-            dist_dict (dict) : complete dictionary of all stations and their relevant durations and previous stations on
-                                their path.
-            start_station_id (str) : id of starting station of path.
-            end_station_id (id) : id of end station of path.
+            start_station_name (str) : name of the starting station.
 
         Returns:
-            shortest_path list[Station] : resulting shortest path of stations based from the input dist_dict.
-        '''
-        # Initialise list by adding the end station.
-        shortest_path = [self.tubemap.stations[end_station_id]]
-        # Track the next station in the path.
-        next_station_in_path = end_station_id
-        # Loop until the start station is reached.
-        while(next_station_in_path != start_station_id):
-            # Update the next station in the path.
-            next_station_in_path = dist_dict[next_station_in_path]['from']
-            # Add the next station to the path list.
-            shortest_path.append(self.tubemap.stations[next_station_in_path])
-        # Reverse the path list so it is in the correct order.
-        shortest_path.reverse()
-        return shortest_path
+            tree (ShortestPathTree) : the tree of shortest paths from the station,
+                or None if start_station_name does not exist.
+        """
+        start_station_id = self.station_id_from_name(start_station_name)
+        if(start_station_id is None):
+            return None
+        return self.tree_cache(self.csr.index[start_station_id])
 
+    def _build_tree(self, start_index):
+        """
+        Runs Dijkstra from a station to every other one.
 
+        Args:
+            start_index (int) : index of the starting station in the CSR graph.
 
-        
-        
-    def get_shortest_path(self, start_station_name, end_station_name):
+        Returns:
+            tree (ShortestPathTree) : the tree of shortest paths from the station.
+        """
+        durations, previous = self.csr.dijkstra(start_index)
+        return ShortestPathTree(self.tubemap, self.csr, start_index, durations, previous)
+
+    def get_shortest_path(self, start_station_name, end_station_name, method="dijkstra"):
         """ Find ONE shortest path (in terms of duration) from start_station_name to end_station_name.
 
         For instance, get_shortest_path('Stockwell', 'South Kensington') should return the list:
@@ -141,15 +227,32 @@ class PathFinder:
         
         Alternatively, find the pseudocode on Wikipedia: https://en.wikipedia.org/wiki/Dijkstra's_algorithm#Pseudocode
 
+        Other shortest path algorithms can be chosen with method. They find a
+        path of the same duration, but may pick a different one of several
+        paths of equal duration:
+        - "astar": A*, estimating the remaining duration from the straight-line
+          distance to the end station and the fastest speed of any connection.
+          Falls back to Dijkstra if some station has no coordinates.
+        - "bidirectional": Dijkstra from both ends at once.
+        - "hierarchy": query of a contraction hierarchy (network.contraction),
+          the fastest once the hierarchy is built.
+
         Args:
             start_station_name (str): name of the starting station
             end_station_name (str): name of the ending station
+            method (str): "dijkstra", "astar", "bidirectional" or "hierarchy". Defaults to "dijkstra".
 
         Returns:
             list[Station] : list of Station objects corresponding to ONE 
                 shortest path from start_station_name to end_station_name.
-                Returns None if start_station_name or end_station_name does not exist.
+                Returns None if start_station_name or end_station_name does not exist,
+                or if end_station_name cannot be reached from start_station_name.
+
+        Raises:
+            ValueError if method is not one of the above.
         """
+        if(method not in SEARCH_METHODS):
+            raise ValueError(f"Unknown shortest path method '{method}', expected one of {SEARCH_METHODS}")
         # Get the end station id.
         end_station_id = self.station_id_from_name(end_station_name)
         # Get the start station id.
@@ -157,37 +260,196 @@ class PathFinder:
         # Check valid input.
         if(end_station_id is None or start_station_id is None):
             return None
-        # Initialise the list of distances from start station.
-        dist_dict = self.initialise_dist_dict(start_station_name)
-        # Track the stations we have checked.
-        checked_stations = []
-        # Loop until all the stations have been checked.
-        while(len(checked_stations) < len(dist_dict.keys())):
-            # Get the station id of next station to check.
-            current_station_id = self.next_station(dist_dict, checked_stations)
-            # Get the neighbours of current station.
-            station_neighbours = self.graph[current_station_id]
-            # Loop through neighbour stations.
-            for neighbour_station_id in station_neighbours.keys():
-                # Initialise shortest duration as infinity.
-                shortest_time = float('inf')
-                # Loop through possible connections to neighbour station and find shortest connection.
-                for connection in station_neighbours[neighbour_station_id]:
-                    if(connection.time < shortest_time):
-                        shortest_time = connection.time
-                # Add the shortest connection time to the time to the previous station.
-                duration_current_station = dist_dict[current_station_id]['duration'] + shortest_time
-                # Check if this path to the neighbour station is the shortest found so far.
-                if(duration_current_station < dist_dict[neighbour_station_id]['duration']):
-                    # Update the path dictionary with the new step in the path.
-                    dist_dict[neighbour_station_id]['duration'] = duration_current_station
-                    dist_dict[neighbour_station_id]['from'] = current_station_id
-            # Add the current station to checked stations.
-            checked_stations.append(current_station_id)
-        # Find the final path by reverse iterating from the end station.
-        shortest_path = self.reverse_iterate_route(dist_dict, start_station_id, end_station_id)
-                
-        return shortest_path 
+        start_index = self.csr.index[start_station_id]
+        end_index = self.csr.index[end_station_id]
+        if(method == "astar" and self.positions is None):
+            self._prepare_astar()
+        if(method == "astar" and self.max_speed is not None):
+            # Estimate the remaining duration from the straight-line distance.
+            _, path, _ = self.csr.astar(start_index, end_index, self.estimate_cache(end_index))
+        elif(method == "bidirectional"):
+            _, path, _ = self.csr.bidirectional_dijkstra(start_index, end_index)
+        elif(method == "hierarchy"):
+            if(self.hierarchy is None):
+                self.hierarchy = ContractionHierarchy.build(self.csr)
+            _, path = self.hierarchy.query(start_index, end_index)
+        elif(self.path_table is not None):
+            # Look the path up in the precomputed table.
+            path = self.path_table.path(start_index, end_index)
+        else:
+            # Run Dijkstra on the CSR graph, stopping once the end station is checked.
+            # Stations at equal duration are checked in the order of the station dictionary.
+            _, previous = self.csr.dijkstra(start_index, end_index)
+            # Find the final path by reverse iterating from the end station.
+            path = self.csr.path_to(previous, start_index, end_index)
+        # The end station cannot be reached from the start station.
+        if(path is None):
+            return None
+        return [self.tubemap.stations[self.csr.station_ids[station]] for station in path]
+
+    def get_route(self, start_station_name, end_station_name, interchange_penalty=INTERCHANGE_PENALTY,
+                  station_penalties=None):
+        """ Find a fastest route from start_station_name to end_station_name, counting changes of line.
+
+        Unlike get_shortest_path(), which takes the fastest connection between
+        two stations whatever its line, the route stays on a line until it
+        changes line at a station, which costs interchange_penalty minutes.
+
+        Args:
+            start_station_name (str): name of the starting station
+            end_station_name (str): name of the ending station
+            interchange_penalty (float): minutes added for each change of line, for
+                instance 1.5. Defaults to INTERCHANGE_PENALTY.
+            station_penalties (dict): minutes added for a change of line at some
+                stations, by station name, instead of interchange_penalty. Defaults to None.
+
+        Returns:
+            route (Route) : the stations of the route and the line of each of
+                its connections. Returns None if start_station_name or
+                end_station_name does not exist, or if end_station_name cannot
+                be reached from start_station_name.
+
+        Raises:
+            ValueError if a penalty is not a number of minutes (an int or a
+                float, not a bool), at least 0, or station_penalties names a
+                station that does not exist.
+        """
+        end_station_id = self.station_id_from_name(end_station_name)
+        start_station_id = self.station_id_from_name(start_station_name)
+        if(end_station_id is None or start_station_id is None):
+            return None
+        penalties = {}
+        for station_name, penalty in (station_penalties or {}).items():
+            station_id = self.station_id_from_name(station_name)
+            if(station_id is None):
+                raise ValueError(f"Unknown station '{station_name}' in station_penalties")
+            penalties[self.csr.index[station_id]] = penalty
+        if(self.line_graph is None):
+            self.line_graph = LineGraph.from_graph(self.graph)
+        duration, path, lines = self.line_graph.route(self.csr.index[start_station_id],
+                                                      self.csr.index[end_station_id], interchange_penalty, penalties)
+        if(path is None):
+            return None
+        return Route([self.tubemap.stations[self.csr.station_ids[station]] for station in path],
+                     [self.tubemap.lines[self.line_graph.line_ids[line]] for line in lines], duration)
+
+
+class Route:
+    """
+    A route through the tube map, with the line taken between each pair of stations.
+
+    lines[i] is the line of the connection from stations[i] to stations[i + 1],
+    and duration is the time of the connections plus the interchange penalties.
+    """
+
+    def __init__(self, stations, lines, duration):
+        """
+        Args:
+            stations (list[Station]) : the stations of the route, in order.
+            lines (list[Line]) : the line of each connection of the route.
+            duration (float) : duration of the route, interchange penalties included.
+        """
+        self.stations = stations
+        self.lines = lines
+        self.duration = duration
+
+    def __repr__(self):
+        station_names = f"{self.stations[0].name} -> {self.stations[-1].name}"
+        return f"Route({station_names}, {self.duration} min, {self.interchanges} interchange(s))"
+
+    @property
+    def interchanges(self):
+        """ Number of changes of line along the route. """
+        return sum(1 for line_1, line_2 in zip(self.lines, self.lines[1:]) if line_1 is not line_2)
+
+    def legs(self):
+        """
+        Groups the route into legs, each on a single line.
+
+        Returns:
+            list[tuple[Line, list[Station]]] : the line of each leg and its
+                stations, from the station where it is boarded to the one where it is left.
+        """
+        legs = []
+        for position, line in enumerate(self.lines):
+            if(legs and legs[-1][0] is line):
+                legs[-1][1].append(self.stations[position + 1])
+            else:
+                legs.append((line, [self.stations[position], self.stations[position + 1]]))
+        return legs
+
+
+class ShortestPathTree:
+    """
+    Shortest durations and paths from one station to every station of the tube map.
+
+    durations[i] is the shortest duration to the station at index i of the CSR
+    graph (infinity if it cannot be reached), and previous[i] is the station
+    before it on its path (-1 for the start station and unreachable stations).
+    """
+
+    def __init__(self, tubemap, csr, start_index, durations, previous):
+        """
+        Args:
+            tubemap (TubeMap) : the tube map of the stations.
+            csr (CSRGraph) : the graph the tree was computed on.
+            start_index (int) : index of the starting station.
+            durations (list[float]) : shortest duration to each station.
+            previous (array[int]) : previous station on the path to each station.
+        """
+        self.tubemap = tubemap
+        self.csr = csr
+        self.start_index = start_index
+        self.durations = durations
+        self.previous = previous
+
+    def duration_to(self, station_name):
+        """
+        Args:
+            station_name (str) : name of the end station.
+
+        Returns:
+            duration (int) : shortest duration to the station, or None if it does not exist or cannot be reached.
+        """
+        station_id = self.tubemap.station_id_from_name(station_name)
+        if(station_id is None):
+            return None
+        duration = self.durations[self.csr.index[station_id]]
+        return None if duration == float('inf') else duration
+
+    def path_to(self, station_name):
+        """
+        Args:
+            station_name (str) : name of the end station.
+
+        Returns:
+            list[Station] : the stations of the same shortest path as
+                PathFinder.get_shortest_path, or None if the station does not
+                exist or cannot be reached.
+        """
+        station_id = self.tubemap.station_id_from_name(station_name)
+        if(station_id is None):
+            return None
+        path = self.csr.path_to(self.previous, self.start_index, self.csr.index[station_id])
+        if(path is None):
+            return None
+        return [self.tubemap.stations[self.csr.station_ids[station]] for station in path]
+
+    def stations_within(self, duration):
+        """
+        Lists the stations that can be reached within a duration, closest first.
+
+        Args:
+            duration (int) : longest duration, in minutes.
+
+        Returns:
+            list[tuple[Station, int]] : each reachable station and its shortest duration.
+        """
+        reachable = [(station_duration, station) for station, station_duration in enumerate(self.durations)
+                     if station_duration <= duration]
+        reachable.sort()
+        return [(self.tubemap.stations[self.csr.station_ids[station]], station_duration)
+                for station_duration, station in reachable]
 
 
 def test_shortest_path():
@@ -204,6 +466,28 @@ def test_shortest_path():
                 "Green Park"]
     assert station_names == expected
 
+    tree = path_finder.shortest_path_tree("Covent Garden")
+    assert [station.name for station in tree.path_to("Green Park")] == expected
+    assert path_finder.shortest_path_tree("Covent Garden") is tree
+    print([(station.name, duration) for station, duration in tree.stations_within(4)])
+
+    for method in ("astar", "bidirectional", "hierarchy"):
+        stations = path_finder.get_shortest_path("Stockwell", "Ealing Broadway", method=method)
+        duration = sum(min(connection.time for connection in path_finder.graph[station_1.id][station_2.id])
+                       for station_1, station_2 in zip(stations, stations[1:]))
+        assert duration == path_finder.shortest_path_tree("Stockwell").duration_to("Ealing Broadway")
+
+    # Routes change line only when it is worth the penalty.
+    route = path_finder.get_route("Stockwell", "South Kensington", interchange_penalty=0)
+    assert route.duration == path_finder.shortest_path_tree("Stockwell").duration_to("South Kensington")
+    route = path_finder.get_route("Stockwell", "South Kensington", interchange_penalty=10)
+    print(route, [(line.name, [station.name for station in stations]) for line, stations in route.legs()])
+    assert len(route.lines) == len(route.stations) - 1
+    for line, stations in route.legs():
+        for station_1, station_2 in zip(stations, stations[1:]):
+            assert any(connection.line is line for connection in path_finder.graph[station_1.id][station_2.id])
+    assert route.interchanges == len(route.legs()) - 1
+
 
 if __name__ == "__main__":
     test_shortest_path()
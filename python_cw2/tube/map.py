@@ -3,6 +3,8 @@ import json
 from tube.components import Station
 from tube.components import Line
 from tube.components import Connection
+from tube.names import normalise_name
+from tube.names import NameTrie
 
 class TubeMap:
     """
@@ -19,8 +21,13 @@ class TubeMap:
 
     def __init__(self):
         self.stations = {}  # key: id (str), value: Station instance
+        self.station_coordinates = {}  # key: id (str), value: (latitude, longitude) in degrees
         self.lines = {}  # key: id (str), value: Line instance
         self.connections = []  # list of Connection instances
+        self.station_ids_by_name = {}  # key: name (str), value: id (str)
+        self.station_ids_by_normalised_name = {}  # key: normalised name (str), value: id (str)
+        self.name_trie = NameTrie()  # normalised names, for prefix and fuzzy lookups
+        self.indexed_station_count = 0  # number of stations when the name index was built
 
     def zone_set(self, zone_string):
         """
@@ -80,6 +87,9 @@ class TubeMap:
             new_station = Station(station["id"], station["name"], station_zone)
             # Add to station dictionary.
             self.stations[new_station.id] = new_station
+            # Keep the coordinates alongside, as Station only holds the id, name and zones.
+            if("latitude" in station and "longitude" in station):
+                self.station_coordinates[new_station.id] = (float(station["latitude"]), float(station["longitude"]))
 
         # Assign map lines.
         map_lines = map_data["lines"]
@@ -100,8 +110,77 @@ class TubeMap:
             new_connection = Connection(stations, self.lines[connection["line"]], int(connection["time"]))
             # Add to connections list.
             self.connections.append(new_connection)
+
+        # Index the station names for lookups.
+        self.build_name_index()
         return
 
+    def build_name_index(self):
+        """ Indexes the stations by exact name, by normalised name and in a trie of normalised names.
+
+        Called by import_from_json(). Lookups rebuild the index themselves if
+        stations were added to the map since it was last built.
+        """
+        self.station_ids_by_name = {}
+        self.station_ids_by_normalised_name = {}
+        self.name_trie = NameTrie()
+        for station_id, station in self.stations.items():
+            normalised_name = normalise_name(station.name)
+            # When names collide, the first station keeps the name.
+            self.station_ids_by_name.setdefault(station.name, station_id)
+            self.station_ids_by_normalised_name.setdefault(normalised_name, station_id)
+            self.name_trie.add(normalised_name, station_id)
+        self.indexed_station_count = len(self.stations)
+
+    def _check_name_index(self):
+        """ Rebuilds the name index if the number of stations changed since it was built. """
+        if(self.indexed_station_count != len(self.stations)):
+            self.build_name_index()
+
+    def station_id_from_name(self, station_name):
+        """ Finds the id of a station from its name.
+
+        The exact name is looked up first, then its normalised form (see
+        tube.names.normalise_name), so "earls court" finds "Earl's Court".
+
+        Args:
+            station_name (str) : name of the station.
+
+        Returns:
+            id (str) : id of the station, or None if no station has this name.
+        """
+        self._check_name_index()
+        station_id = self.station_ids_by_name.get(station_name)
+        if(station_id is None and isinstance(station_name, str)):
+            station_id = self.station_ids_by_normalised_name.get(normalise_name(station_name))
+        return station_id
+
+    def station_ids_with_prefix(self, prefix):
+        """ Finds the stations whose name starts with a prefix, ignoring case and punctuation.
+
+        Args:
+            prefix (str) : start of the station names.
+
+        Returns:
+            ids (list[str]) : ids of the matching stations, in alphabetical order of name.
+        """
+        self._check_name_index()
+        return self.name_trie.with_prefix(normalise_name(prefix))
+
+    def closest_station_ids(self, station_name, max_distance=2):
+        """ Finds the stations whose name is close to a possibly misspelt name.
+
+        Args:
+            station_name (str) : name of the station, possibly misspelt.
+            max_distance (int) : largest number of characters to insert, delete
+                or replace in the normalised names. Defaults to 2.
+
+        Returns:
+            ids (list[str]) : ids of the matching stations, closest first.
+        """
+        self._check_name_index()
+        return [station_id for _, station_id in self.name_trie.closest(normalise_name(station_name), max_distance)]
+
 
 def test_import():
     tubemap = TubeMap()
@@ -119,6 +198,13 @@ def test_import():
     # view stations for the first Connection
     print([station for station in tubemap.connections[0].stations])
 
+    # look up stations by name
+    assert tubemap.station_id_from_name("Earl's Court") == tubemap.station_id_from_name("earls  COURT")
+    assert tubemap.station_id_from_name("elephant and castle") == tubemap.station_id_from_name("Elephant & Castle")
+    assert tubemap.station_id_from_name("Nowhere") is None
+    print([tubemap.stations[station_id].name for station_id in tubemap.station_ids_with_prefix("king")])
+    print([tubemap.stations[station_id].name for station_id in tubemap.closest_station_ids("Picadily Circus")])
+
 
 if __name__ == "__main__":
     test_import()
@@ -0,0 +1,108 @@
+import re
+
+# Characters dropped or replaced when normalising station names.
+APOSTROPHES = re.compile(r"['‘’`.]")
+SEPARATORS = re.compile(r"[\s\-]+")
+
+
+def normalise_name(name):
+    """
+    Normalises a station name so that different spellings of it compare equal.
+
+    Case is ignored, apostrophes and full stops are dropped, "&" is read as
+    "and", and hyphens and runs of whitespace become a single space. For
+    instance "Earl's Court", "earls  court" and "EARLS COURT" are the same.
+
+    Args:
+        name (str) : station name.
+
+    Returns:
+        normalised_name (str) : the normalised name.
+    """
+    name = APOSTROPHES.sub("", name.casefold())
+    name = name.replace("&", " and ")
+    return SEPARATORS.sub(" ", name).strip()
+
+
+class NameTrie:
+    """
+    Trie of normalised station names, for prefix and fuzzy lookups.
+
+    Each node is a dictionary from a character to the next node. The ids of
+    the stations whose name ends at a node are kept under the key None.
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, name, station_id):
+        """
+        Adds a station to the trie.
+
+        Args:
+            name (str) : normalised name of the station.
+            station_id (str) : id of the station.
+        """
+        node = self.root
+        for character in name:
+            node = node.setdefault(character, {})
+        node.setdefault(None, []).append(station_id)
+
+    def with_prefix(self, prefix):
+        """
+        Finds the stations whose normalised name starts with a prefix.
+
+        Args:
+            prefix (str) : normalised prefix.
+
+        Returns:
+            station_ids (list[str]) : ids of the matching stations, in alphabetical order of name.
+        """
+        node = self.root
+        for character in prefix:
+            node = node.get(character)
+            if(node is None):
+                return []
+        station_ids = []
+        # Depth first, visiting the children in alphabetical order.
+        stack = [node]
+        while(stack):
+            node = stack.pop()
+            station_ids.extend(node.get(None, ()))
+            children = sorted((character for character in node if character is not None), reverse=True)
+            stack.extend(node[character] for character in children)
+        return station_ids
+
+    def closest(self, name, max_distance=2):
+        """
+        Finds the stations whose normalised name is within an edit distance of name.
+
+        The Levenshtein distance to every name in the trie is computed one row
+        per trie node, so names sharing a prefix share the work, and branches
+        whose distance already exceeds max_distance are not explored.
+
+        Args:
+            name (str) : normalised name to look for.
+            max_distance (int) : largest number of inserted, deleted or replaced characters. Defaults to 2.
+
+        Returns:
+            matches (list[tuple[int, str]]) : distance and id of each matching station, closest first.
+        """
+        matches = []
+        first_row = list(range(len(name) + 1))
+        stack = [(self.root, first_row)]
+        while(stack):
+            node, previous_row = stack.pop()
+            if(previous_row[-1] <= max_distance):
+                matches.extend((previous_row[-1], station_id) for station_id in node.get(None, ()))
+            for character, child in node.items():
+                if(character is None):
+                    continue
+                row = [previous_row[0] + 1]
+                for column in range(1, len(name) + 1):
+                    replace_cost = previous_row[column - 1] + (name[column - 1] != character)
+                    row.append(min(row[column - 1] + 1, previous_row[column] + 1, replace_cost))
+                if(min(row) <= max_distance):
+                    stack.append((child, row))
+        matches.sort()
+        return matches
@@ -0,0 +1,285 @@
+import hashlib
+import marshal
+import os
+from array import array
+
+from tube.components import Station
+from tube.components import Line
+from tube.components import Connection
+from tube.map import TubeMap
+from network.graph import NeighbourGraphBuilder
+
+# Bumped whenever the content of a snapshot changes, so older snapshots are rebuilt.
+SNAPSHOT_VERSION = 4
+
+
+def json_digest(filepath):
+    """ Hashes the content of a tube map JSON file.
+
+    Args:
+        filepath (str) : path to the JSON file.
+
+    Returns:
+        digest (str) : hexadecimal SHA-256 digest of the file.
+    """
+    with open(filepath, "rb") as jsonfile:
+        return hashlib.sha256(jsonfile.read()).hexdigest()
+
+
+def snapshot_path(filepath):
+    """ Default location of the snapshot of a tube map JSON file, next to it.
+
+    Args:
+        filepath (str) : path to the JSON file.
+
+    Returns:
+        path (str) : path to the snapshot file.
+    """
+    return filepath + ".snapshot"
+
+
+def snapshot_data(tubemap):
+    """ Converts a tube map into plain data.
+
+    Stations and lines become tuples of their ids, names and zones, and the
+    connections become arrays of station indices, line indices and times,
+    stored as bytes. The name index is kept as its plain dictionaries. The
+    snapshot therefore holds data only and no objects.
+
+    Args:
+        tubemap (TubeMap) : the imported tube map.
+
+    Returns:
+        tuple : the data of the tube map.
+    """
+    station_ids = tuple(tubemap.stations)
+    station_index = {station_id: index for index, station_id in enumerate(station_ids)}
+    line_ids = tuple(tubemap.lines)
+    line_index = {line_id: index for index, line_id in enumerate(line_ids)}
+    # Both stations, line and time of each connection.
+    connections = (array("i"), array("i"), array("i"), array("i"))
+    for connection in tubemap.connections:
+        # A connection of a station to itself has a single station.
+        connection_stations = [station_index[station.id] for station in connection.stations]
+        station_1, station_2 = connection_stations[0], connection_stations[-1]
+        for values, value in zip(connections, (station_1, station_2, line_index[connection.line.id],
+                                               connection.time)):
+            values.append(value)
+    tubemap._check_name_index()
+    return (station_ids,
+            tuple(station.name for station in tubemap.stations.values()),
+            tuple(tuple(sorted(station.zones)) for station in tubemap.stations.values()),
+            tuple(tubemap.station_coordinates.get(station_id) for station_id in station_ids),
+            line_ids,
+            tuple(line.name for line in tubemap.lines.values()),
+            tuple(values.tobytes() for values in connections),
+            tubemap.station_ids_by_name,
+            tubemap.station_ids_by_normalised_name,
+            tubemap.name_trie.root)
+
+
+def tubemap_from_data(data):
+    """ Rebuilds a tube map from the data of snapshot_data().
+
+    Args:
+        data (tuple) : the data of the tube map, as returned by snapshot_data.
+
+    Returns:
+        tubemap (TubeMap) : the tube map.
+
+    Raises:
+        ValueError if data is not laid out as snapshot_data() makes it.
+    """
+    try:
+        (station_ids, station_names, station_zones, coordinates, line_ids, line_names, connection_bytes,
+         station_ids_by_name, station_ids_by_normalised_name, name_trie_root) = data
+        connections = []
+        for values_bytes in connection_bytes:
+            values = array("i")
+            values.frombytes(values_bytes)
+            connections.append(values)
+        lengths = {len(station_ids), len(station_names), len(station_zones), len(coordinates)}
+        if(len(lengths) != 1 or len(line_ids) != len(line_names) or len({len(values) for values in connections}) != 1):
+            raise ValueError("Inconsistent snapshot data")
+
+        tubemap = TubeMap()
+        stations = [Station(station_id, name, set(zones))
+                    for station_id, name, zones in zip(station_ids, station_names, station_zones)]
+        tubemap.stations = dict(zip(station_ids, stations))
+        # Stations without coordinates have None.
+        tubemap.station_coordinates = {station_id: tuple(station_coordinates)
+                                       for station_id, station_coordinates in zip(station_ids, coordinates)
+                                       if station_coordinates is not None}
+        lines = [Line(line_id, name) for line_id, name in zip(line_ids, line_names)]
+        tubemap.lines = dict(zip(line_ids, lines))
+        tubemap.connections = [Connection({stations[station_1], stations[station_2]}, lines[line], time)
+                               for station_1, station_2, line, time in zip(*connections)]
+        tubemap.station_ids_by_name = dict(station_ids_by_name)
+        tubemap.station_ids_by_normalised_name = dict(station_ids_by_normalised_name)
+        tubemap.name_trie.root = dict(name_trie_root)
+        tubemap.indexed_station_count = len(stations)
+    except (TypeError, ValueError, KeyError, IndexError) as error:
+        raise ValueError("Malformed snapshot data") from error
+    return tubemap
+
+
+def save_snapshot(tubemap, digest, snapshot_file):
+    """ Saves a tube map as a snapshot.
+
+    The snapshot holds the plain data of snapshot_data(), written with
+    marshal: unlike unpickling, loading it never runs code, and the tube map
+    objects are rebuilt from the data. The neighbour graph is not saved:
+    NeighbourGraphBuilder makes a single pass over the rebuilt connections,
+    which is faster than rebuilding the graph's dictionaries from stored
+    adjacency arrays, as these also have to be loaded and walked. The
+    file is written under a temporary name and renamed, so other processes
+    never read half a snapshot.
+
+    Args:
+        tubemap (TubeMap) : the imported tube map.
+        digest (str) : digest of the JSON file tubemap was imported from.
+        snapshot_file (str) : path to the snapshot file.
+    """
+    temporary_file = f"{snapshot_file}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_file, "wb") as snapshot:
+            # The header is written separately, so staleness is checked without loading the rest.
+            marshal.dump((SNAPSHOT_VERSION, digest), snapshot)
+            marshal.dump(snapshot_data(tubemap), snapshot)
+        os.replace(temporary_file, snapshot_file)
+    except BaseException:
+        # Do not leave half-written snapshots behind.
+        try:
+            os.remove(temporary_file)
+        except OSError:
+            pass
+        raise
+
+
+def load_snapshot(digest, snapshot_file):
+    """ Loads a snapshot if it was made from the expected JSON content.
+
+    Args:
+        digest (str) : digest of the current JSON file.
+        snapshot_file (str) : path to the snapshot file.
+
+    Returns:
+        tuple[TubeMap, dict] : the tube map and its neighbour graph, or None
+            if the snapshot is missing, unreadable, malformed or stale.
+    """
+    try:
+        with open(snapshot_file, "rb") as snapshot:
+            if(marshal.load(snapshot) != (SNAPSHOT_VERSION, digest)):
+                return None
+            # Loading from bytes is much faster than marshal.load, which reads the file piecemeal.
+            tubemap = tubemap_from_data(marshal.loads(snapshot.read()))
+        return tubemap, NeighbourGraphBuilder().build(tubemap)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def load_tubemap(filepath, snapshot_file=None):
+    """ Loads a tube map and its neighbour graph, from a snapshot when possible.
+
+    The tube map is read from the snapshot and its neighbour graph built with
+    NeighbourGraphBuilder. The snapshot is keyed by the SHA-256 digest of the
+    JSON file, so it is rebuilt (from the JSON import and NeighbourGraphBuilder)
+    whenever the JSON file changes. Failing to write the snapshot is not an error.
+
+    Args:
+        filepath (str) : path to the JSON file containing the tube map.
+        snapshot_file (str) : path to the snapshot file. Defaults to the JSON path with ".snapshot" added.
+
+    Returns:
+        tuple[TubeMap, dict] : the tube map and its neighbour graph. If
+            filepath is invalid, the tube map is empty, as with import_from_json.
+    """
+    if(snapshot_file is None):
+        snapshot_file = snapshot_path(filepath)
+    try:
+        digest = json_digest(filepath)
+    except OSError:
+        digest = None
+    if(digest is not None):
+        loaded = load_snapshot(digest, snapshot_file)
+        if(loaded is not None):
+            return loaded
+
+    tubemap = TubeMap()
+    tubemap.import_from_json(filepath)
+    graph = NeighbourGraphBuilder().build(tubemap)
+    if(digest is not None):
+        try:
+            save_snapshot(tubemap, digest, snapshot_file)
+        except OSError:
+            pass
+    return tubemap, graph
+
+
+def test_snapshot():
+    import shutil
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, "london.json")
+        shutil.copy("data/london.json", filepath)
+
+        start = time.perf_counter()
+        tubemap, graph = load_tubemap(filepath)
+        import_time = time.perf_counter() - start
+        start = time.perf_counter()
+        cached_tubemap, cached_graph = load_tubemap(filepath)
+        snapshot_time = time.perf_counter() - start
+        print(f"JSON import: {import_time * 1000:.1f} ms, snapshot: {snapshot_time * 1000:.1f} ms")
+
+        assert list(cached_tubemap.stations) == list(tubemap.stations)
+        assert list(cached_graph) == list(graph)
+        assert len(cached_tubemap.connections) == len(tubemap.connections)
+        assert cached_tubemap.station_coordinates == tubemap.station_coordinates
+        assert cached_tubemap.station_id_from_name("earls court") == tubemap.station_id_from_name("Earl's Court")
+
+        def describe(neighbours):
+            return {neighbour_id: sorted((connection.line.id, connection.time) for connection in connections)
+                    for neighbour_id, connections in neighbours.items()}
+        assert all(describe(cached_graph[station_id]) == describe(graph[station_id]) for station_id in graph)
+        # Connections in the graph are the same objects as in the tube map.
+        assert cached_graph["110"]["17"][0] in cached_tubemap.connections
+
+        # Changing the JSON file invalidates the snapshot.
+        with open(filepath, "a") as jsonfile:
+            jsonfile.write("\n")
+        assert load_snapshot(json_digest(filepath), snapshot_path(filepath)) is None
+        tubemap, graph = load_tubemap(filepath)
+        assert load_snapshot(json_digest(filepath), snapshot_path(filepath)) is not None
+
+        # Malformed snapshots are rebuilt, and failed saves leave no temporary file.
+        with open(snapshot_path(filepath), "wb") as snapshot:
+            marshal.dump((SNAPSHOT_VERSION, json_digest(filepath)), snapshot)
+            marshal.dump(("not", "a", "tube map"), snapshot)
+        assert load_snapshot(json_digest(filepath), snapshot_path(filepath)) is None
+        try:
+            save_snapshot(None, json_digest(filepath), snapshot_path(filepath))
+        except AttributeError:
+            pass
+        assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
+
+        # Stations without coordinates are kept, and the snapshot is still used.
+        import json
+        with open("data/london.json") as jsonfile:
+            map_data = json.load(jsonfile)
+        del map_data["stations"][0]["latitude"], map_data["stations"][0]["longitude"]
+        filepath = os.path.join(directory, "partial.json")
+        with open(filepath, "w") as jsonfile:
+            json.dump(map_data, jsonfile)
+        tubemap, graph = load_tubemap(filepath)
+        snapshot_time = os.stat(snapshot_path(filepath)).st_mtime_ns
+        assert load_snapshot(json_digest(filepath), snapshot_path(filepath)) is not None
+        cached_tubemap, cached_graph = load_tubemap(filepath)
+        assert os.stat(snapshot_path(filepath)).st_mtime_ns == snapshot_time
+        assert cached_tubemap.station_coordinates == tubemap.station_coordinates
+        assert map_data["stations"][0]["id"] not in cached_tubemap.station_coordinates
+
+
+if __name__ == "__main__":
+    test_snapshot()